@@ -179,6 +179,38 @@ def task_pull_fred():
 #     }
 
 
+## The WRDS pulls run as Python actions rather than `ipython` subprocesses so
+## that they all share the one WRDS session of the `doit` process and log in
+## only once per run.
+# def task_pull_wrds():
+#     """ """
+#     import pull_CRSP_Compustat
+#     import pull_CRSP_stock
+#     import pull_CRSP_daily
+#
+#     return {
+#         "actions": [
+#             (pull_CRSP_Compustat.pull_all, [], {"data_dir": DATA_DIR}),
+#             (pull_CRSP_stock.pull_all, [], {"data_dir": DATA_DIR}),
+#             (pull_CRSP_daily.pull_all, [], {"data_dir": DATA_DIR}),
+#         ],
+#         "targets": [
+#             Path(DATA_DIR) / "CRSP_Comp_Link_Table.parquet",
+#             Path(DATA_DIR) / "FF_FACTORS.parquet",
+#             Path(DATA_DIR) / "CRSP_MSF_INDEX_INPUTS.parquet",
+#             Path(DATA_DIR) / "CRSP_MSIX.parquet",
+#             Path(DATA_DIR) / "CRSP_daily_to_monthly.parquet",
+#         ],
+#         "file_dep": [
+#             "./src/wrds_tools.py",
+#             "./src/pull_CRSP_Compustat.py",
+#             "./src/pull_CRSP_stock.py",
+#             "./src/pull_CRSP_daily.py",
+#         ],
+#         "clean": [],  # Don't clean these files by default.
+#     }
+
+
 def task_summary_stats():
     """ """
     file_dep = ["./src/example_table.py"]
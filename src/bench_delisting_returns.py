@@ -0,0 +1,87 @@
+"""
+Benchmark the delisting-return adjustment of the monthly CRSP file:
+the previous implementation, with one `np.select` pass per return column,
+against the fused `pull_CRSP_stock.apply_delisting_returns` and the polars
+`pull_CRSP_stock.apply_delisting_returns_polars` (eager and lazy).
+
+The input is the synthetic monthly file of `bench_wrds_dtypes.make_raw_msf`,
+with the column types `raw_sql` returns. Each method's result is checked
+against the fused one before it is timed. Run as
+```
+python bench_delisting_returns.py --N_ROWS=5000000
+```
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+import bench_wrds_dtypes
+import pull_CRSP_stock
+from settings import config
+
+N_ROWS = config("N_ROWS", default=5_000_000, cast=int)
+
+
+def apply_delisting_returns_two_pass(df):
+    """
+    The previous implementation, one `np.select` per column, with the
+    `dlstcd >= 200` condition parenthesized so that it gives the same result.
+    """
+    for col in ["dlret", "dlretx"]:
+        df[col] = np.select(
+            [
+                df["dlstcd"].isin([500, 520, 580, 584] + list(range(551, 575)))
+                & df[col].isna(),
+                df[col].isna() & df["dlstcd"].notna() & (df["dlstcd"] >= 200),
+                True,
+            ],
+            [-0.3, -1, df[col]],
+            default=df[col],
+        )
+    df["ret"] = df["ret"].fillna(df["dlret"])
+    df["retx"] = df["retx"].fillna(df["dlretx"])
+    return df
+
+
+def _time(func, make_input, n_repeats):
+    seconds = []
+    for _ in range(n_repeats):
+        data = make_input()
+        start = time.perf_counter()
+        result = func(data)
+        seconds.append(time.perf_counter() - start)
+    return np.median(seconds), result
+
+
+def run_benchmark(n_rows=N_ROWS, n_repeats=3):
+    columns = ["dlstcd", "dlret", "dlretx", "ret", "retx"]
+    raw = bench_wrds_dtypes.make_raw_msf(n_rows)[columns]
+    raw_pl = pl.from_pandas(raw)
+    methods = {
+        "two_pass": (apply_delisting_returns_two_pass, raw.copy),
+        "fused": (pull_CRSP_stock.apply_delisting_returns, raw.copy),
+        "polars": (pull_CRSP_stock.apply_delisting_returns_polars, lambda: raw_pl),
+        "polars_lazy": (
+            lambda lf: pull_CRSP_stock.apply_delisting_returns_polars(lf).collect(),
+            raw_pl.lazy,
+        ),
+    }
+    expected = pull_CRSP_stock.apply_delisting_returns(raw.copy())
+    rows = []
+    for method, (func, make_input) in methods.items():
+        seconds, result = _time(func, make_input, n_repeats)
+        if isinstance(result, pl.DataFrame):
+            result = result.to_pandas()
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        rows.append({"method": method, "seconds": seconds})
+    df = pd.DataFrame(rows).set_index("method")
+    df["speedup"] = df.loc["two_pass", "seconds"] / df["seconds"]
+    return df
+
+
+if __name__ == "__main__":
+    print(f"{N_ROWS:,} rows")
+    print(run_benchmark().round(3).to_string())
@@ -0,0 +1,92 @@
+"""
+Benchmark parsing feds200628.csv into parquet: the pandas parser used by
+`load_fed_yield_curve.pull_fed_yield_curve` versus the streaming pyarrow parser
+in `load_fed_yield_curve.write_fed_yield_curve_parquet`.
+
+Each method runs in a fresh process, so its peak resident memory (ru_maxrss)
+is measured on its own. The "baseline" row is a process that only imports the
+libraries; subtract it to get the memory used by the parse itself.
+
+By default, a synthetic file with the layout and size of the real one is
+generated. To use a downloaded copy instead, run
+```
+python bench_load_fed_yield_curve.py --FED_CSV_PATH=/path/to/feds200628.csv
+```
+ru_maxrss is not available on Windows.
+"""
+
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import load_fed_yield_curve
+from settings import config
+
+FED_CSV_PATH = config("FED_CSV_PATH", default="", cast=str)
+
+
+def make_synthetic_csv(path, start="1961-06-14", end="2024-12-31"):
+    """Write a file laid out like feds200628.csv (9 note lines, header, rows)."""
+    dates = pd.bdate_range(start, end, name="Date")
+    columns = ["BETA0", "BETA1", "BETA2", "BETA3", "SVEN1F01", "SVEN1F04", "SVEN1F09"]
+    for prefix in ["SVENF", "SVENPY", "SVENY"]:
+        columns += [prefix + str(i).zfill(2) for i in range(1, 31)]
+    columns += ["TAU1", "TAU2"]
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        rng.uniform(0, 10, size=(len(dates), len(columns))),
+        index=dates,
+        columns=columns,
+    )
+    preamble = "".join(f"Note line {i}\n" for i in range(1, 10))
+    with open(path, "w") as f:
+        f.write(preamble)
+        df.to_csv(f, float_format="%.6f", date_format="%Y-%m-%d")
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _run(method, csv_path, out_path):
+    start = time.perf_counter()
+    if method == "pandas":
+        content = Path(csv_path).read_bytes()
+        df = load_fed_yield_curve.parse_fed_yield_curve(content)
+        df.to_parquet(out_path)
+    elif method == "pyarrow":
+        load_fed_yield_curve.write_fed_yield_curve_parquet(csv_path, out_path)
+    elapsed = time.perf_counter() - start
+    return elapsed, _peak_rss_mb()
+
+
+def run_benchmark(csv_path, n_repeats=3):
+    out_dir = Path(tempfile.mkdtemp())
+    rows = []
+    for method in ["baseline", "pandas", "pyarrow"]:
+        for i in range(n_repeats):
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                out_path = out_dir / f"{method}_{i}.parquet"
+                seconds, peak_mb = pool.submit(_run, method, csv_path, out_path).result()
+            rows.append({"method": method, "seconds": seconds, "peak_rss_mb": peak_mb})
+    df = pd.DataFrame(rows).groupby("method", sort=False).median()
+    return df
+
+
+if __name__ == "__main__":
+    if FED_CSV_PATH:
+        csv_path = Path(FED_CSV_PATH)
+    else:
+        csv_path = Path(tempfile.mkdtemp()) / "feds200628.csv"
+        make_synthetic_csv(csv_path)
+    print(f"File: {csv_path} ({csv_path.stat().st_size / 2**20:.1f} MB)")
+    print(run_benchmark(csv_path).round(3).to_string())
@@ -0,0 +1,138 @@
+"""
+Report the memory and parquet savings of the declared dtypes applied at
+ingest to the CRSP and Compustat pulls (`dtypes_crsp_stock_ciz` and
+`dtypes_compustat` in `pull_CRSP_Compustat.py`, `dtypes_msf` in
+`pull_CRSP_stock.py`).
+
+Each table is generated synthetically, with the column types `raw_sql`
+returns (object strings, float64 codes, int64 ids) and roughly the
+cardinalities of the real data. The declared dtypes are then applied and
+`wrds_tools.dtype_report` compares the two. Run as
+```
+python bench_wrds_dtypes.py --N_ROWS=3000000
+python bench_wrds_dtypes.py --N_ROWS=3000000 --FLOAT32_RETURNS=True
+```
+"""
+
+import numpy as np
+import pandas as pd
+
+import pull_CRSP_Compustat
+import pull_CRSP_stock
+import wrds_tools
+from settings import config
+
+N_ROWS = config("N_ROWS", default=1_000_000, cast=int)
+
+
+def _codes(rng, choices, n, p_missing=0.0):
+    values = rng.choice(np.array(choices, dtype=object), size=n)
+    values[rng.random(n) < p_missing] = None
+    return values
+
+
+def _float_codes(rng, choices, n, p_missing=0.0):
+    values = rng.choice(np.array(choices, dtype=float), size=n)
+    values[rng.random(n) < p_missing] = np.nan
+    return values
+
+
+def make_raw_crsp_stock_ciz(n=N_ROWS, seed=0):
+    rng = np.random.default_rng(seed)
+    permno = rng.integers(10000, 95000, size=n)
+    return pd.DataFrame(
+        {
+            "permno": permno,
+            "permco": permno // 2,
+            "mthcaldt": pd.to_datetime("1960-01-31")
+            + pd.to_timedelta(rng.integers(0, 23000, size=n), unit="D"),
+            "issuertype": _codes(rng, ["CORP", "ACOR", "REIT", "FUND"], n),
+            "securitytype": _codes(rng, ["EQTY", "FUND"], n),
+            "securitysubtype": _codes(rng, ["COM", "ETF", "CEF", "UIT"], n),
+            "sharetype": _codes(rng, ["NS", "AD", "SB", "UG"], n),
+            "usincflg": _codes(rng, ["Y", "N"], n),
+            "primaryexch": _codes(rng, ["N", "A", "Q", "X"], n),
+            "conditionaltype": _codes(rng, ["RW", "NW", "UNKN"], n),
+            "tradingstatusflg": _codes(rng, ["A", "H", "S", "X"], n),
+            "mthret": rng.normal(0.01, 0.1, size=n),
+            "mthretx": rng.normal(0.01, 0.1, size=n),
+            "shrout": rng.lognormal(9, 2, size=n),
+            "mthprc": rng.lognormal(3, 1, size=n),
+            "cfacshr": np.ones(n),
+            "cfacpr": np.ones(n),
+        }
+    )
+
+
+def make_raw_compustat(n=N_ROWS // 10, seed=0):
+    rng = np.random.default_rng(seed)
+    gvkeys = np.array([f"{i:06d}" for i in range(1000, 41000)], dtype=object)
+    df = pd.DataFrame(
+        {
+            "gvkey": rng.choice(gvkeys, size=n),
+            "datadate": pd.to_datetime("1960-12-31")
+            + pd.to_timedelta(rng.integers(0, 23000, size=n), unit="D"),
+            "sich": _float_codes(rng, range(100, 9999), n, p_missing=0.3),
+        }
+    )
+    for col in ["at", "sale", "cogs", "xsga", "xint", "pstkl", "txditc"]:
+        df[col] = rng.lognormal(5, 2, size=n)
+    return df
+
+
+def make_raw_msf(n=N_ROWS, seed=0):
+    rng = np.random.default_rng(seed)
+    permno = rng.integers(10000, 95000, size=n)
+    names = np.array([f"COMPANY {i} INC" for i in range(30000)], dtype=object)
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime("1960-01-31")
+            + pd.to_timedelta(rng.integers(0, 23000, size=n), unit="D"),
+            "permno": permno.astype(float),
+            "permco": (permno // 2).astype(float),
+            "shrcd": _float_codes(rng, [10, 11, 20, 21, 40, 41, 70, 71, 73], n),
+            "exchcd": _float_codes(rng, [1, 2, 3, 4], n),
+            "comnam": rng.choice(names, size=n),
+            "shrcls": _codes(rng, ["A", "B"], n, p_missing=0.9),
+            "ret": rng.normal(0.01, 0.1, size=n),
+            "retx": rng.normal(0.01, 0.1, size=n),
+            "dlret": _float_codes(rng, [-0.3, -1.0], n, p_missing=0.99),
+            "dlretx": _float_codes(rng, [-0.3, -1.0], n, p_missing=0.99),
+            "dlstcd": _float_codes(rng, [100, 231, 500, 552], n, p_missing=0.99),
+            "prc": rng.lognormal(3, 1, size=n),
+            "naics": _codes(rng, [str(c) for c in range(111110, 111510)], n, 0.4),
+            "siccd": _float_codes(rng, range(100, 9999), n),
+        }
+    )
+
+
+def run_report(n_rows=N_ROWS):
+    float32 = pull_CRSP_Compustat.FLOAT32_RETURNS
+    tables = {
+        "CRSP_stock_ciz": (
+            make_raw_crsp_stock_ciz(n_rows),
+            pull_CRSP_Compustat.dtypes_crsp_stock_ciz,
+            pull_CRSP_Compustat.returns_crsp_stock_ciz if float32 else [],
+        ),
+        "Compustat": (
+            make_raw_compustat(n_rows // 10),
+            pull_CRSP_Compustat.dtypes_compustat,
+            [],
+        ),
+        "CRSP_MSF_INDEX_INPUTS": (
+            make_raw_msf(n_rows),
+            pull_CRSP_stock.dtypes_msf,
+            pull_CRSP_stock.returns_msf if float32 else [],
+        ),
+    }
+    reports = {}
+    for name, (raw, dtypes, float32_columns) in tables.items():
+        compact = wrds_tools.apply_dtypes(raw, dtypes, float32_columns)
+        reports[name] = wrds_tools.dtype_report(raw, compact)
+    return reports
+
+
+if __name__ == "__main__":
+    for name, report in run_report().items():
+        print(f"\n{name} ({N_ROWS:,} rows for CRSP, a tenth for Compustat), MB")
+        print(report.round(3).to_string())
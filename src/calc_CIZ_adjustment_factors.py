@@ -0,0 +1,190 @@
+"""
+Rebuild the cumulative price and share adjustment factors (`cfacpr`,
+`cfacshr`) of the legacy CRSP format from the distribution events of the CIZ
+format, and report how well they match the legacy ones.
+
+ - CIZ transition FAQ: https://wrds-www.wharton.upenn.edu/pages/support/manuals-and-overviews/crsp/stocks-and-indices/crsp-stock-and-indexes-version-2/crsp-ciz-faq/
+ - Distributions: https://wrds-www.wharton.upenn.edu/data-dictionary/crsp_a_stock/stkdistributions/
+
+As the docstring of `pull_CRSP_Compustat.pull_CRSP_stock_ciz` notes, the CIZ
+format does not reliably provide `cfacpr` and `cfacshr`. WRDS's suggested
+replacement rebuilds them from the per-event factors `disfacpr` and
+`disfacshr` of `crsp.stkdistributions`: the cumulative factor of a security
+on a date is the product of (1 + factor) over all its events with an
+ex-date after that date, so that it is 1 after the last event and, e.g.,
+doubles before each 2-for-1 split. Then, as with the legacy factors,
+```
+adj_prc = prc / cfacpr
+adj_shrout = shrout * cfacshr
+```
+
+`calc_cumulative_factors` does this for a whole panel at once. The events are
+sorted by (permno, ex-date), and the products over each permno's later events
+are taken as a reverse cumulative sum of log(1 + factor) that restarts at
+each permno. Each observation is then matched to the first event after it
+with a single `np.searchsorted` over a combined (permno, date) key.
+"""
+
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import misc_tools
+import pull_CRSP_stock
+import wrds_tools
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+WRDS_USERNAME = config("WRDS_USERNAME")
+# Path of a synthetic database from fake_wrds.py to pull from instead of
+# WRDS, for development. Empty to use WRDS.
+FAKE_WRDS = config("FAKE_WRDS", default="", cast=str)
+
+# Relative tolerance for a rebuilt factor to count as matching the legacy one
+MATCH_RTOL = 1e-4
+
+dtypes_distributions = {
+    "permno": "int32",
+    "distype": "category",
+}
+
+
+def pull_CIZ_distributions(wrds_username=WRDS_USERNAME, db=None):
+    """
+    Pull the distribution events of the CIZ format that change the price or
+    share adjustment factors. Ordinary cash dividends (factors of zero) are
+    left out.
+    """
+    sql_query = """
+        SELECT
+            permno, disseqnbr, distype, disexdt, disfacpr, disfacshr
+        FROM
+            crsp.stkdistributions
+        WHERE
+            disexdt IS NOT NULL AND
+            (disfacpr <> 0 OR disfacshr <> 0)
+        """
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
+    events = db.raw_sql(sql_query, date_cols=["disexdt"])
+    events = wrds_tools.apply_dtypes(events, dtypes_distributions)
+    return events
+
+
+def load_CIZ_distributions(data_dir=DATA_DIR):
+    path = Path(data_dir) / "CIZ_distributions.parquet"
+    return pd.read_parquet(path)
+
+
+def reverse_cumulative_factors(events, factor_col):
+    """
+    For each event, the product of (1 + `factor_col`) over it and the later
+    events of the same permno, with `events` sorted by (permno, disexdt).
+
+    Factors of -1 or less (a liquidation, for instance) would zero out or
+    flip the sign of all earlier adjustments; they are treated as no
+    adjustment.
+    """
+    permno = events["permno"].to_numpy()
+    growth = 1 + events[factor_col].to_numpy(dtype="float64", na_value=0.0)
+    log_growth = np.log(np.where(growth > 0, growth, 1.0))
+
+    # Sum from the end of the array, less the sum past the end of the permno
+    suffix_sums = np.cumsum(log_growth[::-1])[::-1]
+    is_last = np.append(permno[1:] != permno[:-1], True)
+    last = np.flatnonzero(is_last)
+    # Index of the last event of each event's permno
+    last_of = last[np.searchsorted(last, np.arange(len(permno)))]
+    after_last = np.append(suffix_sums, 0.0)[last_of + 1]
+    return np.exp(suffix_sums - after_last)
+
+
+def calc_cumulative_factors(events, df, date_col="date"):
+    """
+    The rebuilt cumulative price and share adjustment factors of each
+    (permno, `date_col`) row of `df`, as a frame with columns `cfacpr_ciz`
+    and `cfacshr_ciz` aligned with `df`. A row with no later event of its
+    permno gets 1.
+    """
+    events = events.sort_values(["permno", "disexdt"], ignore_index=True)
+    event_keys = misc_tools.panel_keys(
+        events["permno"], misc_tools.day_numbers(events["disexdt"])
+    )
+    row_permno = df["permno"].to_numpy(dtype="int64")
+    row_keys = misc_tools.panel_keys(row_permno, misc_tools.day_numbers(df[date_col]))
+
+    # The first event with an ex-date strictly after the row's date: an event
+    # that goes ex on the row's date is already reflected in its price
+    position = np.searchsorted(event_keys, row_keys, side="right")
+    in_range = position < len(events)
+    position = np.where(in_range, position, 0)
+    has_later = in_range & (
+        events["permno"].to_numpy(dtype="int64")[position] == row_permno
+    )
+
+    factors = pd.DataFrame(index=df.index)
+    for factor_col, name in [("disfacpr", "cfacpr_ciz"), ("disfacshr", "cfacshr_ciz")]:
+        cumulative = reverse_cumulative_factors(events, factor_col)
+        factors[name] = np.where(has_later, cumulative[position], 1.0)
+    return factors
+
+
+def match_report(df, rtol=MATCH_RTOL):
+    """
+    For each of `cfacpr` and `cfacshr`, the number of rows of `df` where both
+    the legacy and the rebuilt (`_ciz`) factor exist, and the share of those
+    where they agree to within `rtol`, overall and by decade.
+    """
+    decade = pd.DatetimeIndex(df["date"]).year // 10 * 10
+    reports = []
+    for legacy in ["cfacpr", "cfacshr"]:
+        both = df[legacy].notna() & df[f"{legacy}_ciz"].notna()
+        matches = np.isclose(df[f"{legacy}_ciz"], df[legacy], rtol=rtol, atol=0)
+        frame = pd.DataFrame(
+            {"factor": legacy, "decade": decade, "both": both, "match": matches}
+        )
+        frame = frame[frame["both"]]
+        by_decade = frame.groupby("decade")["match"].agg(["size", "mean"])
+        total = pd.DataFrame(
+            {"size": [len(frame)], "mean": [frame["match"].mean()]}, index=["all"]
+        )
+        report = pd.concat([total, by_decade.rename(index=str)])
+        report.index = pd.MultiIndex.from_product([[legacy], report.index])
+        reports.append(report)
+    report = pd.concat(reports)
+    report.columns = ["n_compared", "match_rate"]
+    report.index.names = ["factor", "decade"]
+    return report
+
+
+def _demo():
+    events = load_CIZ_distributions(data_dir=DATA_DIR)
+    msf = pull_CRSP_stock.load_CRSP_monthly_file(
+        data_dir=DATA_DIR, columns=["permno", "date", "cfacpr", "cfacshr"]
+    )
+    msf = msf.join(calc_cumulative_factors(events, msf))
+    print(match_report(msf).round(4).to_string())
+
+
+def pull_all(data_dir=DATA_DIR, wrds_username=WRDS_USERNAME, db=None):
+    """
+    Pull and save the distribution events over a single WRDS session.
+    """
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
+    events = pull_CIZ_distributions(db=db)
+    events.to_parquet(Path(data_dir) / "CIZ_distributions.parquet")
+
+
+if __name__ == "__main__":
+    source = nullcontext()
+    if FAKE_WRDS:
+        # fake_wrds (and DuckDB) are for development only
+        import fake_wrds
+
+        source = fake_wrds.fake_wrds(FAKE_WRDS)
+    with source, wrds_tools.WRDSSession(WRDS_USERNAME) as db:
+        pull_all(data_dir=DATA_DIR, db=db)
+    _demo()
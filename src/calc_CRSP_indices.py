@@ -0,0 +1,221 @@
+"""
+Replicate the CRSP monthly market and capitalization-decile indices
+(`crsp_a_indexes.msix`) from the monthly stock file, and report how closely
+they track the official ones.
+
+ - Methodology: https://wrds-www.wharton.upenn.edu/documents/396/CRSP_US_Stock_Indices_Data_Descriptions.pdf
+ - Why we can't perfectly replicate them: https://wrds-www.wharton.upenn.edu/pages/support/support-articles/crsp/index-and-deciles/constructing-value-weighted-return-series-matches-vwretd-crsp-monthly-value-weighted-returns-includes-distributions/
+
+The universe is the issues in `load_CRSP_monthly_file` (common shares, see
+`pull_CRSP_stock.pull_CRSP_monthly_file`) listed on the NYSE, AMEX, or
+NASDAQ. Each month,
+
+ - `vwretd` (`vwretx`) is the average of the returns with (without)
+   dividends, weighted by the market cap at the end of the previous month,
+ - `ewretd` (`ewretx`) is their equal-weighted average, and
+ - `decret1`, ..., `decret10` are the value-weighted returns of the
+   capitalization deciles. As in CRSP's annually rebalanced deciles, issues
+   are ranked on their market cap at the end of each December and keep that
+   decile for the following calendar year.
+
+The whole panel is processed at once: the panel is sorted by (permno, date)
+so that last month's market cap is the previous row of the same permno, and
+the monthly sums are taken with `np.bincount` over integer month (or
+month-decile) codes, rather than looping over months. The decile
+breakpoints of all the years, including NYSE-only breakpoints, come from one
+sort as well (see `portfolio_sorts`).
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import misc_tools
+import portfolio_sorts
+import pull_CRSP_stock
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+
+# NYSE, AMEX, and NASDAQ
+EXCHCDS = [1, 2, 3]
+N_DECILES = 10
+
+
+def lagged_market_cap(msf):
+    """
+    The market cap of the same permno at the end of the previous month, or
+    NaN if there is no row for it, aligned with the rows of `msf`.
+    """
+    permno = msf["permno"].to_numpy()
+    month = misc_tools.month_codes(msf["date"])
+    market_cap = msf["market_cap"].to_numpy(dtype="float64", na_value=np.nan)
+    order = np.lexsort((month, permno))
+    permno, month, market_cap = permno[order], month[order], market_cap[order]
+
+    lag = np.full(len(order), np.nan)
+    follows = (permno[1:] == permno[:-1]) & (month[1:] == month[:-1] + 1)
+    lag[1:] = np.where(follows, market_cap[:-1], np.nan)
+
+    out = np.empty_like(lag)
+    out[order] = lag
+    return out
+
+
+def _month_groups(dates):
+    """
+    Dense integer codes of the months of `dates`, 0 for the first, and the
+    last date of each.
+    """
+    months, codes = np.unique(misc_tools.month_codes(dates), return_inverse=True)
+    caldt = np.full(len(months), np.iinfo("int64").min)
+    np.maximum.at(caldt, codes, np.asarray(dates, dtype="datetime64[ns]").view("int64"))
+    return codes, caldt.view("datetime64[ns]")
+
+
+def _weighted_means(codes, n_groups, values, weights):
+    """
+    sum(weights * values) / sum(weights) per group of `codes`, over the rows
+    where both are available. Also returns the number of such rows.
+    """
+    valid = ~np.isnan(values) & ~np.isnan(weights)
+    codes, values, weights = codes[valid], values[valid], weights[valid]
+    numerator = np.bincount(codes, weights=weights * values, minlength=n_groups)
+    denominator = np.bincount(codes, weights=weights, minlength=n_groups)
+    count = np.bincount(codes, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return numerator / denominator, count
+
+
+def assign_cap_deciles(msf, breakpoint_exchcds=None):
+    """
+    The capitalization decile (1 for the smallest to 10) of each row of
+    `msf`, from the rank of the permno's market cap at the end of December
+    of the previous year; 0 if it had none.
+
+    With `breakpoint_exchcds`, e.g., `[1]` for NYSE breakpoints, the decile
+    breakpoints are the market cap deciles of the issues on those exchanges
+    only, computed for all the years at once by
+    `portfolio_sorts.assign_portfolios`; years without any such issues get
+    0. By default, each decile holds a tenth of all the issues ranked.
+    """
+    date = pd.DatetimeIndex(msf["date"])
+    permno = msf["permno"].to_numpy(dtype="int64")
+    market_cap = msf["market_cap"].to_numpy(dtype="float64", na_value=np.nan)
+    is_december = (date.month == 12) & (market_cap > 0)
+
+    # Rank the December caps within each year
+    year = date.year.to_numpy()[is_december]
+    cap = market_cap[is_december]
+    deciles = np.zeros(len(cap), dtype="int8")
+    if breakpoint_exchcds is None:
+        order = np.lexsort((cap, year))
+        first = np.searchsorted(year[order], year[order], side="left")
+        n = np.searchsorted(year[order], year[order], side="right") - first
+        rank = np.arange(len(order)) - first
+        deciles[order] = rank * N_DECILES // n + 1
+    else:
+        exchcd = msf["exchcd"].to_numpy(dtype="float64", na_value=np.nan)
+        is_breakpoint = np.isin(exchcd[is_december], breakpoint_exchcds)
+        # The breakpoints of all the years from a single sort
+        deciles = portfolio_sorts.assign_portfolios(
+            pd.DataFrame({"year": year, "cap": cap}),
+            "cap",
+            bins=N_DECILES,
+            date_col="year",
+            breakpoint_mask=is_breakpoint,
+        ).to_numpy(dtype="int8")
+
+    # Look up each row's decile from the December before, by (permno, year)
+    if not is_december.any():
+        return np.zeros(len(msf), dtype="int8")
+    keys = misc_tools.panel_keys(permno[is_december], year)
+    order = np.argsort(keys)
+    keys, deciles = keys[order], deciles[order]
+    row_keys = misc_tools.panel_keys(permno, date.year.to_numpy() - 1)
+    position = np.searchsorted(keys, row_keys).clip(max=len(keys) - 1)
+    return np.where(keys[position] == row_keys, deciles[position], 0).astype("int8")
+
+
+def calc_CRSP_indices(msf, breakpoint_exchcds=None):
+    """
+    Monthly `vwretd`, `vwretx`, `ewretd`, `ewretx`, and `decret1` to
+    `decret10` from the monthly stock file, with `totcnt` the number of
+    issues in the equal-weighted index. One row per month (`caldt`, the last
+    trading date of the month) from the second month of `msf` on, since the
+    first serves only for the lagged market caps.
+    """
+    msf = msf[msf["exchcd"].isin(EXCHCDS)]
+    lag_cap = lagged_market_cap(msf)
+    decile = assign_cap_deciles(msf, breakpoint_exchcds)
+    codes, caldt = _month_groups(msf["date"])
+    n_months = len(caldt)
+
+    indices = pd.DataFrame({"caldt": caldt})
+    ones = np.ones(len(msf))
+    for suffix, col in [("d", "ret"), ("x", "retx")]:
+        ret = msf[col].to_numpy(dtype="float64", na_value=np.nan)
+        indices[f"vwret{suffix}"], _ = _weighted_means(codes, n_months, ret, lag_cap)
+        indices[f"ewret{suffix}"], count = _weighted_means(codes, n_months, ret, ones)
+        if suffix == "d":
+            indices["totcnt"] = count
+
+    ret = msf["ret"].to_numpy(dtype="float64", na_value=np.nan)
+    in_decile = decile > 0
+    decile_codes = codes[in_decile] * N_DECILES + decile[in_decile] - 1
+    decret, _ = _weighted_means(
+        decile_codes, n_months * N_DECILES, ret[in_decile], lag_cap[in_decile]
+    )
+    decret = decret.reshape(n_months, N_DECILES)
+    for d in range(N_DECILES):
+        indices[f"decret{d + 1}"] = decret[:, d]
+
+    return indices.iloc[1:].reset_index(drop=True)
+
+
+def tracking_error_report(indices, msix):
+    """
+    Compare each return series of `indices` (from `calc_CRSP_indices`) with
+    the same column of `msix` (from `load_CRSP_index_files`), matching months.
+    For each series, reports the number of months compared, the correlation,
+    the mean difference (ours less CRSP's), and the tracking error, the
+    standard deviation of the difference, monthly and annualized.
+    """
+    ours = indices.set_index(pd.PeriodIndex(indices["caldt"], freq="M"))
+    theirs = msix.set_index(pd.PeriodIndex(msix["caldt"], freq="M"))
+    columns = [
+        col
+        for col in ["vwretd", "vwretx", "ewretd", "ewretx"]
+        + [f"decret{d}" for d in range(1, N_DECILES + 1)]
+        if col in ours.columns and col in theirs.columns
+    ]
+    ours, theirs = ours[columns].align(theirs[columns], join="inner")
+    diff = (ours - theirs).astype(float)
+    report = pd.DataFrame(
+        {
+            "n_months": diff.notna().sum(),
+            "corr": ours.astype(float).corrwith(theirs.astype(float)),
+            "mean_diff": diff.mean(),
+            "tracking_error": diff.std(),
+            "tracking_error_annual": diff.std() * np.sqrt(12),
+        }
+    )
+    return report
+
+
+def load_CRSP_indices(data_dir=DATA_DIR):
+    path = Path(data_dir) / "CRSP_indices.parquet"
+    return pd.read_parquet(path)
+
+
+if __name__ == "__main__":
+    msf = pull_CRSP_stock.load_CRSP_monthly_file(
+        data_dir=DATA_DIR,
+        columns=["date", "permno", "exchcd", "ret", "retx", "market_cap"],
+    )
+    indices = calc_CRSP_indices(msf)
+    indices.to_parquet(DATA_DIR / "CRSP_indices.parquet")
+
+    msix = pull_CRSP_stock.load_CRSP_index_files(data_dir=DATA_DIR)
+    print(tracking_error_report(indices, msix).round(4).to_string())
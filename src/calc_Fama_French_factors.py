@@ -0,0 +1,330 @@
+"""
+Construct book equity, the June-rebalanced size and book-to-market
+portfolios, and the monthly SMB and HML factors of Fama and French (1993)
+from the data pulled by `pull_CRSP_Compustat.py`, and compare them with the
+published factors (`load_Fama_French_factors`).
+
+This follows the WRDS replication of the Fama-French factors
+(https://wrds-www.wharton.upenn.edu/pages/wrds-research/applications/python-replications/fama-french-factors-python/),
+adapted to the CIZ format:
+
+ - Book equity (BE) is stockholders' equity plus deferred taxes, less
+   preferred stock (redemption, else liquidating, else par value); only
+   positive BE is kept. A firm needs two years in Compustat to be used.
+ - Market equity (ME) is price times shares outstanding, summed across the
+   permnos of a permco and assigned to its largest permno.
+ - Each June, stocks are sorted into two size groups on June ME, split at the
+   NYSE median, and three book-to-market groups on BE of the fiscal year
+   ending in the previous calendar year over December ME, split at the NYSE
+   30th and 70th percentiles. They are held from July to the next June.
+ - The six portfolios are value weighted by the previous month's ME, and
+   SMB = (SL + SM + SH) / 3 - (BL + BM + BH) / 3,
+   HML = (SH + BH) / 2 - (SL + BL) / 2.
+
+The gvkey of each stock in June comes from the non-overlapping link segments
+of `link_CRSP_Compustat.link_segments`, through an as-of join.
+
+The whole computation is a polars lazy query over the pushed-down reads of
+the loaders. It is planned and optimized as one query and executed once, by
+`collect`, on all cores. Run as
+```
+python calc_Fama_French_factors.py
+```
+"""
+
+import time
+from pathlib import Path
+
+import pandas as pd
+import polars as pl
+
+import link_CRSP_Compustat
+import misc_tools
+import pull_CRSP_Compustat
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+
+COMPUSTAT_COLUMNS = ["gvkey", "datadate", "seq", "txditc", "pstkrv", "pstkl", "pstk"]
+CRSP_COLUMNS = [
+    "permno",
+    "permco",
+    "mthcaldt",
+    "issuertype",
+    "securitytype",
+    "securitysubtype",
+    "sharetype",
+    "usincflg",
+    "primaryexch",
+    "conditionaltype",
+    "tradingstatusflg",
+    "mthret",
+    "mthretx",
+    "shrout",
+    "mthprc",
+]
+
+
+def calc_book_equity(comp):
+    """
+    Book equity of each gvkey and calendar year of its fiscal year end (the
+    last fiscal year ending in that year), with `count`, the number of
+    earlier years the firm has in Compustat.
+    """
+    preferred = pl.coalesce("pstkrv", "pstkl", "pstk", pl.lit(0.0))
+    be = pl.col("seq") + pl.col("txditc").fill_null(0.0) - preferred
+    return (
+        comp.with_columns(
+            pl.col("gvkey").cast(pl.String),
+            pl.col("datadate").dt.year().alias("year"),
+            pl.when(be > 0).then(be).alias("be"),
+        )
+        .sort(["gvkey", "datadate"])
+        .group_by(["gvkey", "year"], maintain_order=True)
+        .last()
+        .with_columns(pl.int_range(pl.len()).over("gvkey").alias("count"))
+        .select(["gvkey", "year", "be", "count"])
+    )
+
+
+def calc_market_equity(crsp):
+    """
+    Monthly returns and market equity of the common stocks in `crsp`, with
+    `lme`, the market equity at the end of the previous month, for weights.
+    Months are integer codes, `month` = 12 * year + month - 1 (see
+    `misc_tools.month_codes`), which are cheaper to group, sort, and join on
+    than dates.
+    """
+    month = misc_tools.month_codes_expr(pl.col("mthcaldt")).cast(pl.Int32)
+    # One integer per (permco, month), to sort and group on a single column
+    permco_month = misc_tools.panel_keys_expr(pl.col("permco"), pl.col("month"))
+    return (
+        # The codes are compared as categoricals, without casting to strings
+        crsp.filter(
+            (pl.col("sharetype") == "NS")
+            & (pl.col("securitytype") == "EQTY")
+            & (pl.col("securitysubtype") == "COM")
+            & (pl.col("usincflg") == "Y")
+            & pl.col("issuertype").is_in(["ACOR", "CORP"])
+            & pl.col("primaryexch").is_in(["N", "A", "Q"])
+            & (pl.col("conditionaltype") == "RW")
+            & (pl.col("tradingstatusflg") == "A")
+        )
+        .select(
+            pl.col("permno").cast(pl.Int64),
+            month.alias("month"),
+            "permco",
+            "primaryexch",
+            "mthret",
+            "mthretx",
+            (pl.col("mthprc").abs() * pl.col("shrout")).alias("me"),
+        )
+        # Market equity of the permco, assigned to its largest permno. Sorted
+        # on the key, the windows and the first row of each are cheap.
+        .with_columns(permco_month.alias("permco_month"))
+        .sort("permco_month")
+        .with_columns(
+            pl.col("me").sum().over("permco_month").alias("me_permco"),
+            pl.col("me").max().over("permco_month").alias("me_max"),
+        )
+        .filter(pl.col("me") == pl.col("me_max"))
+        .filter(pl.col("permco_month") != pl.col("permco_month").shift(1).fill_null(-1))
+        .sort(misc_tools.panel_keys_expr(pl.col("permno"), pl.col("month")))
+        # The previous row's market equity, if of the same permno
+        .with_columns(
+            pl.when(pl.col("permno") == pl.col("permno").shift(1))
+            .then(pl.col("me_permco").shift(1))
+            .otherwise(pl.col("me_permco") / (1 + pl.col("mthretx")))
+            .alias("lme"),
+            ((pl.col("month") - 6) // 12).alias("ffyear"),
+        )
+        .select(
+            "permno",
+            "month",
+            "ffyear",
+            "primaryexch",
+            "mthret",
+            pl.col("me_permco").alias("me"),
+            "lme",
+        )
+    )
+
+
+def assign_portfolios(crsp_me, book_equity, segments):
+    """
+    The size (`szport`, S or B) and book-to-market (`bmport`, L, M, or H)
+    portfolio of each stock formed in June of each year (`ffyear`), from
+    NYSE breakpoints.
+    """
+    december = crsp_me.filter(pl.col("month") % 12 == 11).select(
+        "permno",
+        (pl.col("month") // 12 + 1).alias("year"),
+        pl.col("me").alias("dec_me"),
+    )
+    links = segments.select(
+        pl.col("permno").cast(pl.Int64),
+        pl.col("gvkey").cast(pl.String),
+        pl.col("start").cast(pl.Int32).cast(pl.Date),
+        pl.col("end").cast(pl.Int32).cast(pl.Date),
+    ).sort("start")
+    june = (
+        crsp_me.filter(pl.col("month") % 12 == 5)
+        .with_columns((pl.col("month") // 12).alias("year"))
+        .with_columns(pl.date(pl.col("year"), 6, 30).alias("jdate"))
+        .join(december, on=["permno", "year"], how="inner")
+        .sort("jdate")
+        .join_asof(
+            links, left_on="jdate", right_on="start", by="permno", strategy="backward"
+        )
+        .filter(pl.col("jdate") < pl.col("end"))
+        .with_columns((pl.col("year") - 1).alias("fyear"))
+        .join(
+            book_equity,
+            left_on=["gvkey", "fyear"],
+            right_on=["gvkey", "year"],
+            how="inner",
+        )
+        .with_columns((pl.col("be") * 1000 / pl.col("dec_me")).alias("beme"))
+        .filter((pl.col("beme") > 0) & (pl.col("me") > 0) & (pl.col("count") >= 1))
+    )
+    nyse = pl.col("primaryexch") == "N"
+    return (
+        june.with_columns(
+            pl.col("me").filter(nyse).median().over("jdate").alias("sz_median"),
+            pl.col("beme")
+            .filter(nyse)
+            .quantile(0.3, interpolation="linear")
+            .over("jdate")
+            .alias("bm30"),
+            pl.col("beme")
+            .filter(nyse)
+            .quantile(0.7, interpolation="linear")
+            .over("jdate")
+            .alias("bm70"),
+        )
+        .with_columns(
+            pl.when(pl.col("me") <= pl.col("sz_median"))
+            .then(pl.lit("S"))
+            .otherwise(pl.lit("B"))
+            .alias("szport"),
+            pl.when(pl.col("beme") <= pl.col("bm30"))
+            .then(pl.lit("L"))
+            .when(pl.col("beme") <= pl.col("bm70"))
+            .then(pl.lit("M"))
+            .otherwise(pl.lit("H"))
+            .alias("bmport"),
+        )
+        .filter(pl.col("sz_median").is_not_null())
+        .select(
+            "permno",
+            pl.col("year").alias("ffyear"),
+            "szport",
+            "bmport",
+        )
+    )
+
+
+def calc_factors(crsp_me, portfolios):
+    """
+    Monthly value-weighted returns of the six size/book-to-market portfolios
+    and the SMB and HML factors, one row per month-end `date`.
+    """
+    returns = (
+        crsp_me.join(portfolios, on=["permno", "ffyear"], how="inner")
+        .filter(
+            (pl.col("lme") > 0)
+            & pl.col("mthret").is_not_null()
+            & pl.col("mthret").is_not_nan()
+        )
+        .group_by(["month", "szport", "bmport"])
+        .agg(
+            ((pl.col("mthret") * pl.col("lme")).sum() / pl.col("lme").sum()).alias(
+                "ret"
+            )
+        )
+    )
+    portfolios = [
+        pl.col("ret")
+        .filter((pl.col("szport") == sz) & (pl.col("bmport") == bm))
+        .first()
+        .alias(sz + bm)
+        for sz in "SB"
+        for bm in "LMH"
+    ]
+    return (
+        returns.group_by("month")
+        .agg(portfolios)
+        .with_columns(
+            (
+                (pl.col("SL") + pl.col("SM") + pl.col("SH")) / 3
+                - (pl.col("BL") + pl.col("BM") + pl.col("BH")) / 3
+            ).alias("smb"),
+            (
+                (pl.col("SH") + pl.col("BH")) / 2 - (pl.col("SL") + pl.col("BL")) / 2
+            ).alias("hml"),
+        )
+        .sort("month")
+        .select(
+            pl.date(pl.col("month") // 12, pl.col("month") % 12 + 1, 1)
+            .dt.month_end()
+            .alias("date"),
+            pl.exclude("month"),
+        )
+    )
+
+
+def calc_Fama_French_factors(data_dir=DATA_DIR, start_date=None, end_date=None):
+    """
+    SMB, HML, and the six portfolio returns from the data in `data_dir`, as a
+    pandas frame with one row per month-end `date`.
+    """
+    comp = pull_CRSP_Compustat.load_compustat(
+        data_dir, columns=COMPUSTAT_COLUMNS, backend="polars"
+    )
+    crsp = pull_CRSP_Compustat.load_CRSP_stock_ciz(
+        data_dir,
+        columns=CRSP_COLUMNS,
+        start_date=start_date,
+        end_date=end_date,
+        backend="polars",
+    )
+    segments = pl.from_pandas(link_CRSP_Compustat.load_link_segments(data_dir))
+
+    # Used three times; cached so that it is computed once
+    crsp_me = calc_market_equity(crsp.lazy()).cache()
+    portfolios = assign_portfolios(
+        crsp_me, calc_book_equity(comp.lazy()), segments.lazy()
+    )
+    factors = calc_factors(crsp_me, portfolios).collect()
+    return factors.to_pandas()
+
+
+def compare_with_Fama_French(factors, ff):
+    """
+    For SMB and HML, the number of months compared with the published
+    factors `ff` (`load_Fama_French_factors`), the correlation, and the mean
+    and standard deviation of the difference.
+    """
+    ff = ff.assign(date=pd.to_datetime(ff["date"]) + pd.offsets.MonthEnd(0))
+    factors = factors.assign(date=pd.to_datetime(factors["date"]))
+    merged = factors.merge(ff, on="date", suffixes=("", "_ff"))
+    rows = {}
+    for col in ["smb", "hml"]:
+        ours, theirs = merged[col], merged[f"{col}_ff"].astype(float)
+        rows[col] = {
+            "n_months": int((ours.notna() & theirs.notna()).sum()),
+            "corr": ours.corr(theirs),
+            "mean_diff": (ours - theirs).mean(),
+            "std_diff": (ours - theirs).std(),
+        }
+    return pd.DataFrame(rows).T
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    factors = calc_Fama_French_factors(data_dir=DATA_DIR)
+    print(f"Computed in {time.perf_counter() - start:.1f} s")
+    factors.to_parquet(DATA_DIR / "FF_FACTORS_REPLICATED.parquet")
+
+    ff = pull_CRSP_Compustat.load_Fama_French_factors(data_dir=DATA_DIR)
+    print(compare_with_Fama_French(factors, ff).round(4).to_string())
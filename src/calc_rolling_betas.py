@@ -0,0 +1,234 @@
+"""
+Rolling-window CAPM and Fama-French three-factor regressions of the monthly
+excess returns of every permno in `pull_CRSP_Compustat.load_CRSP_stock_ciz`
+on the factors of `pull_CRSP_Compustat.load_Fama_French_factors`, giving,
+for each permno and month, the betas, the residual volatility, and the R²
+over the trailing window.
+
+ - The window is the `WINDOW` calendar months ending with the month, so that
+   months without a return (a gap in the history, or a missing `mthret`)
+   are left out rather than replaced by earlier months.
+ - A regression needs at least `MIN_OBS` months with a return in its
+   window; otherwise its results are NaN.
+
+Rather than one OLS fit per window, `rolling_regressions` works from
+cumulative sums. With the rows sorted by (permno, month), the sums over
+a window of all the cross products of [1, x_1, ..., x_k, y], which make up
+X'X, X'y, and y'y, are the difference between two rows of their cumulative
+sums. The first row of each window is found with one `np.searchsorted`
+over a combined (permno, month) key, and all the (k + 1) x (k + 1) normal
+equations are solved together, each step of their Cholesky factorization
+one array operation over all the windows. The panel is processed in blocks
+of whole permnos (`BLOCK_ROWS` rows or so), which bounds the memory for the
+cross products and keeps the cumulative sums small, so that their
+differences stay accurate.
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import misc_tools
+import pull_CRSP_Compustat
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+WINDOW = config("WINDOW", default=60, cast=int)
+MIN_OBS = config("MIN_OBS", default=24, cast=int)
+
+BLOCK_ROWS = 500_000
+
+MODELS = {
+    "capm": ["mktrf"],
+    "ff3": ["mktrf", "smb", "hml"],
+}
+
+
+# Pivots of the Cholesky factorization below this share of the diagonal
+# entry mean collinear regressors
+_PIVOT_TOL = 1e-10
+
+
+def _solve_normal_equations(XtX, Xty):
+    """
+    Solve the stacked symmetric positive-definite systems XtX[:, :, r] @ b =
+    Xty[:, r] by a Cholesky factorization written out over the (few) rows
+    and columns, so that each step is one operation over all the systems,
+    rather than one LAPACK call per system as in a batched `np.linalg.solve`.
+    Returns the solutions, shape (m, n), and whether each system is
+    well-conditioned; the others get NaN.
+    """
+    m, n = Xty.shape
+    L = np.zeros((m, m, n))
+    ok = np.ones(n, dtype=bool)
+    for j in range(m):
+        pivot = XtX[j, j] - (L[j, :j] ** 2).sum(axis=0)
+        ok &= pivot > _PIVOT_TOL * np.abs(XtX[j, j])
+        L[j, j] = np.sqrt(np.where(ok, pivot, 1.0))
+        for i in range(j + 1, m):
+            L[i, j] = (XtX[i, j] - (L[i, :j] * L[j, :j]).sum(axis=0)) / L[j, j]
+
+    # Forward substitution for L z = Xty, then back substitution for L' b = z
+    z = np.empty((m, n))
+    for i in range(m):
+        z[i] = (Xty[i] - (L[i, :i] * z[:i]).sum(axis=0)) / L[i, i]
+    coef = np.empty((m, n))
+    for i in reversed(range(m)):
+        coef[i] = (z[i] - (L[i + 1 :, i] * coef[i + 1 :]).sum(axis=0)) / L[i, i]
+    coef[:, ~ok] = np.nan
+    return coef, ok
+
+
+def _window_regressions(keys, X, y, window, min_obs):
+    """
+    For each row of a block sorted by `keys`, the OLS of `y` on a constant
+    and `X` over the rows of the same id within the `window` periods ending
+    with it. Returns the number of observations, the coefficients (constant
+    first, shape (k + 1, n)), the residual standard deviation, and the R².
+    """
+    n_rows, k = X.shape
+    # One row per variable, and the window sums of each product in
+    # contiguous memory; `cross[i, j]` is the window sum of Z[i] * Z[j]
+    Z = np.vstack([np.ones(n_rows), X.T, y])
+    start = np.searchsorted(keys, keys - (window - 1), side="left")
+    cross = np.empty((k + 2, k + 2, n_rows))
+    sums = np.zeros(n_rows + 1)
+    for i, j in zip(*np.triu_indices(k + 2)):
+        np.cumsum(Z[i] * Z[j], out=sums[1:])
+        np.subtract(sums[1:], sums[start], out=cross[i, j])
+        cross[j, i] = cross[i, j]
+
+    n_obs = np.rint(cross[0, 0]).astype("int64")
+    XtX, Xty, yty = cross[: k + 1, : k + 1], cross[: k + 1, k + 1], cross[-1, -1]
+    coef, _ = _solve_normal_equations(XtX, Xty)
+    coef[:, n_obs < max(min_obs, k + 2)] = np.nan
+
+    ssr = yty - (coef * Xty).sum(axis=0)
+    sst = yty - Xty[0] ** 2 / np.maximum(n_obs, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        resid_vol = np.sqrt(np.maximum(ssr, 0) / (n_obs - k - 1))
+        r2 = 1 - ssr / sst
+    return n_obs, coef, resid_vol, r2
+
+
+def rolling_regressions(
+    df,
+    y_col,
+    x_cols,
+    window=WINDOW,
+    min_obs=MIN_OBS,
+    id_col="permno",
+    period_col="month",
+):
+    """
+    Rolling OLS of `y_col` on a constant and `x_cols` for each row of `df`,
+    over the rows of the same `id_col` with an integer `period_col` in the
+    `window` periods ending with the row's. There must be at most one row
+    per (id, period). Rows with a missing value are left out of all windows.
+
+    Returns a frame aligned with `df` with `n_obs`, `alpha`, `beta_{x}` for
+    each of `x_cols`, `resid_vol` (with n - k - 1 degrees of freedom), and
+    `r2`. `n_obs` is 0 for the rows with a missing value, and the other
+    results are NaN for those, for the windows with fewer than `min_obs`
+    rows, and for the windows where the regressors are collinear.
+    """
+    ids = df[id_col].to_numpy(dtype="int64")
+    periods = df[period_col].to_numpy(dtype="int64")
+    y = pd.Series(df[y_col]).to_numpy(dtype="float64", na_value=np.nan)
+    X = np.column_stack(
+        [df[col].to_numpy(dtype="float64", na_value=np.nan) for col in x_cols]
+    )
+    rows = np.flatnonzero(~np.isnan(y) & ~np.isnan(X).any(axis=1))
+    keys = misc_tools.panel_keys(ids[rows], periods[rows])
+    order = np.argsort(keys)
+    rows, keys = rows[order], keys[order]
+
+    columns = ["n_obs", "alpha"] + [f"beta_{col}" for col in x_cols]
+    columns += ["resid_vol", "r2"]
+    out = np.full((len(df), len(columns)), np.nan)
+    out[:, 0] = 0
+
+    # Blocks of about BLOCK_ROWS rows, cut where the id changes
+    id_starts = np.flatnonzero(np.append(True, np.diff(ids[rows]) != 0))
+    cuts = np.unique(
+        id_starts[np.searchsorted(id_starts, np.arange(0, len(rows), BLOCK_ROWS))]
+    )
+    for first, last in zip(cuts, np.append(cuts[1:], len(rows))):
+        block = slice(first, last)
+        n_obs, coef, resid_vol, r2 = _window_regressions(
+            keys[block], X[rows[block]], y[rows[block]], window, min_obs
+        )
+        fit = ~np.isnan(coef[0])
+        out[rows[block], 0] = n_obs
+        out[rows[block][fit], 1 : 2 + len(x_cols)] = coef[:, fit].T
+        out[rows[block][fit], -2] = resid_vol[fit]
+        out[rows[block][fit], -1] = r2[fit]
+
+    results = pd.DataFrame(out, index=df.index, columns=columns)
+    results["n_obs"] = results["n_obs"].astype("int64")
+    return results
+
+
+def calc_rolling_betas(crsp, ff, window=WINDOW, min_obs=MIN_OBS):
+    """
+    The rolling CAPM and three-factor regressions of each permno's monthly
+    excess return (`mthret` less `rf`) in `crsp`, from `load_CRSP_stock_ciz`,
+    on the factors `ff`, from `load_Fama_French_factors`. One row per
+    (permno, month) of `crsp` in the months of `ff`, dated at the month end
+    (`jdate`), with `n_obs`, `beta_capm`, `resid_vol_capm`, `r2_capm`, and
+    `beta_mkt`, `beta_smb`, `beta_hml`, `resid_vol_ff3`, `r2_ff3`. `n_obs` is
+    the same for both models.
+    """
+    df = pd.DataFrame(
+        {
+            "permno": crsp["permno"].to_numpy(dtype="int64"),
+            "month": misc_tools.month_codes(crsp["mthcaldt"]),
+            "mthret": crsp["mthret"].to_numpy(dtype="float64", na_value=np.nan),
+        }
+    )
+    factors = pd.DataFrame(
+        {
+            col: ff[col].to_numpy(dtype="float64", na_value=np.nan)
+            for col in ["mktrf", "smb", "hml", "rf"]
+        }
+    )
+    factors["month"] = misc_tools.month_codes(ff["date"])
+    df = df.merge(factors, on="month", how="inner")
+    df["exret"] = df["mthret"] - df["rf"]
+
+    capm = rolling_regressions(df, "exret", MODELS["capm"], window, min_obs)
+    ff3 = rolling_regressions(df, "exret", MODELS["ff3"], window, min_obs)
+    betas = pd.DataFrame(
+        {
+            "permno": df["permno"],
+            "jdate": misc_tools.month_ends(df["month"]),
+            "n_obs": capm["n_obs"],
+            "beta_capm": capm["beta_mktrf"],
+            "resid_vol_capm": capm["resid_vol"],
+            "r2_capm": capm["r2"],
+            "beta_mkt": ff3["beta_mktrf"],
+            "beta_smb": ff3["beta_smb"],
+            "beta_hml": ff3["beta_hml"],
+            "resid_vol_ff3": ff3["resid_vol"],
+            "r2_ff3": ff3["r2"],
+        }
+    )
+    return betas.sort_values(["permno", "jdate"], ignore_index=True)
+
+
+def load_rolling_betas(data_dir=DATA_DIR):
+    path = Path(data_dir) / "rolling_betas.parquet"
+    return pd.read_parquet(path)
+
+
+if __name__ == "__main__":
+    crsp = pull_CRSP_Compustat.load_CRSP_stock_ciz(
+        data_dir=DATA_DIR, columns=["permno", "mthcaldt", "mthret"]
+    )
+    ff = pull_CRSP_Compustat.load_Fama_French_factors(data_dir=DATA_DIR)
+    start = time.perf_counter()
+    betas = calc_rolling_betas(crsp, ff)
+    print(f"{len(betas):,} permno-months in {time.perf_counter() - start:.1f} s")
+    betas.to_parquet(DATA_DIR / "rolling_betas.parquet")
@@ -0,0 +1,5 @@
+import os
+
+# The WRDS pull modules read WRDS_USERNAME at import. Tests never connect to
+# WRDS, so any name will do when there is no .env.
+os.environ.setdefault("WRDS_USERNAME", "test_user")
@@ -0,0 +1,526 @@
+"""
+A local stand-in for WRDS, backed by an embedded DuckDB database filled with
+synthetic CRSP, Compustat, and Fama-French tables.
+
+Without WRDS credentials and network access, none of the code in
+`pull_CRSP_Compustat.py`, `pull_CRSP_stock.py`, `pull_CRSP_daily.py`, or
+`calc_CIZ_adjustment_factors.py` can run. This module provides
+
+ - `generate_database`, which writes a DuckDB file with synthetic versions of
+   the WRDS tables those modules query (`crsp.msf_v2`, `crsp.dsf_v2`,
+   `crsp.msf`, `crsp.stkdistributions`, `crsp.msenames`, `crsp.msedelist`,
+   `crsp_a_indexes.msix`, `comp.funda`, `crsp.ccmxpf_linktable`, and
+   `ff.factors_monthly`), with realistic column types, cardinalities, and
+   sizes,
+ - `Connection`, a drop-in replacement for `wrds.Connection` (`raw_sql`,
+   `get_table`, `close`) that runs the same SQL against that file and returns
+   frames shaped like the ones `wrds` returns, and
+ - `fake_wrds`, a context manager that swaps `wrds.Connection` for
+   `Connection` so that the pull code, `WRDSSession` included, runs unchanged.
+
+This module is for tests and development only: the pull modules import it
+(and so DuckDB) in their `__main__` blocks when `FAKE_WRDS` is set, never at
+import.
+
+The SQL of the pulls runs as is on DuckDB, except that 'MM/DD/YYYY' date
+literals are rewritten to ISO dates and column names that are keywords in
+DuckDB but not in PostgreSQL (Compustat's `at`) are quoted.
+
+Example
+-------
+Generate a database of production size (about 4 million monthly CRSP rows)
+and run the full CRSP/Compustat pull against it:
+```
+python fake_wrds.py --FAKE_WRDS=_data/fake_wrds.duckdb --N_PERMNOS=35000
+python pull_CRSP_Compustat.py --FAKE_WRDS=_data/fake_wrds.duckdb
+```
+"""
+
+import re
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import wrds
+
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+# Path of a database written by `generate_database`. Empty to use WRDS.
+FAKE_WRDS = config("FAKE_WRDS", default="", cast=str)
+N_PERMNOS = config("N_PERMNOS", default=35_000, cast=int)
+# The daily file is about 20 times the size of the monthly one, so only this
+# many securities get daily records
+N_DAILY_PERMNOS = config("N_DAILY_PERMNOS", default=1_000, cast=int)
+
+_real_connection = wrds.Connection
+
+
+# Column names that DuckDB reserves but PostgreSQL does not
+DUCKDB_KEYWORDS = ["at"]
+
+
+def _to_duckdb(sql):
+    """
+    Rewrite PostgreSQL as run on WRDS for DuckDB: 'MM/DD/YYYY' literals become
+    ISO dates and the column names in `DUCKDB_KEYWORDS` are quoted.
+    """
+    sql = re.sub(r"'(\d{2})/(\d{2})/(\d{4})'", r"'\3-\1-\2'", sql)
+    for word in DUCKDB_KEYWORDS:
+        sql = re.sub(rf"(?<![\w\"']){word}(?![\w\"'])", f'"{word}"', sql)
+    return sql
+
+
+def _postgres_types(table, date_cols=None):
+    """
+    Cast an Arrow table from DuckDB to the types the WRDS PostgreSQL server
+    returns: 64-bit integers, NUMERIC as float64, and `date_cols` parsed to
+    nanosecond timestamps.
+    """
+    date_cols = set(date_cols or [])
+    for i, field in enumerate(table.schema):
+        type_ = None
+        if field.name in date_cols:
+            type_ = pa.timestamp("ns")
+        elif pa.types.is_integer(field.type):
+            type_ = pa.int64()
+        elif pa.types.is_decimal(field.type) or pa.types.is_floating(field.type):
+            type_ = pa.float64()
+        if type_ is not None and field.type != type_:
+            table = table.set_column(i, field.name, table.column(i).cast(type_))
+    return table
+
+
+class Connection:
+    """
+    Stand-in for `wrds.Connection` that queries a DuckDB file written by
+    `generate_database`. The database is opened read-only, so any number of
+    connections can share it.
+    """
+
+    def __init__(self, wrds_username=None, path=None, **kwargs):
+        if path is None:
+            path = FAKE_WRDS
+        self.path = Path(path)
+        self.wrds_username = wrds_username
+        self.connection = duckdb.connect(str(self.path), read_only=True)
+
+    def raw_sql(self, sql, coerce_float=True, date_cols=None, params=None, **kwargs):
+        """
+        Run `sql` and return a frame with the dtypes `wrds` gives it: dates
+        not in `date_cols` as `datetime.date` objects, integers with missing
+        values as float64. `params` use the psycopg2 `%(name)s` style.
+        """
+        sql = _to_duckdb(sql)
+        if params:
+            sql = re.sub(r"%\((\w+)\)s", r"$\1", sql)
+        table = self.connection.execute(sql, params or None).arrow()
+        if isinstance(table, pa.RecordBatchReader):  # DuckDB >= 1.4
+            table = table.read_all()
+        table = _postgres_types(table, date_cols)
+        return table.to_pandas(date_as_object=True)
+
+    def iter_batches(self, sql, date_cols=None, batch_size=100_000):
+        """Same as `WRDSSession.iter_batches`, reading from DuckDB."""
+        result = self.connection.execute(_to_duckdb(sql))
+        reader = result.fetch_record_batch(batch_size)
+        empty = True
+        for batch in reader:
+            empty = False
+            yield _postgres_types(pa.Table.from_batches([batch]), date_cols)
+        if empty:
+            yield _postgres_types(reader.schema.empty_table(), date_cols)
+
+    def get_table(
+        self, library, table, columns=None, obs=None, date_cols=None, **kwargs
+    ):
+        cols = ", ".join(columns) if columns else "*"
+        limit = f" LIMIT {int(obs)}" if obs is not None else ""
+        sql = f"SELECT {cols} FROM {library}.{table}{limit}"
+        return self.raw_sql(sql, date_cols=date_cols)
+
+    def close(self):
+        self.connection.close()
+
+
+@contextmanager
+def fake_wrds(path=FAKE_WRDS):
+    """
+    Within the block, every `wrds.Connection` (and so every `WRDSSession`)
+    queries the fake database at `path` instead of WRDS. With an empty path,
+    the block runs unchanged.
+    """
+    if not path:
+        yield
+        return
+
+    def _connect(wrds_username=None, **kwargs):
+        return Connection(wrds_username=wrds_username, path=path)
+
+    wrds.Connection = _connect
+    try:
+        yield
+    finally:
+        wrds.Connection = _real_connection
+
+
+def _month_ends(start, end):
+    return pd.date_range(start, end, freq="ME")
+
+
+def generate_tables(
+    n_permnos=N_PERMNOS,
+    start_date="1959-01-01",
+    end_date="2024-12-31",
+    seed=0,
+    n_daily_permnos=N_DAILY_PERMNOS,
+):
+    """
+    Synthetic versions of the WRDS tables, as a dict of "library.table" to
+    frame.
+
+    Each security lives for a random span of months between `start_date` and
+    `end_date` (about 10 years on average), and its CIZ and SIZ monthly
+    records, name history, delisting, Compustat annual records, and CCM link
+    are all generated from the same underlying history, so that they join up
+    the way the real tables do. The first `n_daily_permnos` securities also
+    get a record for every weekday of their life in the daily file.
+    """
+    rng = np.random.default_rng(seed)
+    months = _month_ends(start_date, end_date)
+    n_months = len(months)
+
+    permnos = np.arange(10000, 10000 + n_permnos)
+    permcos = permnos + 40000
+    gvkeys = np.array([f"{i:06d}" for i in range(1000, 1000 + n_permnos)])
+    first = rng.integers(0, n_months, size=n_permnos)
+    length = np.minimum(rng.geometric(1 / 120, size=n_permnos), n_months - first)
+    last = first + length - 1
+    alive = last == n_months - 1
+
+    # One row per security-month
+    sec = np.repeat(np.arange(n_permnos), length)
+    offset = np.arange(len(sec)) - np.repeat(np.cumsum(length) - length, length)
+    month_index = first[sec] + offset
+    n = len(sec)
+    ret = rng.normal(0.01, 0.12, size=n).clip(-0.95)
+    retx = ret - np.abs(rng.normal(0.002, 0.001, size=n))
+    # Log price: a random walk per security from a random starting level
+    steps = rng.normal(0, 0.1, size=n)
+    walk = np.cumsum(steps)
+    starts = np.cumsum(length) - length
+    walk -= np.repeat(walk[starts] - steps[starts], length)
+    prc = np.round(rng.lognormal(3, 1, size=n_permnos)[sec] * np.exp(walk), 3)
+    shrout = np.round(rng.lognormal(9, 1.5, size=n_permnos)[sec], 0)
+    exchcd = rng.choice([1, 2, 3], p=[0.3, 0.2, 0.5], size=n_permnos)
+    shrcd = rng.choice(
+        [10, 11, 12, 31, 73], p=[0.2, 0.7, 0.03, 0.04, 0.03], size=n_permnos
+    )
+    dates = months[month_index]
+
+    # Distribution events: cash dividends, which leave the adjustment factors
+    # unchanged, splits, which change both, and spinoffs, which change the
+    # price factor only. Each event is dated within the month of a record of
+    # the security.
+    n_events = n // 8
+    event_row = np.sort(rng.choice(n, size=n_events, replace=False))
+    event_sec = sec[event_row]
+    distype = rng.choice(["CD", "FRS", "SO"], p=[0.93, 0.04, 0.03], size=n_events)
+    split = rng.choice([1.0, 0.5, 2.0, -0.5], p=[0.6, 0.2, 0.1, 0.1], size=n_events)
+    disfacpr = np.select(
+        [distype == "FRS", distype == "SO"],
+        [split, rng.uniform(0.02, 0.3, size=n_events).round(4)],
+        0.0,
+    )
+    disfacshr = np.where(distype == "FRS", split, 0.0)
+    stkdistributions = pd.DataFrame(
+        {
+            "permno": permnos[event_sec],
+            "disseqnbr": np.arange(n_events)
+            - np.searchsorted(event_sec, event_sec)
+            + 1,
+            "distype": distype,
+            "disdivamt": np.where(
+                distype == "CD", rng.uniform(0.05, 1, size=n_events).round(2), 0.0
+            ),
+            "disfacpr": disfacpr,
+            "disfacshr": disfacshr,
+            "disexdt": dates[event_row]
+            - pd.to_timedelta(rng.integers(1, 25, size=n_events), unit="D"),
+        }
+    )
+    # Legacy cumulative factors: the product of (1 + factor) over the
+    # security's later events, i.e., over the events from the next record on.
+    # Built as a difference array over each security's block of rows. For 3%
+    # of the securities they are off, as in the real data.
+    cfac = {}
+    off = rng.random(n_permnos) < 0.03
+    for name, factor in [("cfacpr", disfacpr), ("cfacshr", disfacshr)]:
+        log_growth = np.log1p(factor)
+        diff = np.zeros(n + 1)
+        np.add.at(diff, starts[event_sec], log_growth)
+        np.add.at(diff, event_row, -log_growth)
+        cfac[name] = np.exp(np.cumsum(diff)[:n]) * np.where(off[sec], 1.02, 1.0)
+
+    msf_v2 = pd.DataFrame(
+        {
+            "permno": permnos[sec],
+            "permco": permcos[sec],
+            "mthcaldt": dates,
+            "issuertype": rng.choice(
+                ["CORP", "ACOR", "REIT"], p=[0.8, 0.15, 0.05], size=n_permnos
+            )[sec],
+            "securitytype": "EQTY",
+            "securitysubtype": rng.choice(
+                ["COM", "CEF"], p=[0.97, 0.03], size=n_permnos
+            )[sec],
+            "sharetype": np.where(shrcd[sec] == 31, "AD", "NS"),
+            "usincflg": np.where(shrcd[sec] == 12, "N", "Y"),
+            "primaryexch": np.array(["N", "A", "Q"])[exchcd[sec] - 1],
+            "conditionaltype": np.where(offset == 0, "NW", "RW"),
+            "tradingstatusflg": np.where(
+                alive[sec] | (month_index < last[sec]), "A", "D"
+            ),
+            "mthret": ret,
+            "mthretx": retx,
+            "shrout": shrout,
+            "mthprc": prc,
+            "cfacshr": cfac["cfacshr"],
+            "cfacpr": cfac["cfacpr"],
+        }
+    )
+    msf = pd.DataFrame(
+        {
+            "permno": permnos[sec],
+            "permco": permcos[sec],
+            "date": dates,
+            "ret": ret,
+            "retx": retx,
+            "prc": np.where(rng.random(n) < 0.05, -prc, prc),
+            "altprc": prc,
+            "vol": np.round(rng.lognormal(8, 2, size=n), 0),
+            "shrout": shrout,
+            "cfacshr": cfac["cfacshr"],
+            "cfacpr": cfac["cfacpr"],
+        }
+    )
+    msenames = pd.DataFrame(
+        {
+            "permno": permnos,
+            "namedt": months[first] - pd.offsets.MonthBegin(1),
+            "nameendt": months[last],
+            "shrcd": shrcd,
+            "exchcd": exchcd,
+            "comnam": [f"COMPANY {p} INC" for p in permnos],
+            "shrcls": np.where(rng.random(n_permnos) < 0.05, "A", None),
+            "naics": rng.choice(
+                [str(c) for c in range(311111, 311611, 5)], size=n_permnos
+            ),
+            "siccd": rng.integers(100, 9999, size=n_permnos),
+        }
+    )
+    dead = np.flatnonzero(~alive)
+    dlstcd = rng.choice(
+        [100, 231, 331, 500, 520, 551, 560, 574, 580, 584], size=len(dead)
+    )
+    dlret = rng.normal(-0.1, 0.2, size=len(dead))
+    dlret[rng.random(len(dead)) < 0.3] = np.nan
+    msedelist = pd.DataFrame(
+        {
+            "permno": permnos[dead],
+            "dlstdt": months[last[dead]]
+            - pd.to_timedelta(rng.integers(0, 20, size=len(dead)), unit="D"),
+            "dlstcd": dlstcd,
+            "dlret": dlret,
+            "dlretx": dlret,
+        }
+    )
+
+    # Daily file: every weekday of the months each security is alive
+    days = pd.bdate_range(months[0] - pd.offsets.MonthBegin(1), months[-1])
+    day_month = np.searchsorted(months.to_numpy(), days.to_numpy())
+    n_daily = min(n_daily_permnos, n_permnos)
+    day_first = np.searchsorted(day_month, first[:n_daily], side="left")
+    day_length = np.searchsorted(day_month, last[:n_daily], side="right") - day_first
+    day_sec = np.repeat(np.arange(n_daily), day_length)
+    day_offset = np.arange(len(day_sec)) - np.repeat(
+        np.cumsum(day_length) - day_length, day_length
+    )
+    day_index = day_first[day_sec] + day_offset
+    # Row of the security-month each day falls in
+    day_row = starts[day_sec] + day_month[day_index] - first[day_sec]
+    n_d = len(day_sec)
+    dlyprc = np.round(prc[day_row] * np.exp(rng.normal(0, 0.02, size=n_d)), 3)
+    dsf_v2 = pd.DataFrame(
+        {
+            "permno": permnos[day_sec],
+            "permco": permcos[day_sec],
+            "dlycaldt": days[day_index],
+            "primaryexch": np.array(["N", "A", "Q"])[exchcd[day_sec] - 1],
+            "sharetype": np.where(shrcd[day_sec] == 31, "AD", "NS"),
+            "dlyret": rng.normal(0.0005, 0.025, size=n_d).clip(-0.95),
+            "dlyretx": rng.normal(0.0004, 0.025, size=n_d).clip(-0.95),
+            "dlyprc": dlyprc,
+            "dlyvol": np.round(rng.lognormal(6, 2, size=n_d), 0),
+            "shrout": shrout[day_row],
+            "dlycap": np.round(dlyprc * shrout[day_row], 3),
+        }
+    )
+    dsf_v2.loc[rng.random(n_d) < 0.002, ["dlyret", "dlyretx"]] = np.nan
+
+    msix_dates = months
+    msix = pd.DataFrame(
+        {
+            "caldt": msix_dates,
+            "vwretd": rng.normal(0.009, 0.045, size=n_months),
+            "vwretx": rng.normal(0.007, 0.045, size=n_months),
+            "ewretd": rng.normal(0.011, 0.055, size=n_months),
+            "ewretx": rng.normal(0.009, 0.055, size=n_months),
+            "totval": np.bincount(
+                month_index, weights=np.abs(prc) * shrout, minlength=n_months
+            ),
+            "totcnt": np.bincount(month_index, minlength=n_months),
+        }
+    )
+    for decile in range(1, 11):
+        msix[f"decret{decile}"] = rng.normal(0.01, 0.05, size=n_months)
+
+    # Compustat: one annual record per fiscal year the firm is alive, with a
+    # December or June fiscal year end, plus some non-standard duplicates that
+    # the pull filters out
+    fyr_month = rng.choice([6, 12], p=[0.2, 0.8], size=n_permnos)
+    is_fye = dates.month == fyr_month[sec]
+    f = np.flatnonzero(is_fye)
+    n_f = len(f)
+    at = np.round(rng.lognormal(5, 2, size=n_f), 3)
+    funda = pd.DataFrame(
+        {
+            "gvkey": gvkeys[sec[f]],
+            "datadate": dates[f],
+            "indfmt": "INDL",
+            "datafmt": "STD",
+            "popsrc": "D",
+            "consol": "C",
+            "at": at,
+            "sale": np.round(at * rng.uniform(0.2, 2, size=n_f), 3),
+            "cogs": np.round(at * rng.uniform(0.1, 1, size=n_f), 3),
+            "xsga": np.round(at * rng.uniform(0, 0.3, size=n_f), 3),
+            "xint": np.round(at * rng.uniform(0, 0.05, size=n_f), 3),
+            "pstkl": np.where(rng.random(n_f) < 0.9, 0.0, np.round(at * 0.02, 3)),
+            "txditc": np.round(at * rng.uniform(0, 0.05, size=n_f), 3),
+            "pstkrv": np.where(rng.random(n_f) < 0.9, 0.0, np.round(at * 0.02, 3)),
+            "seq": np.round(at * rng.uniform(-0.1, 0.7, size=n_f), 3),
+            "pstk": np.where(rng.random(n_f) < 0.9, 0.0, np.round(at * 0.02, 3)),
+            "ni": np.round(at * rng.normal(0.03, 0.08, size=n_f), 3),
+            "sich": np.where(
+                rng.random(n_f) < 0.3, np.nan, msenames["siccd"].to_numpy()[sec[f]]
+            ),
+            "dp": np.round(at * rng.uniform(0, 0.05, size=n_f), 3),
+            "ebit": np.round(at * rng.normal(0.06, 0.08, size=n_f), 3),
+        }
+    )
+    extra = funda.sample(frac=0.05, random_state=seed).assign(indfmt="FS")
+    funda = pd.concat([funda, extra], ignore_index=True)
+    for col in ["at", "sale", "cogs", "xsga", "xint", "seq", "ni", "ebit"]:
+        funda.loc[rng.random(len(funda)) < 0.05, col] = np.nan
+
+    linktable = pd.DataFrame(
+        {
+            "gvkey": gvkeys,
+            "lpermno": permnos,
+            "linktype": rng.choice(
+                ["LC", "LU", "LS", "NU"], p=[0.6, 0.3, 0.05, 0.05], size=n_permnos
+            ),
+            "linkprim": rng.choice(
+                ["P", "C", "J"], p=[0.85, 0.1, 0.05], size=n_permnos
+            ),
+            "linkdt": months[first] - pd.offsets.MonthBegin(1),
+            "linkenddt": months[last].where(~alive, pd.NaT),
+        }
+    )
+
+    factors = pd.DataFrame(
+        {
+            "date": months - pd.offsets.MonthBegin(1),
+            "mktrf": rng.normal(0.006, 0.045, size=n_months).round(4),
+            "smb": rng.normal(0.002, 0.03, size=n_months).round(4),
+            "hml": rng.normal(0.003, 0.03, size=n_months).round(4),
+            "rf": rng.uniform(0, 0.005, size=n_months).round(4),
+            "umd": rng.normal(0.006, 0.04, size=n_months).round(4),
+        }
+    )
+    factors["dateff"] = months
+
+    return {
+        "crsp.msf_v2": msf_v2,
+        "crsp.dsf_v2": dsf_v2,
+        "crsp.msf": msf,
+        "crsp.msenames": msenames,
+        "crsp.stkdistributions": stkdistributions,
+        "crsp.msedelist": msedelist,
+        "crsp_a_indexes.msix": msix,
+        "comp.funda": funda,
+        "crsp.ccmxpf_linktable": linktable,
+        "ff.factors_monthly": factors,
+    }
+
+
+# Columns stored as DATE, like on the WRDS server
+DATE_COLUMNS = {
+    "mthcaldt",
+    "dlycaldt",
+    "date",
+    "namedt",
+    "nameendt",
+    "dlstdt",
+    "disexdt",
+    "caldt",
+    "datadate",
+    "linkdt",
+    "linkenddt",
+    "dateff",
+}
+
+
+def generate_database(path=FAKE_WRDS, **kwargs):
+    """
+    Write the tables of `generate_tables` (keyword arguments are passed on)
+    to a DuckDB file at `path`, replacing it if it exists.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+    con = duckdb.connect(str(path))
+    con.execute("SET enable_progress_bar = false")
+    try:
+        for name, df in generate_tables(**kwargs).items():
+            library = name.split(".")[0]
+            con.execute(f"CREATE SCHEMA IF NOT EXISTS {library}")
+            casts = ", ".join(
+                f"CAST({col} AS DATE) AS {col}"
+                for col in df.columns
+                if col in DATE_COLUMNS
+            )
+            select = (
+                f"SELECT * REPLACE ({casts}) FROM df" if casts else "SELECT * FROM df"
+            )
+            con.execute(f"CREATE TABLE {name} AS {select}")
+    finally:
+        con.close()
+    return path
+
+
+if __name__ == "__main__":
+    path = Path(FAKE_WRDS) if FAKE_WRDS else DATA_DIR / "fake_wrds.duckdb"
+    generate_database(path, n_permnos=N_PERMNOS)
+    con = duckdb.connect(str(path), read_only=True)
+    tables = con.execute(
+        "SELECT table_schema, table_name FROM information_schema.tables ORDER BY 1, 2"
+    ).fetchall()
+    for schema, table in tables:
+        n = con.execute(f"SELECT count(*) FROM {schema}.{table}").fetchone()[0]
+        print(f"{schema}.{table}: {n:,} rows")
+    con.close()
@@ -0,0 +1,148 @@
+"""
+Record and replay the raw HTTP responses behind the public data pulls.
+
+Every web pull in this project (`pull_fred`, `pull_ofr_api_data`,
+`load_fed_yield_curve`) goes through `requests`. This module patches
+`requests.Session.send`, the point every `requests` call passes through, so
+that:
+
+ - in "record" mode, each response is sent over the network as usual and its
+   body and headers are also saved to a fixture store, and
+ - in "replay" mode, responses are served byte-for-byte from the fixture store
+   and the network is never touched.
+
+This makes it possible to profile and benchmark the parsing and
+transformation part of the pulls on a machine without network access, and to
+run the pull tests in milliseconds.
+
+Fixtures are keyed by the method, full URL (including the query string), and
+body of the request. Request headers are not part of the key, so conditional
+requests replay the recorded response.
+
+Example
+-------
+Record once with network access, then replay:
+```
+python pull_fred.py --HTTP_REPLAY=record
+python pull_fred.py --HTTP_REPLAY=replay
+```
+or, for the tests,
+```
+HTTP_REPLAY=record pytest -m network src/test_pull_fred.py
+HTTP_REPLAY=replay pytest -m network src/test_pull_fred.py
+```
+"""
+
+import hashlib
+import io
+import json
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+HTTP_REPLAY = config("HTTP_REPLAY", default="off", cast=str)
+HTTP_FIXTURE_DIR = config("HTTP_FIXTURE_DIR", default=DATA_DIR / "http_fixtures", cast=Path)
+
+MODES = ["off", "record", "replay"]
+
+_original_send = requests.Session.send
+_patch_lock = threading.Lock()
+
+
+class FixtureNotFoundError(LookupError):
+    """Raised in replay mode when no response was recorded for a request."""
+
+
+def fixture_key(request):
+    """Key for a prepared request: hash of its method, URL, and body."""
+    body = request.body or b""
+    if isinstance(body, str):
+        body = body.encode()
+    digest = hashlib.sha256()
+    digest.update(request.method.encode() + b" " + request.url.encode() + b"\n")
+    digest.update(body)
+    return digest.hexdigest()[:32]
+
+
+def save_response(response, fixture_dir=HTTP_FIXTURE_DIR, request=None):
+    """
+    Write the body and metadata of `response` to the fixture store, keyed by
+    `request` (by default, the request that produced the response; pass the
+    original request when redirects were followed).
+    """
+    fixture_dir = Path(fixture_dir)
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    if request is None:
+        request = response.request
+    key = fixture_key(request)
+    (fixture_dir / f"{key}.body").write_bytes(response.content)
+    meta = {
+        "method": request.method,
+        "url": response.url,
+        "status_code": response.status_code,
+        "reason": response.reason,
+        "encoding": response.encoding,
+        "headers": dict(response.headers),
+    }
+    (fixture_dir / f"{key}.json").write_text(json.dumps(meta, indent=2))
+
+
+def load_response(request, fixture_dir=HTTP_FIXTURE_DIR):
+    """Build a `requests.Response` for `request` from the fixture store."""
+    fixture_dir = Path(fixture_dir)
+    key = fixture_key(request)
+    meta_path = fixture_dir / f"{key}.json"
+    if not meta_path.exists():
+        raise FixtureNotFoundError(
+            f"No recorded response for {request.method} {request.url} in {fixture_dir}"
+        )
+    meta = json.loads(meta_path.read_text())
+    body = (fixture_dir / f"{key}.body").read_bytes()
+
+    response = requests.Response()
+    response.status_code = meta["status_code"]
+    response.reason = meta["reason"]
+    response.headers = CaseInsensitiveDict(meta["headers"])
+    response.encoding = meta["encoding"]
+    response.url = meta["url"]
+    response.request = request
+    response.raw = io.BytesIO(body)
+    response._content = body
+    response._content_consumed = True
+    response.elapsed = timedelta(0)
+    return response
+
+
+@contextmanager
+def http_fixtures(mode=HTTP_REPLAY, fixture_dir=HTTP_FIXTURE_DIR):
+    """
+    Record ("record") or replay ("replay") all HTTP traffic made through
+    `requests` inside the block. With mode "off", the block runs unchanged.
+    """
+    if mode not in MODES:
+        raise ValueError(f"HTTP_REPLAY must be one of {MODES}, not {mode!r}")
+    if mode == "off":
+        yield
+        return
+
+    def send(session, request, **kwargs):
+        if mode == "replay":
+            return load_response(request, fixture_dir)
+        response = _original_send(session, request, **kwargs)
+        save_response(response, fixture_dir, request=request)
+        return response
+
+    with _patch_lock:
+        requests.Session.send = send
+    try:
+        yield
+    finally:
+        with _patch_lock:
+            requests.Session.send = _original_send
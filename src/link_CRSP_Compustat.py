@@ -0,0 +1,151 @@
+"""
+Attach Compustat `gvkey`s to CRSP (permno, date) rows through the CCM link
+table (`pull_CRSP_Compustat.load_CRSP_Comp_Link_Table`).
+
+The usual way to apply the link table, merging on `permno` and then keeping
+the rows with `linkdt <= date <= linkenddt`, first builds every pairing of a
+row with every link of its permno. On the full CRSP panel that intermediate
+is many times the size of the panel itself. Instead,
+
+ - `link_segments` turns the link table into non-overlapping date segments
+   per permno, each carrying the single link to use over it. Where links of a
+   permno overlap, the one with the best `linkprim` (then `linktype`), and
+   then the latest `linkdt`, wins. A missing `linkenddt` means the link is
+   still active.
+ - `lookup_gvkey` finds the segment of each row with one `np.searchsorted`
+   over a combined (permno, date) key, an as-of lookup that needs memory only
+   proportional to the rows and the segments.
+
+```
+segments = load_link_segments(data_dir=DATA_DIR)
+crsp["gvkey"] = lookup_gvkey(crsp, segments, date_col="jdate")
+```
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import misc_tools
+import pull_CRSP_Compustat
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+
+# Lower is preferred. P: primary link marked by Compustat, C: primary link
+# assigned by CRSP, J: joiner secondary issue, N: secondary issue.
+LINKPRIM_PRIORITY = {"P": 0, "C": 1, "J": 2, "N": 3}
+LINKTYPE_PRIORITY = {"LC": 0, "LU": 1, "LS": 2}
+
+# Day number standing in for a missing `linkenddt`
+_OPEN_END = np.iinfo("int32").max
+
+
+def _priority(values, priority):
+    codes = pd.Series(values).astype(object).map(priority)
+    return codes.fillna(len(priority)).to_numpy(dtype="int64")
+
+
+def link_segments(ccm):
+    """
+    Non-overlapping segments [start, end) of days per permno, with the
+    `gvkey`, `linktype`, and `linkprim` of the link in effect over each, as a
+    frame sorted by (permno, start). Days not covered by any link have no
+    segment. Links that end before they start are dropped.
+    """
+    ccm = ccm[
+        ccm["permno"].notna()
+        & ccm["linkdt"].notna()
+        & ~(ccm["linkenddt"] < ccm["linkdt"])
+    ]
+    permno = ccm["permno"].to_numpy(dtype="int64")
+    start = misc_tools.day_numbers(ccm["linkdt"])
+    end = misc_tools.day_numbers(ccm["linkenddt"]) + 1
+    end = np.where(ccm["linkenddt"].isna(), _OPEN_END, end)
+
+    # The start and end dates of all the links of a permno cut its timeline
+    # into elementary intervals, over each of which the same links are active
+    start_keys = misc_tools.panel_keys(permno, start)
+    end_keys = misc_tools.panel_keys(permno, end)
+    bounds = np.unique(np.concatenate([start_keys, end_keys]))
+    first = np.searchsorted(bounds, start_keys)
+    n_intervals = np.searchsorted(bounds, end_keys) - first
+
+    # One candidate per (link, interval it covers), typically one or two per
+    # link, and the best candidate of each interval
+    link = np.repeat(np.arange(len(ccm)), n_intervals)
+    interval = np.arange(len(link)) - np.repeat(
+        np.cumsum(n_intervals) - n_intervals, n_intervals
+    )
+    interval += first[link]
+    order = np.lexsort(
+        (
+            -start[link],
+            _priority(ccm["linktype"].to_numpy()[link], LINKTYPE_PRIORITY),
+            _priority(ccm["linkprim"].to_numpy()[link], LINKPRIM_PRIORITY),
+            interval,
+        )
+    )
+    interval, link = interval[order], link[order]
+    is_best = np.append(True, interval[1:] != interval[:-1])
+    interval, link = interval[is_best], link[is_best]
+
+    # Merge consecutive intervals that use the same link
+    seg_start = misc_tools.panel_key_periods(bounds[interval])
+    seg_end = misc_tools.panel_key_periods(bounds[interval + 1])
+    is_new = np.append(True, (link[1:] != link[:-1]) | (seg_start[1:] != seg_end[:-1]))
+    group_end = np.append(np.flatnonzero(is_new)[1:], len(link)) - 1
+
+    keep = np.flatnonzero(is_new)
+    segments = ccm.iloc[link[keep]][["permno", "gvkey", "linktype", "linkprim"]]
+    segments = segments.reset_index(drop=True)
+    segments["start"] = seg_start[keep]
+    segments["end"] = seg_end[group_end]
+    return segments
+
+
+def lookup_gvkey(df, segments, date_col="date", permno_col="permno"):
+    """
+    The `gvkey` of each row of `df` from the segment of `segments` (see
+    `link_segments`) that contains its (`permno_col`, `date_col`), as a
+    Series aligned with `df`. Rows without a link get NaN.
+    """
+    if len(segments) == 0:
+        return pd.Series(np.nan, index=df.index, dtype=segments["gvkey"].dtype)
+    segment_keys = misc_tools.panel_keys(segments["permno"], segments["start"])
+    segment_permno = segments["permno"].to_numpy(dtype="int64")
+    segment_end = segments["end"].to_numpy()
+
+    row_permno = df[permno_col].to_numpy(dtype="int64")
+    row_days = misc_tools.day_numbers(df[date_col])
+    position = np.searchsorted(
+        segment_keys, misc_tools.panel_keys(row_permno, row_days), "right"
+    )
+    position -= 1
+    linked = position >= 0
+    position = np.where(linked, position, 0)
+    linked &= (segment_permno[position] == row_permno) & (
+        row_days < segment_end[position]
+    )
+
+    gvkey = segments["gvkey"].take(position)
+    gvkey = gvkey.where(linked).set_axis(df.index)
+    return gvkey
+
+
+def load_link_segments(data_dir=DATA_DIR):
+    ccm = pull_CRSP_Compustat.load_CRSP_Comp_Link_Table(
+        data_dir=data_dir,
+        columns=["gvkey", "permno", "linktype", "linkprim", "linkdt", "linkenddt"],
+    )
+    return link_segments(ccm)
+
+
+def _demo():
+    crsp = pull_CRSP_Compustat.load_CRSP_stock_ciz(
+        data_dir=DATA_DIR, columns=["permno", "mthcaldt"]
+    )
+    segments = load_link_segments(data_dir=DATA_DIR)
+    crsp["gvkey"] = lookup_gvkey(crsp, segments, date_col="mthcaldt")
+    print(f"{crsp['gvkey'].notna().mean():.1%} of CRSP rows linked")
@@ -3,41 +3,236 @@ This module contains functions to load the zero coupon yield curve from the Fede
 It saves the pulled raw data to a parquet file for future use.
 Functions to load the raw/clean data from the parquet file are also provided for future use.
 
+The file is published once a day but is tens of MB, so `update_fed_yield_curve`
+sends a conditional request using the ETag/Last-Modified values saved from the
+previous download. If the file has not changed, nothing is downloaded or parsed.
+If it has, only the rows after the last saved date are parsed and appended.
+
+Parsing to parquet goes through `write_fed_yield_curve_parquet`, which streams
+the CSV with pyarrow, converts only the requested columns, and writes each
+parsed block as a parquet row group. See `bench_load_fed_yield_curve.py` for a
+comparison with the pandas parser in `pull_fed_yield_curve`.
 """
 
+import json
 import pandas as pd
-import requests
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
 from io import BytesIO
 from pathlib import Path
-import settings
 
-DATA_DIR = settings.DATA_DIR
-START_DATE = settings.START_DATE
-END_DATE = settings.END_DATE
+import http_client
+import http_replay
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+START_DATE = config("START_DATE")
+END_DATE = config("END_DATE")
+
+URL = "https://www.federalreserve.gov/data/yield-curve-tables/feds200628.csv"
+SVENY_COLUMNS = ['SVENY' + str(i).zfill(2) for i in range(1, 31)]
+COLUMN_GROUPS = {
+    "SVENY": SVENY_COLUMNS,  # Zero-coupon yields, continuously compounded
+    "SVENF": ['SVENF' + str(i).zfill(2) for i in range(1, 31)],  # Instantaneous forwards
+    "SVENPY": ['SVENPY' + str(i).zfill(2) for i in range(1, 31)],  # Par yields
+    "PARAMETERS": ["BETA0", "BETA1", "BETA2", "BETA3", "TAU1", "TAU2"],
+}
+# Lines of notes before the header row of feds200628.csv
+N_PREAMBLE_LINES = 9
+# Parquet files kept up to date by `update_fed_yield_curve`, and their columns
+OUTPUT_FILES = {
+    "fed_yield_curve.parquet": "SVENY",
+    "fed_yield_curve_parameters.parquet": "PARAMETERS",
+}
+
+
+def _expand_columns(columns):
+    """Expand names from COLUMN_GROUPS (e.g., "SVENY") into column names."""
+    if isinstance(columns, str):
+        columns = [columns]
+    expanded = []
+    for c in columns:
+        expanded.extend(COLUMN_GROUPS.get(c, [c]))
+    return expanded
+
+
+def _rows_after(content, after):
+    """
+    Cut the raw bytes of feds200628.csv down to the header and the rows dated
+    after `after`. The rows are in ascending date order, so this only needs a
+    byte search for the line of `after`. Returns the bytes and the number of
+    lines to skip before the header, or the original bytes if `after` is not
+    found.
+    """
+    lines = content.split(b"\n", N_PREAMBLE_LINES + 1)
+    header = lines[N_PREAMBLE_LINES] + b"\n"
+    marker = b"\n" + pd.Timestamp(after).strftime("%Y-%m-%d").encode() + b","
+    pos = content.find(marker)
+    if pos == -1:
+        return content, N_PREAMBLE_LINES
+    tail_start = content.find(b"\n", pos + 1) + 1
+    return header + (content[tail_start:] if tail_start else b""), 0
+
+
+def parse_fed_yield_curve(content, after=None):
+    """
+    Parse the raw bytes of feds200628.csv, keeping the SVENY columns.
+
+    If `after` is given, only the rows dated after it are parsed. The rows in
+    the file are in ascending date order, so the rows to keep are found by
+    searching the raw bytes for the line of `after` rather than by parsing
+    the whole file.
+    """
+    skiprows = N_PREAMBLE_LINES
+    if after is not None:
+        content, skiprows = _rows_after(content, after)
+    df = pd.read_csv(BytesIO(content), skiprows=skiprows, index_col=0, parse_dates=True)
+    if after is not None:
+        df = df.loc[df.index > pd.Timestamp(after)]
+    return df[SVENY_COLUMNS]
+
+
+def _parquet_schema(columns):
+    """Arrow schema matching what `DataFrame.to_parquet` writes for the
+    pandas frame, so the file reads back with a "Date" index."""
+    template = pd.DataFrame(
+        {c: pd.Series(dtype="float64") for c in columns},
+        index=pd.DatetimeIndex([], name="Date"),
+    )
+    return pa.Schema.from_pandas(template)
+
+
+def write_fed_yield_curve_parquet(
+    source, path, columns="SVENY", after=None, prepend=None, block_size=1 << 20
+):
+    """
+    Stream feds200628.csv into a parquet file, keeping only `columns`.
+
+    `source` is a path, a file-like object, or the raw bytes of the file.
+    `columns` is a list of column names and/or names of COLUMN_GROUPS
+    ("SVENY", "SVENF", "SVENPY", "PARAMETERS"). Only those columns are
+    converted by the pyarrow CSV reader, and each block of `block_size` bytes
+    is written as its own row group, so the whole file is never held as a
+    pandas frame. If `after` is given, only rows dated after it are kept.
+    `prepend` is an optional pyarrow Table with the same columns (e.g., the
+    existing file) written ahead of the new rows. Returns the number of rows
+    written.
+    """
+    columns = _expand_columns(columns)
+    schema = _parquet_schema(columns)
+    skip_rows = N_PREAMBLE_LINES
+    if isinstance(source, bytes):
+        if after is not None:
+            source, skip_rows = _rows_after(source, after)
+        source = pa.BufferReader(source)
+
+    read_options = pv.ReadOptions(skip_rows=skip_rows, block_size=block_size)
+    convert_options = pv.ConvertOptions(
+        include_columns=["Date"] + columns,
+        column_types={"Date": pa.timestamp("ns"), **{c: pa.float64() for c in columns}},
+    )
+    reader = pv.open_csv(
+        source, read_options=read_options, convert_options=convert_options
+    )
+
+    n_rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        if prepend is not None:
+            prepend = prepend.select(schema.names).cast(schema)
+            writer.write_table(prepend)
+            n_rows += prepend.num_rows
+        for batch in reader:
+            if after is not None:
+                batch = batch.filter(pc.greater(batch["Date"], pd.Timestamp(after)))
+            table = pa.Table.from_batches([batch]).select(schema.names).cast(schema)
+            writer.write_table(table)
+            n_rows += table.num_rows
+    return n_rows
 
 
 def pull_fed_yield_curve():
     """
     Download the latest yield curve from the Federal Reserve
-    
+
     This is the published data using Gurkaynak, Sack, and Wright (2007) model
     """
-    
-    url = "https://www.federalreserve.gov/data/yield-curve-tables/feds200628.csv"
-    response = requests.get(url)
-    pdf_stream = BytesIO(response.content)
-    df = pd.read_csv(pdf_stream, skiprows=9, index_col=0, parse_dates=True)
-    cols = ['SVENY' + str(i).zfill(2) for i in range(1, 31)]
-    return df[cols]
+    response = http_client.get_session().get(URL)
+    return parse_fed_yield_curve(response.content)
+
+
+def update_fed_yield_curve(data_dir=DATA_DIR):
+    """
+    Bring the files in OUTPUT_FILES (the SVENY yields in fed_yield_curve.parquet
+    and the Svensson parameters in fed_yield_curve_parameters.parquet) up to
+    date using a conditional GET.
+
+    The ETag and Last-Modified headers of the last download are stored in
+    fed_yield_curve_http_cache.json, next to the parquet files. On a
+    304 Not Modified response, nothing is downloaded or parsed. Otherwise, only
+    the rows after the last saved date of each file are parsed and appended.
+    Returns True if the parquet files were rewritten.
+    """
+    data_dir = Path(data_dir)
+    paths = {data_dir / filename: columns for filename, columns in OUTPUT_FILES.items()}
+    cache_path = data_dir / "fed_yield_curve_http_cache.json"
+
+    headers = {}
+    if all(path.exists() for path in paths) and cache_path.exists():
+        cache = json.loads(cache_path.read_text())
+        if cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        if cache.get("last_modified"):
+            headers["If-Modified-Since"] = cache["last_modified"]
+
+    response = http_client.get_session().get(URL, headers=headers)
+    if response.status_code == 304:
+        return False
+    response.raise_for_status()
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for path, columns in paths.items():
+        tmp_path = path.with_suffix(".parquet.tmp")
+        if path.exists():
+            table_cached = pq.read_table(path)
+            last_date = pc.max(table_cached["Date"]).as_py()
+            write_fed_yield_curve_parquet(
+                response.content,
+                tmp_path,
+                columns=columns,
+                after=last_date,
+                prepend=table_cached,
+            )
+        else:
+            write_fed_yield_curve_parquet(response.content, tmp_path, columns=columns)
+        tmp_path.replace(path)
+
+    cache = {
+        "url": URL,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    cache_path.write_text(json.dumps(cache, indent=2))
+    return True
+
 
 def load_fed_yield_curve(data_dir=DATA_DIR):
-    path = data_dir  / "fed_yield_curve.parquet"
+    path = Path(data_dir) / "fed_yield_curve.parquet"
+    _df = pd.read_parquet(path)
+    return _df
+
+
+def load_fed_yield_curve_parameters(data_dir=DATA_DIR):
+    """
+    Load the daily Svensson parameters (BETA0-BETA3 in percent, TAU1 and TAU2
+    in years). See `svensson_yield_curve.py` to build curves from them.
+    """
+    path = Path(data_dir) / "fed_yield_curve_parameters.parquet"
     _df = pd.read_parquet(path)
     return _df
-    
+
 if __name__ == "__main__":
-    df = pull_fed_yield_curve()
-    path = Path(DATA_DIR) / "fed_yield_curve.parquet"
-    df.to_parquet(path)
-    
-    
\ No newline at end of file
+    with http_replay.http_fixtures():
+        update_fed_yield_curve(data_dir=DATA_DIR)
+
@@ -742,6 +742,98 @@ def get_end_of_current_quarter(d):
     return quarter_end
 
 
+def month_codes(dates):
+    """
+    Take datetimes and number their months consecutively, as
+    `year * 12 + month - 1`, so that month arithmetic is integer arithmetic
+
+    ```
+    >>> month_codes(pd.to_datetime(['2019-12-31', '2020-01-15']))
+    array([24239, 24240])
+
+    ```
+    """
+    return np.asarray(dates, dtype="datetime64[M]").astype("int64") + 1970 * 12
+
+
+def month_ends(codes):
+    """
+    Take month codes from `month_codes` and find the last date of each month
+
+    ```
+    >>> month_ends([24239, 24240])
+    DatetimeIndex(['2019-12-31', '2020-01-31'], dtype='datetime64[ns]', freq=None)
+
+    ```
+    """
+    next_month = np.asarray(codes, dtype="int64") - 1970 * 12 + 1
+    last_day = next_month.astype("datetime64[M]").astype("datetime64[D]") - 1
+    return pd.DatetimeIndex(last_day.astype("datetime64[ns]"))
+
+
+def day_numbers(dates):
+    """Take datetimes and number their days, as days since 1970-01-01"""
+    return np.asarray(dates, dtype="datetime64[D]").astype("int64")
+
+
+def panel_keys(ids, periods):
+    """
+    Pack (id, period) pairs, e.g., (permno, `month_codes`) or (permno,
+    `day_numbers`), into one int64 each, the id in the high 32 bits and the
+    period (offset to be non-negative) in the low 32. The keys sort by id,
+    then period, so a single `np.searchsorted` over the keys of a panel
+    sorted by (id, period) finds rows by id and period, e.g., the first row
+    of a trailing window or the last event on or before a date.
+
+    ```
+    >>> keys = panel_keys([1, 1, 2], [24239, 24240, 24239])
+    >>> bool((np.diff(keys) > 0).all())
+    True
+    >>> panel_key_periods(keys)
+    array([24239, 24240, 24239])
+
+    ```
+    """
+    periods = np.asarray(periods, dtype="int64")
+    return np.asarray(ids, dtype="int64") << 32 | (periods + 2**31)
+
+
+def panel_key_periods(keys):
+    """The periods packed into `panel_keys`"""
+    return (np.asarray(keys) & 0xFFFFFFFF) - 2**31
+
+
+def month_codes_expr(dates):
+    """
+    `month_codes` as a polars expression, for a date or datetime expression
+
+    ```
+    >>> df = pl.DataFrame({"date": pd.to_datetime(["2019-12-31", "2020-01-15"])})
+    >>> df.select(month_codes_expr(pl.col("date")))["date"].to_list()
+    [24239, 24240]
+
+    ```
+    """
+    return dates.dt.year().cast(pl.Int64) * 12 + dates.dt.month().cast(pl.Int64) - 1
+
+
+def panel_keys_expr(ids, periods):
+    """
+    `panel_keys` as a polars expression, giving the same keys
+
+    ```
+    >>> df = pl.DataFrame({"id": [1, 1, 2], "period": [24239, 24240, 24239]})
+    >>> keys = df.select(panel_keys_expr(pl.col("id"), pl.col("period")))
+    >>> keys.to_series().to_list() == panel_keys(df["id"], df["period"]).tolist()
+    True
+
+    ```
+    """
+    # Multiplying by 2**32 is the shift of `panel_keys`, and the offset
+    # periods fill the low 32 bits, so adding them is the bitwise or
+    return ids.cast(pl.Int64) * 2**32 + (periods.cast(pl.Int64) + 2**31)
+
+
 def add_vertical_lines_to_plot(
     start_date,
     end_date,
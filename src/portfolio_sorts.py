@@ -0,0 +1,266 @@
+"""
+Sort a (date, security) panel, such as the monthly file of
+`pull_CRSP_stock.load_CRSP_monthly_file` or the CIZ file of
+`pull_CRSP_Compustat.load_CRSP_stock_ciz`, into quantile portfolios, and
+compute the portfolio returns.
+
+ - `assign_portfolios` sorts on one characteristic: each date, the
+   breakpoints are quantiles of the characteristic, optionally over a
+   subsample only (e.g., NYSE breakpoints with
+   `breakpoint_mask=df["primaryexch"] == "N"`), and each row gets the number
+   of its portfolio, 1 for the lowest to the number of buckets.
+ - `bivariate_sort` sorts on two characteristics, either independently (both
+   breakpoints per date) or dependently (the second breakpoints per date
+   and portfolio of the first).
+ - `portfolio_returns` computes the equal- or value-weighted return of each
+   (date, portfolio).
+
+Buckets are either a number of equal-sized buckets or a list of interior
+quantiles: `bins=10` for deciles, `bins=[0.3, 0.7]` for the 30/40/30 split of
+Fama and French. A value equal to a breakpoint goes to the lower portfolio.
+Rows with a missing characteristic, or on a date (group) without any values
+to compute breakpoints from, get portfolio 0 and are left out of the
+returns.
+
+Rather than `groupby(date).apply` with one quantile and one `searchsorted`
+call per date, the whole panel is handled at once. Each date (or group) is
+an integer code, and each value is replaced by its rank in the whole panel,
+so that (code, rank) packs into one int64 that sorts by group, then value.
+The breakpoints of all the groups come from a single sort of those keys, and
+the rows are assigned with a single `searchsorted` of their keys among the
+breakpoints' keys. The returns are sums over integer (date, portfolio) codes
+with `np.bincount`.
+
+```
+df["size_port"] = assign_portfolios(
+    df, "me", bins=[0.5], breakpoint_mask=df["primaryexch"] == "N"
+)
+ports = bivariate_sort(
+    df, "me", "beme", bins=([0.5], [0.3, 0.7]),
+    breakpoint_mask=df["primaryexch"] == "N",
+)
+returns = portfolio_returns(
+    df.join(ports), ["me_port", "beme_port"], ret_col="ret", weight_col="lme"
+)
+```
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _quantiles(bins):
+    """
+    The interior quantiles that split into `bins` buckets. They go through
+    percentages, as in `pd.Series.quantile` (which calls `np.percentile`),
+    so that values that tie with a breakpoint land where they would with
+    pandas.
+    """
+    # `* 100 / 100` is not an identity in floating point: it repeats the
+    # rounding of pandas' q * 100 and np.percentile's / 100, so that the
+    # breakpoints are bit-identical to `np.percentile`/`Series.quantile`
+    if np.ndim(bins) == 0:
+        if bins < 2:
+            raise ValueError(f"Need at least 2 buckets, got {bins}")
+        return np.arange(1, bins) / bins * 100 / 100
+    quantiles = np.asarray(bins, dtype="float64")
+    if len(quantiles) == 0 or not (
+        (quantiles > 0).all()
+        and (quantiles < 1).all()
+        and (np.diff(quantiles) > 0).all()
+    ):
+        raise ValueError(f"Quantiles must be increasing and in (0, 1), got {bins}")
+    return quantiles * 100 / 100
+
+
+def _float_values(df, col):
+    return pd.Series(df[col]).to_numpy(dtype="float64", na_value=np.nan)
+
+
+def _ranks(values):
+    """
+    The non-missing `values` in sorted order, and the rank of each of
+    `values` among them, ties getting the lowest rank (-1 if missing).
+    Comparing ranks is comparing values, but ranks, unlike floats, can be
+    packed with a group code into one sortable int64.
+    """
+    order = np.argsort(values)
+    n_valid = int((~np.isnan(values)).sum())
+    order = order[:n_valid]
+    sorted_values = values[order]
+    is_new = np.append(True, sorted_values[1:] != sorted_values[:-1])
+    ranks = np.full(len(values), -1, dtype="int64")
+    ranks[order] = np.maximum.accumulate(np.where(is_new, np.arange(n_valid), 0))
+    return sorted_values, ranks
+
+
+def _group_breakpoints(codes, n_groups, sorted_values, ranks, quantiles, use):
+    """
+    The `quantiles` of the values (given by their `ranks` into
+    `sorted_values`) of the rows of `use` within each group of the integer
+    `codes`, as an array of shape (n_groups, len(quantiles)). Quantiles are
+    interpolated linearly, as by `np.quantile` and `pd.Series.quantile`.
+    Groups without any values get NaN.
+    """
+    breakpoints = np.full((n_groups, len(quantiles)), np.nan)
+    use = use & (ranks >= 0)
+    if not use.any():
+        return breakpoints
+
+    # The values sorted by (group, value), from a single int64 sort
+    stride = len(sorted_values) + 1
+    keys = np.sort(codes[use] * stride + ranks[use])
+    values = sorted_values[keys % stride]
+    n = np.bincount(keys // stride, minlength=n_groups)
+    start = np.cumsum(n) - n
+
+    # Linear interpolation, with the same floating-point operations as
+    # `np.quantile`, so that a value equal to its quantile compares equal
+    has_values = n > 0
+    n = n[has_values, None]
+    position = (n - 1) * quantiles
+    lower = np.floor(position).astype("int64")
+    upper = np.minimum(lower + 1, n - 1)
+    weight = position - lower
+    first = start[has_values, None]
+    below, above = values[first + lower], values[first + upper]
+    diff = above - below
+    breakpoints[has_values] = np.where(
+        weight >= 0.5, above - diff * (1 - weight), below + diff * weight
+    )
+    return breakpoints
+
+
+def _assign_groups(codes, sorted_values, ranks, breakpoints):
+    """
+    The bucket (1 to n + 1) of each row among the n `breakpoints` of its
+    group (a row of `breakpoints`), or 0 where its value or its group's
+    breakpoints are missing. Values equal to a breakpoint go to the lower
+    bucket.
+    """
+    n_breakpoints = breakpoints.shape[1]
+    valid_group = ~np.isnan(breakpoints[:, 0])
+    has = (ranks >= 0) & valid_group[codes]
+
+    # A breakpoint is below a value exactly when the number of values at or
+    # below the breakpoint is at most the value's rank. Packed with the group
+    # code, the breakpoint keys are sorted, and one `searchsorted` counts the
+    # breakpoints below each row, less those of the earlier groups.
+    stride = len(sorted_values) + 1
+    bp_ranks = np.searchsorted(sorted_values, breakpoints[valid_group], side="right")
+    bp_keys = (np.flatnonzero(valid_group)[:, None] * stride + bp_ranks).ravel()
+    below = np.searchsorted(bp_keys, codes[has] * stride + ranks[has], side="right")
+    earlier_groups = np.cumsum(valid_group) - valid_group
+
+    out = np.zeros(len(codes), dtype="int16")
+    out[has] = below - earlier_groups[codes[has]] * n_breakpoints + 1
+    return out
+
+
+def assign_portfolios(
+    df, col, bins=10, date_col="date", breakpoint_mask=None, within=None
+):
+    """
+    The portfolio (1 for the lowest to the number of buckets, 0 if missing)
+    of each row of `df` when sorted on `col` each `date_col`, as a Series
+    aligned with `df`.
+
+    The breakpoints are the quantiles (`bins`, see the module docstring) of
+    `col` over the rows of `breakpoint_mask`, or all rows by default. With
+    `within`, an array of integer labels such as the portfolios of an
+    earlier sort, the breakpoints are computed separately within each
+    (date, label), for dependent sorts; rows with a label of 0 get 0.
+    """
+    quantiles = _quantiles(bins)
+    codes, _ = pd.factorize(df[date_col], sort=True)
+    codes = codes.astype("int64")
+    missing = codes < 0
+    if within is not None:
+        within = np.asarray(within, dtype="int64")
+        missing |= within <= 0
+        codes = codes * (within.max(initial=0) + 1) + within
+    codes = np.where(missing, 0, codes)
+    n_groups = codes.max(initial=-1) + 1
+
+    values = np.where(missing, np.nan, _float_values(df, col))
+    sorted_values, ranks = _ranks(values)
+    if breakpoint_mask is None:
+        use = np.ones(len(df), dtype=bool)
+    else:
+        use = pd.Series(breakpoint_mask).to_numpy(dtype=bool, na_value=False)
+    breakpoints = _group_breakpoints(
+        codes, n_groups, sorted_values, ranks, quantiles, use
+    )
+    portfolios = _assign_groups(codes, sorted_values, ranks, breakpoints)
+    return pd.Series(portfolios, index=df.index, name=f"{col}_port")
+
+
+def bivariate_sort(
+    df,
+    col1,
+    col2,
+    bins=(5, 5),
+    dependent=False,
+    date_col="date",
+    breakpoint_mask=None,
+):
+    """
+    The portfolios of each row of `df` on `col1` and `col2`, as a frame with
+    columns `{col1}_port` and `{col2}_port` aligned with `df`. `bins` gives
+    the buckets of each. With `dependent=True`, the breakpoints of `col2` are
+    computed within each portfolio of `col1`; otherwise, the two sorts are
+    independent. Both use the breakpoint subsample `breakpoint_mask`.
+    """
+    bins1, bins2 = bins
+    port1 = assign_portfolios(
+        df, col1, bins1, date_col=date_col, breakpoint_mask=breakpoint_mask
+    )
+    port2 = assign_portfolios(
+        df,
+        col2,
+        bins2,
+        date_col=date_col,
+        breakpoint_mask=breakpoint_mask,
+        within=port1.to_numpy() if dependent else None,
+    )
+    return pd.concat([port1, port2], axis=1)
+
+
+def portfolio_returns(
+    df, portfolio_cols, ret_col="ret", weight_col=None, date_col="date"
+):
+    """
+    The return of each (`date_col`, portfolio) of `df`, equal-weighted, or
+    weighted by `weight_col` (e.g., the lagged market cap), with `n`, the
+    number of rows averaged. One row per (date, portfolio) that has any;
+    rows with a portfolio of 0, a missing return, or a missing or
+    non-positive weight are left out.
+    """
+    portfolio_cols = (
+        [portfolio_cols] if isinstance(portfolio_cols, str) else list(portfolio_cols)
+    )
+    date_codes, dates = pd.factorize(df[date_col], sort=True)
+    ports = np.column_stack([df[col].to_numpy(dtype="int64") for col in portfolio_cols])
+    ret = _float_values(df, ret_col)
+    weight = np.ones(len(df)) if weight_col is None else _float_values(df, weight_col)
+    valid = (date_codes >= 0) & (ports > 0).all(axis=1) & ~np.isnan(ret) & (weight > 0)
+
+    dims = (len(dates),) + tuple(
+        int(ports[:, i].max(initial=0)) + 1 for i in range(ports.shape[1])
+    )
+    codes = np.ravel_multi_index((date_codes[valid],) + tuple(ports[valid].T), dims)
+    n_codes = int(np.prod(dims))
+    numerator = np.bincount(
+        codes, weights=ret[valid] * weight[valid], minlength=n_codes
+    )
+    denominator = np.bincount(codes, weights=weight[valid], minlength=n_codes)
+    count = np.bincount(codes, minlength=n_codes)
+
+    present = np.flatnonzero(count)
+    index = np.unravel_index(present, dims)
+    returns = pd.DataFrame({date_col: dates[index[0]]})
+    for col, labels in zip(portfolio_cols, index[1:]):
+        returns[col] = labels
+    returns[ret_col] = numerator[present] / denominator[present]
+    returns["n"] = count[present]
+    return returns
@@ -26,19 +26,36 @@ https://wrds-www.wharton.upenn.edu/documents/400/CRSP_Programmers_Guide.pdf
 
 """
 
+from contextlib import nullcontext
 from pathlib import Path
 
 import pandas as pd
-import wrds
+import pyarrow.dataset as ds
+from decouple import strtobool
 from pandas.tseries.offsets import MonthEnd
 
+import wrds_tools
 from settings import config
 
 OUTPUT_DIR = Path(config("OUTPUT_DIR"))
 DATA_DIR = Path(config("DATA_DIR"))
 WRDS_USERNAME = config("WRDS_USERNAME")
+# Path of a synthetic database from fake_wrds.py to pull from instead of
+# WRDS, for development. Empty to use WRDS.
+FAKE_WRDS = config("FAKE_WRDS", default="", cast=str)
 # START_DATE = config("START_DATE")
 # END_DATE = config("END_DATE")
+START_DATE = pd.Timestamp("1959-01-01")
+# Run as `python pull_CRSP_Compustat.py --INCREMENTAL=True` to only pull recent
+# years of CRSP and Compustat
+INCREMENTAL = config("INCREMENTAL", default=False, cast=strtobool)
+
+# How far back before the latest stored date an incremental refresh re-pulls,
+# to pick up revisions. Compustat restates fundamentals for a couple of years.
+COMPUSTAT_LOOKBACK_DAYS = 730
+CRSP_LOOKBACK_DAYS = 92
+# Run with `--FLOAT32_RETURNS=True` to store CRSP returns as float32
+FLOAT32_RETURNS = config("FLOAT32_RETURNS", default=False, cast=strtobool)
 
 
 description_compustat = {
@@ -63,34 +80,118 @@ description_compustat = {
     "consol": "Consolidation",
 }
 
+# Declared dtypes, applied at ingest (see `wrds_tools.apply_dtypes`). Columns
+# not listed keep the float64 or datetime64 that `raw_sql` gives them.
+dtypes_compustat = {
+    "gvkey": "category",
+    "sich": "Int16",
+}
+
 
-def pull_compustat(wrds_username=WRDS_USERNAME):
+COMPUSTAT_SQL = """
+    SELECT 
+        gvkey, datadate, at, sale, cogs, xsga, xint, pstkl, txditc,
+        pstkrv, seq, pstk, ni, sich, dp, ebit
+    FROM 
+        comp.funda
+    WHERE 
+        indfmt='INDL' AND -- industrial companies
+        datafmt='STD' AND -- only standardized records
+        popsrc='D' AND -- only from primary sources
+        consol='C' AND -- consolidated financial statements
+        datadate BETWEEN '{start_date}' AND '{end_date}'
     """
+
+
+def pull_compustat(wrds_username=WRDS_USERNAME, db=None):
+    """
+    Runs COMPUSTAT_SQL over the whole history, from START_DATE through today.
     See description_compustat for a description of the variables.
     """
-    sql_query = """
-        SELECT 
-            gvkey, datadate, at, sale, cogs, xsga, xint, pstkl, txditc,
-            pstkrv, seq, pstk, ni, sich, dp, ebit
-        FROM 
-            comp.funda
-        WHERE 
-            indfmt='INDL' AND -- industrial companies
-            datafmt='STD' AND -- only standardized records
-            popsrc='D' AND -- only from primary sources
-            consol='C' AND -- consolidated financial statements
-            datadate >= '01/01/1959'
-        """
-    # with wrds.Connection(wrds_username=wrds_username) as db:
-    #     comp = db.raw_sql(sql_query, date_cols=["datadate"])
-    db = wrds.Connection(wrds_username=wrds_username)
+    sql_query = COMPUSTAT_SQL.format(
+        start_date=START_DATE.strftime("%Y-%m-%d"),
+        end_date=pd.Timestamp.today().strftime("%Y-%m-%d"),
+    )
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
     comp = db.raw_sql(sql_query, date_cols=["datadate"])
-    db.close()
 
+    return _clean_compustat(comp)
+
+
+def _clean_compustat(comp):
+    comp = wrds_tools.apply_dtypes(comp, dtypes_compustat)
     comp["year"] = comp["datadate"].dt.year
     return comp
 
 
+def pull_compustat_partitioned(
+    data_dir=DATA_DIR,
+    start_date=START_DATE,
+    end_date=None,
+    wrds_username=WRDS_USERNAME,
+    years_per_chunk=1,
+    max_workers=4,
+    db=None,
+    batch_size=wrds_tools.STREAM_BATCH_SIZE,
+):
+    """
+    Same data as `pull_compustat`, pulled in chunks of years over concurrent
+    connections and written to the year-partitioned dataset
+    `data_dir/Compustat/year=YYYY/`. Rows are streamed from the server in
+    batches of `batch_size` (None to read each chunk at once). See
+    `wrds_tools.pull_partitioned`.
+    """
+    if end_date is None:
+        end_date = pd.Timestamp.today()
+    return wrds_tools.pull_partitioned(
+        COMPUSTAT_SQL,
+        Path(data_dir) / "Compustat",
+        date_col="datadate",
+        start_date=start_date,
+        end_date=end_date,
+        wrds_username=wrds_username,
+        date_cols=["datadate"],
+        transform=_clean_compustat,
+        years_per_chunk=years_per_chunk,
+        max_workers=max_workers,
+        db=db,
+        batch_size=batch_size,
+    )
+
+
+def update_compustat_partitioned(
+    data_dir=DATA_DIR,
+    end_date=None,
+    lookback_days=COMPUSTAT_LOOKBACK_DAYS,
+    wrds_username=WRDS_USERNAME,
+    max_workers=4,
+    db=None,
+    batch_size=wrds_tools.STREAM_BATCH_SIZE,
+):
+    """
+    Refresh the dataset written by `pull_compustat_partitioned`, re-pulling
+    only the years from the latest stored `datadate` less `lookback_days`.
+    See `wrds_tools.update_partitioned`.
+    """
+    if end_date is None:
+        end_date = pd.Timestamp.today()
+    return wrds_tools.update_partitioned(
+        COMPUSTAT_SQL,
+        Path(data_dir) / "Compustat",
+        date_col="datadate",
+        start_date=START_DATE,
+        end_date=end_date,
+        lookback_days=lookback_days,
+        wrds_username=wrds_username,
+        date_cols=["datadate"],
+        transform=_clean_compustat,
+        max_workers=max_workers,
+        db=db,
+        batch_size=batch_size,
+    )
+
+
 description_crsp = {
     "permno": "Permanent Number - A unique identifier assigned by CRSP to each security.",
     "permco": "Permanent Company - A unique company identifier assigned by CRSP that remains constant over time for a given company.",
@@ -109,7 +210,22 @@ description_crsp = {
     "mthprc": "Monthly Price - The price of the security at the end of the month.",
 }
 
-def get_crsp_columns(wrds_username=WRDS_USERNAME):
+dtypes_crsp_stock_ciz = {
+    "permno": "int32",
+    "permco": "int32",
+    "issuertype": "category",
+    "securitytype": "category",
+    "securitysubtype": "category",
+    "sharetype": "category",
+    "usincflg": "category",
+    "primaryexch": "category",
+    "conditionaltype": "category",
+    "tradingstatusflg": "category",
+}
+returns_crsp_stock_ciz = ["mthret", "mthretx"]
+
+
+def get_crsp_columns(wrds_username=WRDS_USERNAME, db=None):
     """Get all column names from CRSP monthly stock file (CIZ format)."""
     sql_query = """
         SELECT column_name, data_type
@@ -119,13 +235,28 @@ def get_crsp_columns(wrds_username=WRDS_USERNAME):
         ORDER BY ordinal_position;
     """
     
-    db = wrds.Connection(wrds_username=wrds_username)
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
     columns = db.raw_sql(sql_query)
-    db.close()
     
     return columns
 
-def pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME):
+CRSP_STOCK_CIZ_SQL = """
+    SELECT 
+        permno, permco, mthcaldt, 
+        issuertype, securitytype, securitysubtype, sharetype, 
+        usincflg, 
+        primaryexch, conditionaltype, tradingstatusflg,
+        mthret, mthretx, shrout, mthprc,
+        cfacshr, cfacpr
+    FROM 
+        crsp.msf_v2
+    WHERE 
+        mthcaldt BETWEEN '{start_date}' AND '{end_date}'
+    """
+
+
+def pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME, db=None):
     """Pull necessary CRSP monthly stock data to
     compute Fama-French factors. Use the new CIZ format.
 
@@ -153,29 +284,28 @@ def pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME):
     For now, it's close enough to just let
     market_cap = mthprc * shrout
 
-    """
-    sql_query = """
-        SELECT 
-            permno, permco, mthcaldt, 
-            issuertype, securitytype, securitysubtype, sharetype, 
-            usincflg, 
-            primaryexch, conditionaltype, tradingstatusflg,
-            mthret, mthretx, shrout, mthprc,
-            cfacshr, cfacpr
-        FROM 
-            crsp.msf_v2
-        WHERE 
-            mthcaldt >= '01/01/1959'
-        """
+    `calc_CIZ_adjustment_factors.py` rebuilds the cumulative factors from the
+    CIZ distribution events and reports how often they match the legacy ones.
 
+    """
+    sql_query = CRSP_STOCK_CIZ_SQL.format(
+        start_date=START_DATE.strftime("%Y-%m-%d"),
+        end_date=pd.Timestamp.today().strftime("%Y-%m-%d"),
+    )
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
+    crsp_m = db.raw_sql(sql_query, date_cols=["mthcaldt"])
 
+    return _clean_CRSP_stock_ciz(crsp_m)
 
-    db = wrds.Connection(wrds_username=wrds_username)
-    crsp_m = db.raw_sql(sql_query, date_cols=["mthcaldt"])
-    db.close()
 
-    # change variable format to int
-    crsp_m[["permco", "permno"]] = crsp_m[["permco", "permno"]].astype(int)
+def _clean_CRSP_stock_ciz(crsp_m):
+    # int32 ids, categorical codes
+    crsp_m = wrds_tools.apply_dtypes(
+        crsp_m,
+        dtypes_crsp_stock_ciz,
+        float32_columns=returns_crsp_stock_ciz if FLOAT32_RETURNS else (),
+    )
 
     # Line up date to be end of month
     crsp_m["jdate"] = crsp_m["mthcaldt"] + MonthEnd(0)
@@ -183,6 +313,73 @@ def pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME):
     return crsp_m
 
 
+def pull_CRSP_stock_ciz_partitioned(
+    data_dir=DATA_DIR,
+    start_date=START_DATE,
+    end_date=None,
+    wrds_username=WRDS_USERNAME,
+    years_per_chunk=1,
+    max_workers=4,
+    db=None,
+    batch_size=wrds_tools.STREAM_BATCH_SIZE,
+):
+    """
+    Same data as `pull_CRSP_stock_ciz`, pulled in chunks of years over
+    concurrent connections and written to the year-partitioned dataset
+    `data_dir/CRSP_stock_ciz/year=YYYY/`. Rows are streamed from the server in
+    batches of `batch_size` (None to read each chunk at once). See
+    `wrds_tools.pull_partitioned`.
+    """
+    if end_date is None:
+        end_date = pd.Timestamp.today()
+    return wrds_tools.pull_partitioned(
+        CRSP_STOCK_CIZ_SQL,
+        Path(data_dir) / "CRSP_stock_ciz",
+        date_col="mthcaldt",
+        start_date=start_date,
+        end_date=end_date,
+        wrds_username=wrds_username,
+        date_cols=["mthcaldt"],
+        transform=_clean_CRSP_stock_ciz,
+        years_per_chunk=years_per_chunk,
+        max_workers=max_workers,
+        db=db,
+        batch_size=batch_size,
+    )
+
+
+def update_CRSP_stock_ciz_partitioned(
+    data_dir=DATA_DIR,
+    end_date=None,
+    lookback_days=CRSP_LOOKBACK_DAYS,
+    wrds_username=WRDS_USERNAME,
+    max_workers=4,
+    db=None,
+    batch_size=wrds_tools.STREAM_BATCH_SIZE,
+):
+    """
+    Refresh the dataset written by `pull_CRSP_stock_ciz_partitioned`,
+    re-pulling only the years from the latest stored `mthcaldt` less
+    `lookback_days`. See `wrds_tools.update_partitioned`.
+    """
+    if end_date is None:
+        end_date = pd.Timestamp.today()
+    return wrds_tools.update_partitioned(
+        CRSP_STOCK_CIZ_SQL,
+        Path(data_dir) / "CRSP_stock_ciz",
+        date_col="mthcaldt",
+        start_date=START_DATE,
+        end_date=end_date,
+        lookback_days=lookback_days,
+        wrds_username=wrds_username,
+        date_cols=["mthcaldt"],
+        transform=_clean_CRSP_stock_ciz,
+        max_workers=max_workers,
+        db=db,
+        batch_size=batch_size,
+    )
+
+
 description_crsp_comp_link = {
     "gvkey": "Global Company Key - A unique identifier for companies in the Compustat database.",
     "permno": "Permanent Number - A unique stock identifier assigned by CRSP to each security.",
@@ -193,7 +390,15 @@ description_crsp_comp_link = {
 }
 
 
-def pull_CRSP_Comp_Link_Table(wrds_username=WRDS_USERNAME):
+dtypes_crsp_comp_link = {
+    "gvkey": "category",
+    "permno": "Int32",
+    "linktype": "category",
+    "linkprim": "category",
+}
+
+
+def pull_CRSP_Comp_Link_Table(wrds_username=WRDS_USERNAME, db=None):
     sql_query = """
         SELECT 
             gvkey, lpermno AS permno, linktype, linkprim, linkdt, linkenddt
@@ -203,16 +408,17 @@ def pull_CRSP_Comp_Link_Table(wrds_username=WRDS_USERNAME):
             substr(linktype,1,1)='L' AND 
             (linkprim ='C' OR linkprim='P')
         """
-    db = wrds.Connection(wrds_username=wrds_username)
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
     ccm = db.raw_sql(sql_query, date_cols=["linkdt", "linkenddt"])
-    db.close()
+    ccm = wrds_tools.apply_dtypes(ccm, dtypes_crsp_comp_link)
     return ccm
 
 
-def pull_Fama_French_factors(wrds_username=WRDS_USERNAME):
-    conn = wrds.Connection(wrds_username=wrds_username)
-    ff = conn.get_table(library="ff", table="factors_monthly")
-    conn.close()
+def pull_Fama_French_factors(wrds_username=WRDS_USERNAME, db=None):
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
+    ff = db.get_table(library="ff", table="factors_monthly")
     ff[["smb", "hml"]] = ff[["smb", "hml"]].astype(float)
 
     ff["date"] = pd.to_datetime(ff["date"])
@@ -221,21 +427,106 @@ def pull_Fama_French_factors(wrds_username=WRDS_USERNAME):
     return ff
 
 
-def load_compustat(data_dir=DATA_DIR):
-    path = Path(data_dir) / "Compustat.parquet"
-    comp = pd.read_parquet(path)
+def load_compustat(
+    data_dir=DATA_DIR,
+    columns=None,
+    start_date=None,
+    end_date=None,
+    gvkeys=None,
+    backend="pandas",
+):
+    """
+    Reads the year-partitioned dataset from `pull_compustat_partitioned` if
+    there is one, and Compustat.parquet otherwise.
+
+    Only `columns` (default all) of the rows with `datadate` in
+    [start_date, end_date] and `gvkey` in `gvkeys` are read; these are pushed
+    down to the parquet scan (see `wrds_tools.read_dataset`). With
+    `backend="polars"`, returns a polars frame.
+    """
+    path = Path(data_dir) / "Compustat"
+    if not path.is_dir():
+        path = Path(data_dir) / "Compustat.parquet"
+    comp = wrds_tools.read_dataset(
+        path,
+        columns=columns,
+        date_col="datadate",
+        start_date=start_date,
+        end_date=end_date,
+        ids={"gvkey": gvkeys},
+        backend=backend,
+    )
     return comp
 
 
-def load_CRSP_stock_ciz(data_dir=DATA_DIR):
-    path = Path(data_dir) / "CRSP_stock_ciz.parquet"
-    crsp = pd.read_parquet(path)
+def load_CRSP_stock_ciz(
+    data_dir=DATA_DIR,
+    columns=None,
+    start_date=None,
+    end_date=None,
+    permnos=None,
+    backend="pandas",
+):
+    """
+    Reads the year-partitioned dataset from `pull_CRSP_stock_ciz_partitioned`
+    if there is one, and CRSP_stock_ciz.parquet otherwise.
+
+    Only `columns` (default all) of the rows with `mthcaldt` in
+    [start_date, end_date] and `permno` in `permnos` are read; these are
+    pushed down to the parquet scan (see `wrds_tools.read_dataset`). With
+    `backend="polars"`, returns a polars frame.
+    """
+    path = Path(data_dir) / "CRSP_stock_ciz"
+    if not path.is_dir():
+        path = Path(data_dir) / "CRSP_stock_ciz.parquet"
+    crsp = wrds_tools.read_dataset(
+        path,
+        columns=columns,
+        date_col="mthcaldt",
+        start_date=start_date,
+        end_date=end_date,
+        ids={"permno": permnos},
+        backend=backend,
+    )
+    # The partition column is not part of this table
+    if "year" in crsp.columns and (columns is None or "year" not in columns):
+        crsp = crsp.drop(columns=["year"]) if backend == "pandas" else crsp.drop("year")
     return crsp
 
 
-def load_CRSP_Comp_Link_Table(data_dir=DATA_DIR):
+def load_CRSP_Comp_Link_Table(
+    data_dir=DATA_DIR,
+    columns=None,
+    start_date=None,
+    end_date=None,
+    permnos=None,
+    gvkeys=None,
+    backend="pandas",
+):
+    """
+    Reads CRSP_Comp_Link_Table.parquet.
+
+    Only `columns` (default all) of the links with `permno` in `permnos` and
+    `gvkey` in `gvkeys` that are active at some point in
+    [start_date, end_date] are read. A missing `linkenddt` means the link is
+    still active.
+    """
     path = Path(data_dir) / "CRSP_Comp_Link_Table.parquet"
-    ccm = pd.read_parquet(path)
+    active = None
+    if end_date is not None:
+        active = ds.field("linkdt") <= pd.Timestamp(end_date).to_datetime64()
+    if start_date is not None:
+        still_active = ds.field("linkenddt").is_null() | (
+            ds.field("linkenddt") >= pd.Timestamp(start_date).to_datetime64()
+        )
+        active = still_active if active is None else active & still_active
+    ccm = wrds_tools.read_dataset(
+        path,
+        columns=columns,
+        ids={"permno": permnos, "gvkey": gvkeys},
+        filter=active,
+        backend=backend,
+    )
     return ccm
 
 
@@ -252,15 +543,48 @@ def _demo():
     ff = load_Fama_French_factors(data_dir=DATA_DIR)
 
 
-if __name__ == "__main__":
-    comp = pull_compustat(wrds_username=WRDS_USERNAME)
-    comp.to_parquet(DATA_DIR / "Compustat.parquet")
+def pull_all(
+    data_dir=DATA_DIR, wrds_username=WRDS_USERNAME, db=None, incremental=False
+):
+    """
+    Pull and save all the data of this module over a single WRDS session.
 
-    crsp = pull_CRSP_stock_ciz(wrds_username=WRDS_USERNAME)
-    crsp.to_parquet(DATA_DIR / "CRSP_stock_ciz.parquet")
+    With `incremental=True`, Compustat and CRSP are refreshed with
+    `update_compustat_partitioned` and `update_CRSP_stock_ciz_partitioned`
+    instead of pulled in full. The link table and the Fama-French factors
+    are small enough that they are always pulled in full.
+    """
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
+
+    if incremental:
+        update_compustat_partitioned(
+            data_dir=data_dir, wrds_username=wrds_username, db=db
+        )
+        update_CRSP_stock_ciz_partitioned(
+            data_dir=data_dir, wrds_username=wrds_username, db=db
+        )
+    else:
+        pull_compustat_partitioned(
+            data_dir=data_dir, wrds_username=wrds_username, db=db
+        )
+        pull_CRSP_stock_ciz_partitioned(
+            data_dir=data_dir, wrds_username=wrds_username, db=db
+        )
+
+    ccm = pull_CRSP_Comp_Link_Table(db=db)
+    ccm.to_parquet(Path(data_dir) / "CRSP_Comp_Link_Table.parquet")
+
+    ff = pull_Fama_French_factors(db=db)
+    ff.to_parquet(Path(data_dir) / "FF_FACTORS.parquet")
 
-    ccm = pull_CRSP_Comp_Link_Table(wrds_username=WRDS_USERNAME)
-    ccm.to_parquet(DATA_DIR / "CRSP_Comp_Link_Table.parquet")
 
-    ff = pull_Fama_French_factors(wrds_username=WRDS_USERNAME)
-    ff.to_parquet(DATA_DIR / "FF_FACTORS.parquet")
+if __name__ == "__main__":
+    source = nullcontext()
+    if FAKE_WRDS:
+        # fake_wrds (and DuckDB) are for development only
+        import fake_wrds
+
+        source = fake_wrds.fake_wrds(FAKE_WRDS)
+    with source, wrds_tools.WRDSSession(WRDS_USERNAME) as db:
+        pull_all(data_dir=DATA_DIR, db=db, incremental=INCREMENTAL)
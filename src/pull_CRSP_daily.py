@@ -0,0 +1,298 @@
+"""
+Functions to pull the CRSP daily stock file (CIZ format, `crsp.dsf_v2`) and
+to aggregate daily returns to weekly or monthly returns and volatilities.
+
+ - Data: https://wrds-www.wharton.upenn.edu/data-dictionary/crsp_a_stock/dsf_v2/
+ - CIZ transition FAQ: https://wrds-www.wharton.upenn.edu/pages/support/manuals-and-overviews/crsp/stocks-and-indices/crsp-stock-and-indexes-version-2/crsp-ciz-faq/
+
+The daily file is about 20 times the size of the monthly one, so even one
+year of it is a large query. It is pulled like `pull_CRSP_stock_ciz_partitioned`
+in `pull_CRSP_Compustat.py`, a year at a time into a year-partitioned
+dataset, but each year is split further into `N_PERMNO_BUCKETS` queries by
+`permno`, each streamed into its own file of the year's partition:
+```
+_data/CRSP_daily_stock_ciz/year=1990/part-0.parquet
+...
+_data/CRSP_daily_stock_ciz/year=1990/part-7.parquet
+```
+See `wrds_tools.pull_partitioned`.
+
+Aggregation
+-----------
+`aggregate_daily_returns` compounds daily returns into weekly or monthly
+returns, with the volatility of the daily returns within each period. Rather
+than a `groupby(...).apply` that calls a Python function per security-period,
+the rows are sorted once by (permno, date), the first row of each
+security-period is located, and the sums are taken over those segments with
+`np.add.reduceat`, so the cost is a sort plus a few passes over flat arrays.
+"""
+
+from contextlib import nullcontext
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from decouple import strtobool
+
+import wrds_tools
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+WRDS_USERNAME = config("WRDS_USERNAME")
+# Path of a synthetic database from fake_wrds.py to pull from instead of
+# WRDS, for development. Empty to use WRDS.
+FAKE_WRDS = config("FAKE_WRDS", default="", cast=str)
+# Run with `--INCREMENTAL=True` to refresh the daily file rather than pull
+# it in full
+INCREMENTAL = config("INCREMENTAL", default=False, cast=strtobool)
+# Run with `--FLOAT32_RETURNS=True` to store returns as float32
+FLOAT32_RETURNS = config("FLOAT32_RETURNS", default=False, cast=strtobool)
+
+# First date of the daily file
+START_DATE = pd.Timestamp("1925-12-31")
+N_PERMNO_BUCKETS = 8
+CRSP_LOOKBACK_DAYS = 92
+
+# Declared dtypes of the daily file, applied at ingest (see
+# `wrds_tools.apply_dtypes`)
+dtypes_dsf_v2 = {
+    "permno": "int32",
+    "permco": "int32",
+    "primaryexch": "category",
+    "sharetype": "category",
+}
+returns_dsf_v2 = ["dlyret", "dlyretx"]
+
+
+DSF_V2_SQL = """
+    SELECT
+        permno, permco, dlycaldt,
+        primaryexch, sharetype,
+        dlyret, dlyretx, dlyprc, dlyvol, shrout, dlycap
+    FROM
+        crsp.dsf_v2
+    WHERE
+        dlycaldt BETWEEN '{start_date}' AND '{end_date}' AND
+        permno % {n_buckets} = {bucket}
+    """
+
+
+def _clean_CRSP_daily_file(dsf):
+    return wrds_tools.apply_dtypes(
+        dsf,
+        dtypes_dsf_v2,
+        float32_columns=returns_dsf_v2 if FLOAT32_RETURNS else (),
+    )
+
+
+def pull_CRSP_daily_file_partitioned(
+    data_dir=DATA_DIR,
+    start_date=START_DATE,
+    end_date=None,
+    wrds_username=WRDS_USERNAME,
+    n_buckets=N_PERMNO_BUCKETS,
+    max_workers=4,
+    db=None,
+    batch_size=wrds_tools.STREAM_BATCH_SIZE,
+):
+    """
+    Pull the CRSP daily stock file one year and one of `n_buckets` permno
+    buckets at a time, over concurrent connections, into the year-partitioned
+    dataset `data_dir/CRSP_daily_stock_ciz/year=YYYY/`. Rows are streamed from
+    the server in batches of `batch_size`. `end_date` defaults to today. See
+    `wrds_tools.pull_partitioned`.
+    """
+    if end_date is None:
+        end_date = pd.Timestamp.today()
+    return wrds_tools.pull_partitioned(
+        DSF_V2_SQL,
+        Path(data_dir) / "CRSP_daily_stock_ciz",
+        date_col="dlycaldt",
+        start_date=start_date,
+        end_date=end_date,
+        wrds_username=wrds_username,
+        date_cols=["dlycaldt"],
+        transform=_clean_CRSP_daily_file,
+        max_workers=max_workers,
+        db=db,
+        batch_size=batch_size,
+        n_buckets=n_buckets,
+    )
+
+
+def update_CRSP_daily_file_partitioned(
+    data_dir=DATA_DIR,
+    end_date=None,
+    lookback_days=CRSP_LOOKBACK_DAYS,
+    wrds_username=WRDS_USERNAME,
+    n_buckets=N_PERMNO_BUCKETS,
+    max_workers=4,
+    db=None,
+    batch_size=wrds_tools.STREAM_BATCH_SIZE,
+):
+    """
+    Refresh the dataset written by `pull_CRSP_daily_file_partitioned`,
+    re-pulling only the years from the latest stored `dlycaldt` less
+    `lookback_days`, through `end_date` (default today). See
+    `wrds_tools.update_partitioned`.
+    """
+    if end_date is None:
+        end_date = pd.Timestamp.today()
+    return wrds_tools.update_partitioned(
+        DSF_V2_SQL,
+        Path(data_dir) / "CRSP_daily_stock_ciz",
+        date_col="dlycaldt",
+        start_date=START_DATE,
+        end_date=end_date,
+        lookback_days=lookback_days,
+        wrds_username=wrds_username,
+        date_cols=["dlycaldt"],
+        transform=_clean_CRSP_daily_file,
+        max_workers=max_workers,
+        db=db,
+        batch_size=batch_size,
+        n_buckets=n_buckets,
+    )
+
+
+def load_CRSP_daily_file(
+    data_dir=DATA_DIR,
+    columns=None,
+    start_date=None,
+    end_date=None,
+    permnos=None,
+    backend="pandas",
+):
+    """
+    Reads the year-partitioned dataset from `pull_CRSP_daily_file_partitioned`.
+
+    Only `columns` (default all) of the rows with `dlycaldt` in
+    [start_date, end_date] and `permno` in `permnos` are read; these are
+    pushed down to the parquet scan (see `wrds_tools.read_dataset`). With
+    `backend="polars"`, returns a polars frame.
+    """
+    dsf = wrds_tools.read_dataset(
+        Path(data_dir) / "CRSP_daily_stock_ciz",
+        columns=columns,
+        date_col="dlycaldt",
+        start_date=start_date,
+        end_date=end_date,
+        ids={"permno": permnos},
+        backend=backend,
+    )
+    # The partition column is not part of this table
+    if "year" in dsf.columns and (columns is None or "year" not in columns):
+        dsf = dsf.drop(columns=["year"]) if backend == "pandas" else dsf.drop("year")
+    return dsf
+
+
+def aggregate_daily_returns(
+    dsf, freq="M", ret_col="dlyret", date_col="dlycaldt", id_col="permno"
+):
+    """
+    Compound the daily returns `ret_col` of each `id_col` into returns over
+    the periods of `freq` (a pandas period frequency, e.g., "M" for calendar
+    months or "W-FRI" for weeks ending on Friday).
+
+    Returns one row per security-period with the last trading date of the
+    period (`date_col`), the compounded return `ret`, the standard deviation
+    of the daily returns `vol` (not annualized; NaN with fewer than two),
+    and the number of daily returns `n_days`. Missing daily returns are
+    skipped; a period with none has a NaN return.
+    """
+    ids = dsf[id_col].to_numpy()
+    dates = dsf[date_col].to_numpy()
+    periods = pd.PeriodIndex(dsf[date_col], freq=freq).asi8
+    order = np.lexsort((dates, ids))
+    ids, dates, periods = ids[order], dates[order], periods[order]
+    ret = dsf[ret_col].to_numpy(dtype="float64", na_value=np.nan)[order]
+
+    # First and last row of each security-period
+    is_start = np.ones(len(ids), dtype=bool)
+    is_start[1:] = (ids[1:] != ids[:-1]) | (periods[1:] != periods[:-1])
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(ids))[: len(starts)] - 1
+
+    def _sum(values):
+        # reduceat needs at least one segment
+        return np.add.reduceat(values, starts) if len(starts) else values[:0]
+
+    valid = ~np.isnan(ret)
+    ret = np.where(valid, ret, 0.0)
+    n_days = _sum(valid.astype("int64"))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        compounded = np.where(n_days > 0, np.expm1(_sum(np.log1p(ret))), np.nan)
+        mean = _sum(ret) / n_days
+        deviation = np.where(valid, ret - np.repeat(mean, ends - starts + 1), 0.0)
+        vol = np.where(n_days > 1, np.sqrt(_sum(deviation**2) / (n_days - 1)), np.nan)
+
+    return pd.DataFrame(
+        {
+            id_col: ids[starts],
+            date_col: dates[ends],
+            "ret": compounded,
+            "vol": vol,
+            "n_days": n_days,
+        }
+    )
+
+
+def aggregate_CRSP_daily_file(data_dir=DATA_DIR, freq="M"):
+    """
+    Aggregate the stored daily file with `aggregate_daily_returns`, reading
+    one year at a time so that only three columns of a single year are in
+    memory at once. `freq` must be one whose periods do not straddle years,
+    e.g., "M" or "Q"; for weekly returns, aggregate a loaded range directly.
+    """
+    dataset_dir = Path(data_dir) / "CRSP_daily_stock_ciz"
+    manifest = wrds_tools.load_manifest(dataset_dir)
+    if manifest is None:
+        raise FileNotFoundError(
+            f"No CRSP daily dataset in {dataset_dir}. "
+            "Pull it with pull_CRSP_daily_file_partitioned first."
+        )
+    frames = []
+    for year in manifest["partitions"]:
+        dsf = load_CRSP_daily_file(
+            data_dir,
+            columns=["permno", "dlycaldt", "dlyret"],
+            start_date=f"{year}-01-01",
+            end_date=f"{year}-12-31",
+        )
+        frames.append(aggregate_daily_returns(dsf, freq=freq))
+    return pd.concat(frames, ignore_index=True)
+
+
+def pull_all(
+    data_dir=DATA_DIR, wrds_username=WRDS_USERNAME, db=None, incremental=False
+):
+    """
+    Pull the daily file over a single WRDS session (refresh it with
+    `incremental=True`) and save its monthly aggregates to
+    CRSP_daily_to_monthly.parquet.
+    """
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
+
+    if incremental:
+        update_CRSP_daily_file_partitioned(
+            data_dir=data_dir, wrds_username=wrds_username, db=db
+        )
+    else:
+        pull_CRSP_daily_file_partitioned(
+            data_dir=data_dir, wrds_username=wrds_username, db=db
+        )
+
+    monthly = aggregate_CRSP_daily_file(data_dir, freq="M")
+    monthly.to_parquet(Path(data_dir) / "CRSP_daily_to_monthly.parquet")
+
+
+if __name__ == "__main__":
+    source = nullcontext()
+    if FAKE_WRDS:
+        # fake_wrds (and DuckDB) are for development only
+        import fake_wrds
+
+        source = fake_wrds.fake_wrds(FAKE_WRDS)
+    with source, wrds_tools.WRDSSession(WRDS_USERNAME) as db:
+        pull_all(data_dir=DATA_DIR, db=db, incremental=INCREMENTAL)
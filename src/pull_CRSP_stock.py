@@ -17,24 +17,47 @@ about the new CIZ format can be found here:
  - CRSP Metadata Guide: https://wrds-www.wharton.upenn.edu/documents/1941/CRSP_METADATA_GUIDE_STOCK_INDEXES_FLAT_FILE_FORMAT_2_0_CIZ_09232022v.pdf
 
 """
+from contextlib import nullcontext
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
-import wrds
+import polars as pl
+from decouple import strtobool
 
+import wrds_tools
 from settings import config
 
 DATA_DIR = Path(config("DATA_DIR"))
 WRDS_USERNAME = config("WRDS_USERNAME")
+# Path of a synthetic database from fake_wrds.py to pull from instead of
+# WRDS, for development. Empty to use WRDS.
+FAKE_WRDS = config("FAKE_WRDS", default="", cast=str)
 START_DATE = config("START_DATE")
 END_DATE = config("END_DATE")
+# Run with `--FLOAT32_RETURNS=True` to store returns as float32
+FLOAT32_RETURNS = config("FLOAT32_RETURNS", default=False, cast=strtobool)
+
+# Declared dtypes of the monthly file, applied at ingest (see
+# `wrds_tools.apply_dtypes`). Codes from the left joins can be missing, so they
+# use nullable integers.
+dtypes_msf = {
+    "permno": "int32",
+    "permco": "int32",
+    "shrcd": "Int8",
+    "exchcd": "Int8",
+    "comnam": "category",
+    "shrcls": "category",
+    "naics": "category",
+    "siccd": "Int16",
+    "dlstcd": "Int16",
+}
+returns_msf = ["ret", "retx", "dlret", "dlretx"]
 
 
 def pull_CRSP_monthly_file(
-    start_date=START_DATE, end_date=END_DATE, wrds_username=WRDS_USERNAME
+    start_date=START_DATE, end_date=END_DATE, wrds_username=WRDS_USERNAME, db=None
 ):
     """
     Pulls monthly CRSP stock data from a specified start date to end date.
@@ -76,15 +99,11 @@ def pull_CRSP_monthly_file(
         msf.date BETWEEN '{start_date}' AND '{end_date}' AND 
         msenames.shrcd IN (10, 11, 20, 21, 40, 41, 70, 71, 73)
     """
-    # with wrds.Connection(wrds_username=wrds_username) as db:
-    #     df = db.raw_sql(
-    #         query, date_cols=["date", "namedt", "nameendt", "dlstdt"]
-    #     )
-    db = wrds.Connection(wrds_username=wrds_username)
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
     df = db.raw_sql(
         query, date_cols=["date", "namedt", "nameendt", "dlstdt"]
     )
-    db.close()
 
     df = df.loc[:, ~df.columns.duplicated()]
     df["shrout"] = df["shrout"] * 1000
@@ -104,9 +123,32 @@ def pull_CRSP_monthly_file(
     # Deal with delisting returns
     df = apply_delisting_returns(df)
 
+    df = wrds_tools.apply_dtypes(
+        df, dtypes_msf, float32_columns=returns_msf if FLOAT32_RETURNS else ()
+    )
     return df
 
 
+# Delisting codes for which a missing delisting return is set to -30% rather
+# than -100% (Bali, Engle, and Murray, 2016, Chapter 7)
+PERFORMANCE_DELISTING_CODES = [500, 520, 580, 584] + list(range(551, 575))
+
+
+def _delisting_fill(dlstcd):
+    """
+    The value that stands in for a missing delisting return, by `dlstcd`:
+    -0.3 for the codes in PERFORMANCE_DELISTING_CODES, -1 for any other code
+    of 200 or more, and NaN otherwise (no code, or an active code in the
+    100s).
+    """
+    codes = dlstcd.to_numpy(dtype="float64", na_value=np.nan)
+    return np.where(
+        np.isin(codes, PERFORMANCE_DELISTING_CODES),
+        -0.3,
+        np.where(codes >= 200, -1.0, np.nan),
+    )
+
+
 def apply_delisting_returns(df):
     """
     Use instructions for handling delisting returns from: Chapter 7 of 
@@ -116,36 +158,49 @@ def apply_delisting_returns(df):
     First change dlret column. 
     If dlret is NA and dlstcd is not NA, then:
     if dlstcd is 500, 520, 551-574, 580, or 584, then dlret = -0.3
-    if dlret is NA but dlstcd is not one of the above, then dlret = -1
-    """
-    df["dlret"] = np.select(
-        [
-            df["dlstcd"].isin([500, 520, 580, 584] + list(range(551, 575)))
-            & df["dlret"].isna(),
-            df["dlret"].isna() & df["dlstcd"].notna() & df["dlstcd"] >= 200,
-            True,
-        ],
-        [-0.3, -1, df["dlret"]],
-        default=df["dlret"],
-    )
+    if dlret is NA but dlstcd is not one of the above (and is 200 or more,
+    i.e., the security was delisted), then dlret = -1
+    The same goes for dlretx. Then a missing ret (retx) is replaced by dlret
+    (dlretx).
 
-    df["dlretx"] = np.select(
-        [
-            df["dlstcd"].isin([500, 520, 580, 584] + list(range(551, 575)))
-            & df["dlretx"].isna(),
-            df["dlretx"].isna() & df["dlstcd"].notna() & df["dlstcd"] >= 200,
-            True,
-        ],
-        [-0.3, -1, df["dlretx"]],
-        default=df["dlretx"],
-    )
-
-    # Replace the inplace operations with direct assignments
-    df["ret"] = df["ret"].fillna(df["dlret"])
-    df["retx"] = df["retx"].fillna(df["dlretx"])
+    The replacement value only depends on dlstcd, so it is computed once and
+    used for both return columns.
+    """
+    fill = _delisting_fill(df["dlstcd"])
+    for dl_col, ret_col in [("dlret", "ret"), ("dlretx", "retx")]:
+        dl = df[dl_col].to_numpy(dtype="float64", na_value=np.nan)
+        dl = np.where(np.isnan(dl), fill, dl)
+        ret = df[ret_col].to_numpy(dtype="float64", na_value=np.nan)
+        df[dl_col] = dl
+        df[ret_col] = np.where(np.isnan(ret), dl, ret)
     return df
 
 
+def apply_delisting_returns_polars(df):
+    """
+    The same adjustment as `apply_delisting_returns`, as polars expressions,
+    for a polars DataFrame or LazyFrame. With a LazyFrame, e.g., from
+    `pl.scan_parquet`, it can run out of core:
+    ```
+    lf = pl.scan_parquet(DATA_DIR / "CRSP_MSF_INDEX_INPUTS.parquet")
+    lf.pipe(apply_delisting_returns_polars).sink_parquet(path)
+    ```
+    """
+    dlstcd = pl.col("dlstcd")
+    fill = (
+        pl.when(dlstcd.is_in(PERFORMANCE_DELISTING_CODES))
+        .then(-0.3)
+        .when(dlstcd >= 200)
+        .then(-1.0)
+    )
+    exprs = []
+    for dl_col, ret_col in [("dlret", "ret"), ("dlretx", "retx")]:
+        dl = pl.col(dl_col).cast(pl.Float64).fill_nan(None).fill_null(fill)
+        ret = pl.col(ret_col).cast(pl.Float64).fill_nan(None).fill_null(dl)
+        exprs += [dl.alias(dl_col), ret.alias(ret_col)]
+    return df.with_columns(exprs)
+
+
 def apply_delisting_returns_alt(df):
     df["dlret"] = df["dlret"].fillna(0)
     df["ret"] = df["ret"] + df["dlret"]
@@ -156,7 +211,7 @@ def apply_delisting_returns_alt(df):
 
 
 def pull_CRSP_index_files(
-    start_date=START_DATE, end_date=END_DATE, wrds_username=WRDS_USERNAME
+    start_date=START_DATE, end_date=END_DATE, wrds_username=WRDS_USERNAME, db=None
 ):
     """
     Pulls the CRSP index files from crsp_a_indexes.msix:
@@ -168,23 +223,56 @@ def pull_CRSP_index_files(
         FROM crsp_a_indexes.msix
         WHERE caldt BETWEEN '{start_date}' AND '{end_date}'
     """
-    # with wrds.Connection(wrds_username=wrds_username) as db:
-    #     df = db.raw_sql(query, date_cols=["month", "caldt"])
-    db = wrds.Connection(wrds_username=wrds_username)
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
     df = db.raw_sql(query, date_cols=["caldt"])
-    db.close()
     return df
 
 
-def load_CRSP_monthly_file(data_dir=DATA_DIR):
+def load_CRSP_monthly_file(
+    data_dir=DATA_DIR,
+    columns=None,
+    start_date=None,
+    end_date=None,
+    permnos=None,
+    backend="pandas",
+):
+    """
+    Reads CRSP_MSF_INDEX_INPUTS.parquet. Only `columns` (default all) of the
+    rows with `date` in [start_date, end_date] and `permno` in `permnos` are
+    read; these are pushed down to the parquet scan (see
+    `wrds_tools.read_dataset`). With `backend="polars"`, returns a polars
+    frame.
+    """
     path = Path(data_dir) / "CRSP_MSF_INDEX_INPUTS.parquet"
-    df = pd.read_parquet(path)
+    df = wrds_tools.read_dataset(
+        path,
+        columns=columns,
+        date_col="date",
+        start_date=start_date,
+        end_date=end_date,
+        ids={"permno": permnos},
+        backend=backend,
+    )
     return df
 
 
-def load_CRSP_index_files(data_dir=DATA_DIR):
+def load_CRSP_index_files(
+    data_dir=DATA_DIR, columns=None, start_date=None, end_date=None, backend="pandas"
+):
+    """
+    Reads CRSP_MSIX.parquet. Only `columns` (default all) of the rows with
+    `caldt` in [start_date, end_date] are read.
+    """
     path = Path(data_dir) / f"CRSP_MSIX.parquet"
-    df = pd.read_parquet(path)
+    df = wrds_tools.read_dataset(
+        path,
+        columns=columns,
+        date_col="caldt",
+        start_date=start_date,
+        end_date=end_date,
+        backend=backend,
+    )
     return df
 
 
@@ -193,12 +281,28 @@ def _demo():
     df_msix = load_CRSP_index_files(data_dir=DATA_DIR)
 
 
-if __name__ == "__main__":
+def pull_all(data_dir=DATA_DIR, wrds_username=WRDS_USERNAME, db=None):
+    """
+    Pull and save all the data of this module over a single WRDS session.
+    """
+    if db is None:
+        db = wrds_tools.get_wrds_session(wrds_username)
 
-    df_msf = pull_CRSP_monthly_file(start_date=START_DATE, end_date=END_DATE)
-    path = Path(DATA_DIR) / "CRSP_MSF_INDEX_INPUTS.parquet"
+    df_msf = pull_CRSP_monthly_file(start_date=START_DATE, end_date=END_DATE, db=db)
+    path = Path(data_dir) / "CRSP_MSF_INDEX_INPUTS.parquet"
     df_msf.to_parquet(path)
 
-    df_msix = pull_CRSP_index_files(start_date=START_DATE, end_date=END_DATE)
-    path = Path(DATA_DIR) / f"CRSP_MSIX.parquet"
+    df_msix = pull_CRSP_index_files(start_date=START_DATE, end_date=END_DATE, db=db)
+    path = Path(data_dir) / f"CRSP_MSIX.parquet"
     df_msix.to_parquet(path)
+
+
+if __name__ == "__main__":
+    source = nullcontext()
+    if FAKE_WRDS:
+        # fake_wrds (and DuckDB) are for development only
+        import fake_wrds
+
+        source = fake_wrds.fake_wrds(FAKE_WRDS)
+    with source, wrds_tools.WRDSSession(WRDS_USERNAME) as db:
+        pull_all(data_dir=DATA_DIR, db=db)
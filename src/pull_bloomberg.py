@@ -1,36 +1,215 @@
 """
-This module loads the S&P 500 index, Dividend yields, and all active futures during 
-the given period from Bloomberg. 
+This module loads the S&P 500 index, Dividend yields, and all active futures during
+the given period from Bloomberg.
 
 You must have a Bloomberg terminal open on this computer to run. You must
 first install xbbg
+
+Terminal request limits are the binding constraint here, so history requests
+go through `fetch_history`, which
+ - keeps a local parquet cache per (ticker, field) under DATA_DIR/bloomberg_cache,
+   together with the date ranges that have already been requested, and only
+   asks the terminal for the ranges that are missing, and
+ - batches what is missing into one `bdh` call per date range and field set.
+
+The terminal is reached through a transport object with a `bdh` method.
+`XbbgTransport` talks to the terminal. `RecordedTransport` serves recorded
+responses instead, so the code can be tested and benchmarked without a terminal.
 """
 
-import pandas as pd
-import settings
+import json
+from collections import defaultdict
 from pathlib import Path
 
-DATA_DIR = settings.DATA_DIR
-START_DATE = settings.START_DATE
-END_DATE = settings.END_DATE
+import pandas as pd
+from settings import config
+
+DATA_DIR = Path(config("DATA_DIR"))
+START_DATE = config("START_DATE")
+END_DATE = config("END_DATE")
+CACHE_DIR = DATA_DIR / "bloomberg_cache"
+
+
+class XbbgTransport:
+    """Send `bdh` requests to the Bloomberg terminal through xbbg."""
+
+    def bdh(self, tickers, flds, start_date, end_date):
+        from xbbg import blp
+
+        return blp.bdh(tickers, flds, start_date, end_date)
+
+
+class RecordedTransport:
+    """
+    Stand-in for the terminal that answers `bdh` requests from recorded data.
+
+    `history` is a DataFrame shaped like the output of `blp.bdh`: dates in the
+    index and (ticker, field) MultiIndex columns. Each request is appended to
+    `self.requests`, so tests can count round-trips.
+    """
+
+    def __init__(self, history):
+        self.history = history.sort_index()
+        self.requests = []
+
+    @classmethod
+    def from_parquet(cls, path):
+        return cls(pd.read_parquet(path))
+
+    def bdh(self, tickers, flds, start_date, end_date):
+        self.requests.append((tuple(tickers), tuple(flds), start_date, end_date))
+        columns = [
+            (t, f) for t in tickers for f in flds if (t, f) in self.history.columns
+        ]
+        return self.history.loc[pd.Timestamp(start_date) : pd.Timestamp(end_date), columns]
+
+
+def _cache_file(ticker, field, cache_dir=CACHE_DIR):
+    name = f"{ticker}__{field}".replace(" ", "_").replace("/", "-")
+    return Path(cache_dir) / f"{name}.parquet"
+
+
+def _load_coverage(cache_dir=CACHE_DIR):
+    path = Path(cache_dir) / "coverage.json"
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def _missing_ranges(start_date, end_date, covered):
+    """Parts of [start_date, end_date] (inclusive, daily) not in `covered`."""
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    missing = []
+    cursor = start_date
+    for lo, hi in sorted((pd.Timestamp(lo), pd.Timestamp(hi)) for lo, hi in covered):
+        if hi < cursor:
+            continue
+        if lo > end_date:
+            break
+        if lo > cursor:
+            missing.append((cursor, lo - pd.Timedelta(days=1)))
+        cursor = max(cursor, hi + pd.Timedelta(days=1))
+    if cursor <= end_date:
+        missing.append((cursor, end_date))
+    return missing
+
+
+def _merge_ranges(ranges):
+    """Merge overlapping or adjacent inclusive daily ranges."""
+    merged = []
+    for lo, hi in sorted((pd.Timestamp(lo), pd.Timestamp(hi)) for lo, hi in ranges):
+        if merged and lo <= merged[-1][1] + pd.Timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return [(lo.strftime("%Y-%m-%d"), hi.strftime("%Y-%m-%d")) for lo, hi in merged]
+
+
+def _last_published_date():
+    """
+    The last date whose daily values are final: today's, and any later
+    ones, can still change or have yet to be published.
+    """
+    return pd.Timestamp.today().normalize() - pd.Timedelta(days=1)
+
+
+def fetch_history(series_requests, transport=None, cache_dir=CACHE_DIR):
+    """
+    Get daily history for a list of (ticker, field, start_date, end_date)
+    requests, going to the terminal only for date ranges not already cached.
+
+    Missing ranges are grouped so that each `bdh` call covers one date range
+    and one set of fields for all the tickers that need exactly that. Returns
+    a dict mapping (ticker, field) to a Series over the requested dates.
+
+    Only dates up to `_last_published_date` are recorded as covered, so
+    that requests running through today or into the future are fetched
+    again from today on the next time.
+    """
+    if transport is None:
+        transport = XbbgTransport()
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    coverage = _load_coverage(cache_dir)
+
+    # (start, end) -> ticker -> fields
+    to_fetch = defaultdict(lambda: defaultdict(set))
+    for ticker, field, start_date, end_date in series_requests:
+        covered = coverage.get(f"{ticker}|{field}", [])
+        for gap in _missing_ranges(start_date, end_date, covered):
+            to_fetch[gap][ticker].add(field)
+
+    last_published = _last_published_date()
+    fetched = defaultdict(list)
+    for (start_date, end_date), fields_by_ticker in to_fetch.items():
+        tickers_by_fields = defaultdict(list)
+        for ticker, fields in fields_by_ticker.items():
+            tickers_by_fields[tuple(sorted(fields))].append(ticker)
+        for flds, tickers in tickers_by_fields.items():
+            df = transport.bdh(
+                tickers,
+                list(flds),
+                start_date.strftime("%Y-%m-%d"),
+                end_date.strftime("%Y-%m-%d"),
+            )
+            covered_end = min(end_date, last_published)
+            for ticker in tickers:
+                for field in flds:
+                    if (ticker, field) in df.columns:
+                        s = df[(ticker, field)].dropna()
+                        s.index = pd.to_datetime(s.index)
+                        fetched[(ticker, field)].append(s)
+                    if covered_end < start_date:
+                        continue
+                    key = f"{ticker}|{field}"
+                    coverage[key] = _merge_ranges(
+                        coverage.get(key, []) + [(start_date, covered_end)]
+                    )
+
+    for (ticker, field), new in fetched.items():
+        path = _cache_file(ticker, field, cache_dir)
+        s = pd.concat(new)
+        if path.exists():
+            s = s.combine_first(pd.read_parquet(path)[field])
+        s = s[~s.index.duplicated(keep="last")].sort_index()
+        s.rename(field).to_frame().to_parquet(path)
+    (cache_dir / "coverage.json").write_text(json.dumps(coverage, indent=2))
+
+    result = {}
+    for ticker, field, start_date, end_date in series_requests:
+        path = _cache_file(ticker, field, cache_dir)
+        if path.exists():
+            s = pd.read_parquet(path)[field]
+        else:
+            s = pd.Series(dtype=float)
+        result[(ticker, field)] = s.loc[pd.Timestamp(start_date) : pd.Timestamp(end_date)]
+    return result
+
+
+def pull_bbg_data(end_date=END_DATE, transport=None, cache_dir=CACHE_DIR):
+
+    series_requests = [
+        ("SPX Index", "EQY_DVD_YLD_12m", START_DATE, end_date),
+        ("SPX Index", "px_last", START_DATE, end_date),
+        ("SP1 Index", "px_last", START_DATE, "1997-08-31"),
+        ("ES1 Index", "px_last", "1997-09-30", end_date),
+    ]
+    data = fetch_history(series_requests, transport=transport, cache_dir=cache_dir)
 
-def pull_bbg_data(end_date=END_DATE):
-    
     bbg_df = pd.DataFrame()
-    bbg_df['dividend yield'] = blp.bdh("SPX Index","EQY_DVD_YLD_12m", START_DATE, end_date)[("SPX Index","EQY_DVD_YLD_12m")]
-    
-    bbg_df['index'] = blp.bdh("SPX Index","px_last", START_DATE, end_date)[("SPX Index","px_last")]
-    
-    bbg_df['futures'] = pd.concat([blp.bdh("SP1 Index","px_last", START_DATE, "1997-08-31")[("SP1 Index","px_last")],
-                                    blp.bdh("ES1 Index","px_last", "1997-09-30", end_date)[("ES1 Index","px_last")]])
-    
+    bbg_df['dividend yield'] = data[("SPX Index", "EQY_DVD_YLD_12m")]
+
+    bbg_df['index'] = data[("SPX Index", "px_last")]
+
+    bbg_df['futures'] = pd.concat([data[("SP1 Index", "px_last")],
+                                    data[("ES1 Index", "px_last")]])
+
     bbg_df.index.name = 'Date'
 
     return bbg_df
 
 
 if __name__ == "__main__":
-    from xbbg import blp
     df = pull_bbg_data(end_date=END_DATE)
     path = Path(DATA_DIR) / "bloomberg.parquet"
-    df.to_parquet(path)
\ No newline at end of file
+    df.to_parquet(path)
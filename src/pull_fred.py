@@ -1,13 +1,23 @@
-import pandas_datareader.data as web
 import pandas as pd
 import numpy as np
 
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
 from pathlib import Path
+from decouple import strtobool
+
+import http_client
+import http_replay
 from settings import config
 
 DATA_DIR = Path(config("DATA_DIR"))
 START_DATE = config("START_DATE")
 END_DATE = config("END_DATE")
+# Run as `python pull_fred.py --INCREMENTAL=True` to only pull recent observations
+INCREMENTAL = config("INCREMENTAL", default=False, cast=strtobool)
+
+FRED_CSV_URL = "https://fred.stlouisfed.org/graph/fredgraph.csv"
 
 
 series_to_pull = {
@@ -79,30 +89,90 @@ manual_ONRRP_cntypty_limits = {  # in $ Billions
 }
 
 
-def pull_fred(start_date=START_DATE, end_date=END_DATE, ffill=True):
+millions_to_billions = ["TREAST", "GFDEBTN", "WALCL", "WSDONTL"]
+
+# forward_fill = ['DISCOUNT', 'OBFR', 'DPCREDIT', 'TREAST', 'TOTRESNS']
+forward_fill = [
+    "OBFR",
+    "DPCREDIT",
+    "TREAST",
+    "TOTRESNS",
+    "WTREGEN",
+    "WALCL",
+    "CURRCIR",
+    "RRPONTSYAWARD",
+    "WSDONTL",
+]
+
+
+def pull_fred_series(series, start_date=START_DATE, end_date=END_DATE):
+    """
+    Pull a single FRED series. The date range is passed to FRED (`cosd`/`coed`)
+    so that only the requested observations are downloaded.
+    """
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+    params = {
+        "id": series,
+        "cosd": f"{start_date:%Y-%m-%d}",
+        "coed": f"{end_date:%Y-%m-%d}",
+    }
+    response = http_client.get_session().get(FRED_CSV_URL, params=params)
+    response.raise_for_status()
+    df = pd.read_csv(
+        StringIO(response.text),
+        index_col=0,
+        parse_dates=True,
+        header=None,
+        skiprows=1,
+        names=["DATE", series],
+        na_values=".",
+    )
+    return df.truncate(start_date, end_date)
+
+
+def _pull_fred_series_list(series_list, start_dates, end_date, max_workers=8):
+    """Pull several series in parallel, each from its own start date."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        df_list = list(
+            executor.map(
+                lambda args: pull_fred_series(*args, end_date=end_date),
+                zip(series_list, start_dates),
+            )
+        )
+    return df_list
+
+
+def pull_fred(start_date=START_DATE, end_date=END_DATE, ffill=True, max_workers=8):
     """
     Lookup series code, e.g., like this:
     https://fred.stlouisfed.org/series/RPONTSYD
     """
-    df = web.DataReader(list(series_to_pull.keys()), "fred", start_date, end_date)
+    series_list = list(series_to_pull.keys())
+    df_list = _pull_fred_series_list(
+        series_list, [start_date] * len(series_list), end_date, max_workers
+    )
+    df = pd.concat(df_list, axis=1, join="outer")
+    return clean_fred(df, ffill=ffill)
+
 
-    millions_to_billions = ["TREAST", "GFDEBTN", "WALCL", "WSDONTL"]
+def clean_fred(df, ffill=True, seed=None):
+    """
+    Convert units, forward fill, and construct the derived series
+    (`Gen_IORB`, `ONRRP_CTPY_LIMIT`, `ONRP_AGG_LIMIT`) from raw FRED data.
+
+    `seed` is an optional one-row frame with the last already-cleaned
+    observation preceding `df`, e.g., the last row kept from `fred.parquet`.
+    Forward fills are carried over from it, so a tail of new observations
+    can be cleaned without the full history. The seed row is not returned.
+    """
     for s in millions_to_billions:
         df[s] = df[s] / 1_000
 
-    # forward_fill = ['DISCOUNT', 'OBFR', 'DPCREDIT', 'TREAST', 'TOTRESNS']
+    if seed is not None:
+        df = pd.concat([seed, df])
+
     if ffill:
-        forward_fill = [
-            "OBFR",
-            "DPCREDIT",
-            "TREAST",
-            "TOTRESNS",
-            "WTREGEN",
-            "WALCL",
-            "CURRCIR",
-            "RRPONTSYAWARD",
-            "WSDONTL",
-        ]
         for s in forward_fill:
             df[s] = df[s].ffill()
 
@@ -114,23 +184,165 @@ def pull_fred(start_date=START_DATE, end_date=END_DATE, ffill=True):
     df["Gen_IORB"] = df["IORB"].fillna(df["IOER"])
     # df['Gen_DISCOUNT'] = df['DPCREDIT'].fillna(df['DISCOUNT'])
 
-    df["ONRRP_CTPY_LIMIT"] = np.nan
+    limit_cols = ["ONRRP_CTPY_LIMIT", "ONRP_AGG_LIMIT"]
+    df[limit_cols] = np.nan
+    if seed is not None:
+        df.loc[seed.index, limit_cols] = seed[limit_cols].values
+        last_seeded = seed.index[-1]
+    else:
+        last_seeded = pd.Timestamp.min
+
     for key in manual_ONRRP_cntypty_limits.keys():
         date = pd.to_datetime(key)
-        df.loc[date, "ONRRP_CTPY_LIMIT"] = manual_ONRRP_cntypty_limits[key]
+        if date > last_seeded:
+            df.loc[date, "ONRRP_CTPY_LIMIT"] = manual_ONRRP_cntypty_limits[key]
     df["ONRRP_CTPY_LIMIT"] = df["ONRRP_CTPY_LIMIT"].ffill()
 
-    df["ONRP_AGG_LIMIT"] = np.nan
-    df.loc["2021-Jul-28", "ONRP_AGG_LIMIT"] = 500
+    if pd.Timestamp("2021-Jul-28") > last_seeded:
+        df.loc["2021-Jul-28", "ONRP_AGG_LIMIT"] = 500
     df["ONRP_AGG_LIMIT"] = df["ONRP_AGG_LIMIT"].ffill()
 
     df_focused = df.drop(columns=["IORR", "IOER", "IORB"])
+    if seed is not None:
+        df_focused = df_focused.iloc[len(seed) :]
     # df_focused.isna().sum()
     # df_focused['WTREGEN'].plot()
     # df_focused['WTREGEN'].ffill().plot()
     return df_focused
 
 
+def _shard_path(series, data_dir=DATA_DIR):
+    return Path(data_dir) / "fred_series" / f"{series}.parquet"
+
+
+def update_fred_shards(
+    series_list=None,
+    data_dir=DATA_DIR,
+    end_date=None,
+    max_age_hours=12,
+    lookback_days=45,
+    max_workers=8,
+    full=False,
+):
+    """
+    Keep one raw parquet shard per FRED series under `data_dir/fred_series`.
+
+    Missing shards are pulled from `START_DATE`. Shards written more than
+    `max_age_hours` ago are refreshed by pulling from `lookback_days` before
+    their last observation and splicing the result on. Fresh shards are left
+    alone. With `full=True`, every shard is pulled again from `START_DATE`,
+    so that revisions to older history are picked up. Pulls run in parallel.
+    Returns the list of series that were pulled.
+    """
+    if series_list is None:
+        series_list = list(series_to_pull.keys())
+    if end_date is None:
+        end_date = pd.Timestamp.today().strftime("%Y-%m-%d")
+    _shard_path("", data_dir).parent.mkdir(parents=True, exist_ok=True)
+
+    to_pull, start_dates, stored = [], [], {}
+    for series in series_list:
+        path = _shard_path(series, data_dir)
+        if full or not path.exists():
+            to_pull.append(series)
+            start_dates.append(START_DATE)
+            continue
+        age_hours = (time.time() - path.stat().st_mtime) / 3600
+        if age_hours < max_age_hours:
+            continue
+        df = pd.read_parquet(path)
+        last_obs = df[series].last_valid_index()
+        if last_obs is None:
+            start_date = START_DATE
+        else:
+            start_date = last_obs - pd.Timedelta(days=lookback_days)
+        to_pull.append(series)
+        start_dates.append(start_date)
+        stored[series] = df.loc[df.index < start_date]
+
+    df_list = _pull_fred_series_list(to_pull, start_dates, end_date, max_workers)
+    for series, df in zip(to_pull, df_list):
+        if series in stored:
+            df = pd.concat([stored[series], df])
+        df.to_parquet(_shard_path(series, data_dir))
+    return to_pull
+
+
+def load_fred_shards(series_list=None, data_dir=DATA_DIR):
+    """
+    Assemble the raw (uncleaned) wide FRED frame from the per-series shards.
+    """
+    if series_list is None:
+        series_list = list(series_to_pull.keys())
+    df_list = [pd.read_parquet(_shard_path(s, data_dir)) for s in series_list]
+    return pd.concat(df_list, axis=1, join="outer")
+
+
+def pull_fred_from_shards(
+    data_dir=DATA_DIR, start_date=START_DATE, end_date=None, ffill=True, **kwargs
+):
+    """
+    Same output as `pull_fred`, but built from the shards in `data_dir`, which
+    are first brought up to date with `update_fred_shards`. Only missing or
+    stale series touch the network, so adding a series to `series_to_pull`
+    costs one pull. Extra keyword arguments go to `update_fred_shards`; pass
+    `full=True` to pull every series again in full.
+    """
+    update_fred_shards(data_dir=data_dir, end_date=end_date, **kwargs)
+    df = load_fred_shards(data_dir=data_dir)
+    df = df.loc[pd.Timestamp(start_date) : end_date]
+    return clean_fred(df, ffill=ffill)
+
+
+def update_fred(data_dir=DATA_DIR, end_date=None, lookback_days=45, ffill=True):
+    """
+    Refresh `fred.parquet` by recomputing only the most recent observations.
+
+    The per-series shards are first brought up to date with
+    `update_fred_shards`. The last stored observation of each series is then
+    looked up in the existing `fred.parquet`, and each series is refreshed
+    from `lookback_days` before its own last observation, as in
+    `update_fred_shards`, so a lagging quarterly series does not widen the
+    window of the daily ones. The rows from the earliest of those dates
+    onward are cleaned again with `clean_fred`, seeded from the last row
+    kept, and within them each series keeps its stored values before its own
+    window. Falls back to a full rebuild from the shards if the file does not
+    exist or is missing one of the series in `series_to_pull`.
+    """
+    if end_date is None:
+        end_date = pd.Timestamp.today().strftime("%Y-%m-%d")
+    update_fred_shards(data_dir=data_dir, end_date=end_date, lookback_days=lookback_days)
+
+    file_path = Path(data_dir) / "fred.parquet"
+    if not file_path.exists():
+        return pull_fred_from_shards(data_dir, end_date=end_date, ffill=ffill)
+
+    df_stored = pd.read_parquet(file_path).sort_index()
+    # IORR, IOER, and IORB are dropped after cleaning; Gen_IORB tracks them.
+    tracked = [s for s in series_to_pull if s not in ["IORR", "IOER", "IORB"]]
+    tracked = tracked + ["Gen_IORB"]
+    if any(s not in df_stored.columns for s in tracked):
+        return pull_fred_from_shards(data_dir, end_date=end_date, ffill=ffill)
+
+    last_obs = df_stored[tracked].apply(pd.Series.last_valid_index)
+    # Series without any stored observation are redone from the start
+    series_starts = pd.to_datetime(last_obs).fillna(df_stored.index[0])
+    series_starts = series_starts - pd.Timedelta(days=lookback_days)
+    window_start = series_starts.min()
+    df_head = df_stored.loc[df_stored.index < window_start]
+
+    df_raw = load_fred_shards(data_dir=data_dir).loc[window_start:end_date]
+    seed = df_head.iloc[[-1]] if len(df_head) else None
+    df_tail = clean_fred(df_raw, ffill=ffill, seed=seed)[df_stored.columns]
+    stored_tail = df_stored.loc[df_stored.index >= window_start]
+    for series, series_start in series_starts.items():
+        keep = stored_tail.index[stored_tail.index < series_start]
+        keep = keep.intersection(df_tail.index)
+        df_tail.loc[keep, series] = stored_tail.loc[keep, series]
+    df = pd.concat([df_head, df_tail])
+    return df
+
+
 def load_fred(data_dir=DATA_DIR):
     """
     Must first run this module as main to pull and save data.
@@ -150,7 +362,12 @@ if __name__ == "__main__":
 
     today = pd.Timestamp.today().strftime("%Y-%m-%d")
     end_date = today
-    df = pull_fred(START_DATE, end_date)
+    with http_replay.http_fixtures():
+        if INCREMENTAL:
+            df = update_fred(DATA_DIR, end_date=end_date)
+        else:
+            # A full refresh, so that revisions to the whole history are kept
+            df = pull_fred_from_shards(DATA_DIR, START_DATE, end_date, full=True)
     filedir = Path(DATA_DIR) 
     filedir.mkdir(parents=True, exist_ok=True)
     df.to_parquet(filedir / "fred.parquet")
@@ -7,17 +7,38 @@ import pandas as pd
 import numpy as np
 
 import os
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
 from pathlib import Path
+from decouple import strtobool
+
+import http_client
+import http_replay
 from settings import config
 
-def pull_series_from_ofr_api(mnemonic=None):
+# Run as `python pull_ofr_api_data.py --INCREMENTAL=True` to only pull recent observations
+INCREMENTAL = config("INCREMENTAL", default=False, cast=strtobool)
+
+OFR_API_URL = 'https://data.financialresearch.gov/v1/series/timeseries'
+
+
+def pull_series_from_ofr_api(mnemonic=None, session=None, start_date=None):
     """
     An example:
     https://data.financialresearch.gov/v1/series/timeseries?mnemonic=REPO-TRI_AR_TOT-F
+
+    If `start_date` is given, the API only returns observations on or after it.
+    Requests go through the shared pooled session from `http_client`, which
+    handles keep-alive, timeouts, retries, and per-host limits.
     """
-    df = pd.read_json(
-        f'https://data.financialresearch.gov/v1/series/timeseries?mnemonic={mnemonic}',
-                )
+    if session is None:
+        session = http_client.get_session()
+    params = {'mnemonic': mnemonic}
+    if start_date is not None:
+        params['start_date'] = pd.Timestamp(start_date).strftime('%Y-%m-%d')
+    response = session.get(OFR_API_URL, params=params)
+    response.raise_for_status()
+    df = pd.read_json(StringIO(response.text))
     
     df.columns=['Date', mnemonic]
     df['Date'] = pd.to_datetime(df['Date'])
@@ -41,18 +62,113 @@ series_descriptions = {
     'FNYR-TGCR-A':'Tri-Party General Collateral Rate',
 }
 
-def pull_series_list(series_list = list(series_descriptions.keys())):
-    df_list = []
+def _session_with(retries=None, backoff=None, min_interval=None):
+    """
+    The shared pooled session or, if any of `retries`, `backoff`, or
+    `min_interval` is given, a new `PooledSession` with those settings.
+    """
+    settings = {
+        "retries": retries,
+        "backoff": backoff,
+        "min_interval": min_interval,
+    }
+    settings = {k: v for k, v in settings.items() if v is not None}
+    if not settings:
+        return http_client.get_session()
+    return http_client.PooledSession(**settings)
+
+
+def pull_series_list(
+    series_list = list(series_descriptions.keys()),
+    max_workers=8,
+    retries=None,
+    backoff=None,
+    min_interval=None,
+    session=None,
+):
+    """
+    Pull each mnemonic in `series_list` and concatenate them column-wise.
+
+    Requests run on a thread pool of at most `max_workers` threads
+    (`max_workers=1` pulls sequentially), sharing one pooled session (see
+    `http_client.py` for retries, timeouts, and per-host limits). Columns come
+    back in the order of `series_list`.
+
+    By default that is the shared session. With `retries`, `backoff`, or
+    `min_interval` given, a session of its own retries failed requests up to
+    `retries` times with exponential backoff starting at `backoff` seconds,
+    and spaces requests to the same host at least `min_interval` seconds
+    apart.
+    """
+    if session is None:
+        session = _session_with(retries, backoff, min_interval)
+
+    def _pull(mnemonic):
+        return pull_series_from_ofr_api(mnemonic=mnemonic, session=session)
+
+    if max_workers <= 1:
+        df_list = [_pull(s) for s in series_list]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            df_list = list(executor.map(_pull, series_list))
+    df = pd.concat(df_list, axis=1)
+    return df
+
+def update_series_list(
+    series_list = list(series_descriptions.keys()),
+    data_dir=None,
+    overlap_days=14,
+    max_workers=8,
+    session=None,
+):
+    """
+    Refresh ofr_public_repo_data.parquet by pulling only recent observations.
+
+    For each mnemonic, the API is asked only for observations from
+    `overlap_days` before its last stored date onward (to pick up revisions
+    to preliminary values), and these replace the stored values from that
+    date on. Mnemonics not yet in the file are pulled in full, and if the file
+    does not exist this is the same as `pull_series_list`.
+    """
+    if data_dir is None:
+        data_dir = config("DATA_DIR")
+    path = Path(data_dir) / 'ofr_public_repo_data.parquet'
+    if not path.exists():
+        return pull_series_list(series_list, max_workers=max_workers, session=session)
+    if session is None:
+        session = http_client.get_session()
+
+    df_stored = pd.read_parquet(path)
+    start_dates = {}
     for s in series_list:
-        df = pull_series_from_ofr_api(mnemonic=s)
-        df_list.append(df)
+        last_obs = df_stored[s].last_valid_index() if s in df_stored else None
+        if last_obs is not None:
+            start_dates[s] = last_obs - pd.Timedelta(days=overlap_days)
+
+    def _pull(mnemonic):
+        return pull_series_from_ofr_api(
+            mnemonic=mnemonic, session=session, start_date=start_dates.get(mnemonic)
+        )
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        df_list = list(executor.map(_pull, series_list))
+
+    for i, s in enumerate(series_list):
+        if s in start_dates:
+            df_old = df_stored.loc[df_stored.index < start_dates[s], [s]]
+            df_list[i] = pd.concat([df_old, df_list[i]])
     df = pd.concat(df_list, axis=1)
     return df
 
+
 if __name__ == "__main__":
-    df = pull_series_list(series_list = list(series_descriptions.keys()))
-    
     DATA_DIR = config("DATA_DIR")
+    with http_replay.http_fixtures():
+        if INCREMENTAL:
+            df = update_series_list(list(series_descriptions.keys()), DATA_DIR)
+        else:
+            df = pull_series_list(series_list = list(series_descriptions.keys()))
+    
     filedir = Path(DATA_DIR)
     filedir.mkdir(parents=True, exist_ok=True)
     df.to_parquet(filedir / 'ofr_public_repo_data.parquet')
@@ -0,0 +1,156 @@
+"""
+Build Svensson (1994) yield curves at arbitrary maturities from the daily
+parameters published by the Federal Reserve with the Gurkaynak, Sack, and
+Wright (2007) yield curve. See `load_fed_yield_curve.py` for the data.
+
+The Fed only publishes the fitted curve at annual maturities (SVENY01-SVENY30),
+but it also publishes the parameters BETA0-BETA3, TAU1, and TAU2 for every
+date. With maturity n in years, the zero-coupon yield (continuously
+compounded, in percent) is
+
+    y(n) = BETA0
+           + BETA1 * (1 - exp(-n/TAU1)) / (n/TAU1)
+           + BETA2 * [(1 - exp(-n/TAU1)) / (n/TAU1) - exp(-n/TAU1)]
+           + BETA3 * [(1 - exp(-n/TAU2)) / (n/TAU2) - exp(-n/TAU2)]
+
+and the instantaneous forward rate is
+
+    f(n) = BETA0 + BETA1 * exp(-n/TAU1) + BETA2 * (n/TAU1) * exp(-n/TAU1)
+           + BETA3 * (n/TAU2) * exp(-n/TAU2).
+
+Every function here evaluates all dates at once: parameters are broadcast as
+(dates x 1) columns against a (1 x maturities) row, giving (dates x maturities)
+matrices without a Python loop over dates.
+
+For the early part of the sample, the Fed fit the Nelson-Siegel model, which
+has no second hump. When TAU2 is missing or not positive (or BETA3 is
+missing), the BETA3 term is set to zero.
+"""
+
+import numpy as np
+import pandas as pd
+
+import load_fed_yield_curve
+from settings import config
+
+DATA_DIR = config("DATA_DIR")
+
+PARAMETER_COLUMNS = ["BETA0", "BETA1", "BETA2", "BETA3", "TAU1", "TAU2"]
+
+
+def _as_parameter_columns(params):
+    """Split a (dates x 6) parameter array/frame into (dates x 1) columns."""
+    if isinstance(params, pd.DataFrame):
+        params = params[PARAMETER_COLUMNS].to_numpy(dtype=float)
+    params = np.atleast_2d(np.asarray(params, dtype=float))
+    beta0, beta1, beta2, beta3, tau1, tau2 = (params[:, [i]] for i in range(6))
+    no_second_hump = ~(np.isfinite(tau2) & (tau2 > 0)) | ~np.isfinite(beta3)
+    beta3 = np.where(no_second_hump, 0.0, beta3)
+    tau2 = np.where(no_second_hump, 1.0, tau2)
+    return beta0, beta1, beta2, beta3, tau1, tau2
+
+
+def _loadings(n, tau):
+    """Slope loading (1 - e^-x)/x and curvature loading, with x = n/tau."""
+    x = n / tau
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(x == 0, 1.0, -np.expm1(-x) / x)
+    return slope, slope - np.exp(-x)
+
+
+def zero_yields(params, maturities):
+    """
+    Zero-coupon yields (continuously compounded, percent) as a
+    (dates x maturities) array. `params` has the columns of PARAMETER_COLUMNS
+    in that order (or is a DataFrame with those columns); `maturities` are in
+    years.
+    """
+    beta0, beta1, beta2, beta3, tau1, tau2 = _as_parameter_columns(params)
+    n = np.asarray(maturities, dtype=float)[np.newaxis, :]
+    slope1, curvature1 = _loadings(n, tau1)
+    _, curvature2 = _loadings(n, tau2)
+    return beta0 + beta1 * slope1 + beta2 * curvature1 + beta3 * curvature2
+
+
+def instantaneous_forwards(params, maturities):
+    """Instantaneous forward rates (percent) as a (dates x maturities) array."""
+    beta0, beta1, beta2, beta3, tau1, tau2 = _as_parameter_columns(params)
+    n = np.asarray(maturities, dtype=float)[np.newaxis, :]
+    x1, x2 = n / tau1, n / tau2
+    return beta0 + beta1 * np.exp(-x1) + beta2 * x1 * np.exp(-x1) + beta3 * x2 * np.exp(-x2)
+
+
+def discount_factors(params, maturities):
+    """Zero-coupon bond prices per dollar of face as a (dates x maturities) array."""
+    n = np.asarray(maturities, dtype=float)[np.newaxis, :]
+    return np.exp(-zero_yields(params, maturities) / 100 * n)
+
+
+def par_yields(params, maturities, frequency=2):
+    """
+    Par yields (percent, compounded `frequency` times a year, semiannual by
+    default as in SVENPY) as a (dates x maturities) array.
+
+    Coupons are paid every 1/frequency years counting back from maturity, so
+    for maturities that are not a whole number of coupon periods the first
+    coupon is a short stub (accrued interest is ignored). The discount factors
+    are evaluated once on the set of distinct coupon dates across all
+    maturities and summed into annuities with a matrix product.
+    """
+    maturities = np.asarray(maturities, dtype=float)
+    n_coupons = np.maximum(np.ceil(maturities * frequency - 1e-9), 1).astype(int)
+    maturity_index = np.repeat(np.arange(len(maturities)), n_coupons)
+    periods_before_maturity = np.arange(n_coupons.sum()) - np.repeat(
+        np.cumsum(n_coupons) - n_coupons, n_coupons
+    )
+    coupon_times = maturities[maturity_index] - periods_before_maturity / frequency
+    unique_times, time_index = np.unique(coupon_times.round(10), return_inverse=True)
+
+    # Counts of each distinct coupon date in each maturity's coupon schedule
+    schedule = np.zeros((len(unique_times), len(maturities)))
+    np.add.at(schedule, (time_index, maturity_index), 1)
+    annuity = discount_factors(params, unique_times) @ schedule
+
+    discount = discount_factors(params, maturities)
+    return 100 * frequency * (1 - discount) / annuity
+
+
+def calc_svensson_curves(params, maturities):
+    """
+    Zero yields, instantaneous forwards, par yields, and discount factors for
+    every date in `params` (a DataFrame like `load_fed_yield_curve_parameters`)
+    at every maturity in `maturities` (years). Returns a dict of DataFrames
+    indexed by date with one column per maturity.
+
+    Example
+    -------
+    ```
+    params = load_fed_yield_curve.load_fed_yield_curve_parameters()
+    monthly = np.arange(1, 361) / 12
+    curves = calc_svensson_curves(params, monthly)
+    curves["zero"]  # (dates x 360) frame of zero yields
+    ```
+    """
+    params = params[PARAMETER_COLUMNS].dropna(subset=["BETA0", "BETA1", "BETA2", "TAU1"])
+    columns = pd.Index(np.asarray(maturities, dtype=float), name="maturity")
+    curves = {
+        "zero": zero_yields(params, maturities),
+        "forward": instantaneous_forwards(params, maturities),
+        "par": par_yields(params, maturities),
+        "discount": discount_factors(params, maturities),
+    }
+    return {
+        name: pd.DataFrame(values, index=params.index, columns=columns)
+        for name, values in curves.items()
+    }
+
+
+def load_svensson_curves(maturities, data_dir=DATA_DIR):
+    """Curves at `maturities` for every date in fed_yield_curve_parameters.parquet."""
+    params = load_fed_yield_curve.load_fed_yield_curve_parameters(data_dir=data_dir)
+    return calc_svensson_curves(params, maturities)
+
+
+if __name__ == "__main__":
+    curves = load_svensson_curves(np.arange(1, 361) / 12)
+    print(curves["zero"].iloc[-5:, 11::60])
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+import calc_CIZ_adjustment_factors
+import fake_wrds
+import wrds_tools
+
+
+def test_calc_cumulative_factors():
+    events = pd.DataFrame(
+        {
+            "permno": [2, 1, 1],
+            "disexdt": pd.to_datetime(["2020-01-10", "2021-06-01", "2020-03-15"]),
+            "disfacpr": [0.1, 0.5, 1.0],  # Spinoff, 3-for-2 and 2-for-1 splits
+            "disfacshr": [0.0, 0.5, 1.0],
+        }
+    )
+    df = pd.DataFrame(
+        {
+            "permno": [1, 1, 1, 1, 2, 2, 3],
+            "date": pd.to_datetime(
+                [
+                    "2020-01-31",
+                    "2020-03-14",
+                    "2020-03-15",  # Ex-date of the split
+                    "2021-12-31",
+                    "2019-12-31",
+                    "2020-01-31",
+                    "2020-01-31",  # No events
+                ]
+            ),
+        }
+    )
+    factors = calc_CIZ_adjustment_factors.calc_cumulative_factors(events, df)
+    np.testing.assert_allclose(factors["cfacpr_ciz"], [3, 3, 1.5, 1, 1.1, 1, 1])
+    np.testing.assert_allclose(factors["cfacshr_ciz"], [3, 3, 1.5, 1, 1, 1, 1])
+
+
+def test_rebuilt_factors_match_legacy_factors(tmp_path):
+    path = fake_wrds.generate_database(
+        tmp_path / "fake_wrds.duckdb", n_permnos=500, start_date="1990-01-01"
+    )
+    with fake_wrds.fake_wrds(path), wrds_tools.WRDSSession() as db:
+        events = calc_CIZ_adjustment_factors.pull_CIZ_distributions(db=db)
+        msf = db.raw_sql(
+            "SELECT permno, date, cfacpr, cfacshr FROM crsp.msf", date_cols=["date"]
+        )
+
+    assert len(events) > 0 and (events["disfacpr"] != 0).all()
+    msf = msf.join(calc_CIZ_adjustment_factors.calc_cumulative_factors(events, msf))
+    report = calc_CIZ_adjustment_factors.match_report(msf)
+    # The synthetic legacy factors are off for 3% of the securities
+    match_rates = report.xs("all", level="decade")["match_rate"]
+    assert ((match_rates > 0.9) & (match_rates < 1)).all()
+    assert report.loc[("cfacpr", "all"), "n_compared"] == len(msf)
+    assert (msf["cfacpr_ciz"] != 1).any()
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+
+import calc_CRSP_indices
+
+
+def _msf(n_permnos=300, seed=0):
+    rng = np.random.default_rng(seed)
+    months = pd.date_range("2000-11-30", "2003-06-30", freq="ME")
+    df = pd.DataFrame(
+        {
+            "permno": np.repeat(np.arange(10000, 10000 + n_permnos), len(months)),
+            "date": np.tile(months, n_permnos),
+        }
+    )
+    n = len(df)
+    df["exchcd"] = pd.array(rng.choice([1, 2, 3, 4], size=n), dtype="Int8")
+    df["ret"] = rng.normal(0.01, 0.1, size=n)
+    df["retx"] = df["ret"] - 0.002
+    df["market_cap"] = rng.lognormal(10, 2, size=n)
+    df.loc[rng.random(n) < 0.05, "ret"] = np.nan
+    # Gaps in the history, so that some lagged caps are missing
+    return df.sample(frac=0.9, random_state=seed)
+
+
+def _vw(ret, weights):
+    return (ret * weights).sum() / weights.sum() if len(ret) else np.nan
+
+
+def _expected(msf):
+    """Month-by-month reference implementation."""
+    msf = msf[msf["exchcd"].isin([1, 2, 3])].sort_values(["permno", "date"])
+    month = msf["date"].dt.to_period("M")
+    prev = msf.assign(month=month + 1)[["permno", "month", "market_cap"]]
+    msf = msf.assign(month=month).merge(
+        prev, on=["permno", "month"], how="left", suffixes=("", "_lag")
+    )
+    dec = msf[msf["date"].dt.month == 12].copy()
+    dec["decile"] = dec.groupby(dec["date"].dt.year)["market_cap"].transform(
+        lambda cap: (cap.rank(method="first") - 1) * 10 // len(cap) + 1
+    )
+    dec["year"] = dec["date"].dt.year + 1
+    msf = msf.assign(year=msf["date"].dt.year).merge(
+        dec[["permno", "year", "decile"]], on=["permno", "year"], how="left"
+    )
+
+    rows = []
+    for m, g in msf.groupby("month"):
+        row = {"caldt": g["date"].max(), "totcnt": g["ret"].notna().sum()}
+        for suffix, col in [("d", "ret"), ("x", "retx")]:
+            vw = g.dropna(subset=[col, "market_cap_lag"])
+            row[f"vwret{suffix}"] = _vw(vw[col], vw["market_cap_lag"])
+            row[f"ewret{suffix}"] = g[col].mean()
+        for d in range(1, 11):
+            vw = g[g["decile"] == d].dropna(subset=["ret", "market_cap_lag"])
+            row[f"decret{d}"] = _vw(vw["ret"], vw["market_cap_lag"])
+        rows.append(row)
+    return pd.DataFrame(rows).iloc[1:].reset_index(drop=True)
+
+
+def test_calc_CRSP_indices_matches_monthly_loop():
+    msf = _msf()
+    indices = calc_CRSP_indices.calc_CRSP_indices(msf)
+    expected = _expected(msf)
+    pd.testing.assert_frame_equal(
+        indices[expected.columns], expected, check_dtype=False
+    )
+    # Deciles start in 2001, from the caps of December 2000
+    decrets = indices.filter(like="decret")
+    assert decrets.iloc[0].isna().all() and decrets.iloc[1:].notna().all().all()
+
+
+def test_nyse_breakpoint_deciles_match_yearly_quantiles():
+    msf = _msf()
+    deciles = calc_CRSP_indices.assign_cap_deciles(msf, breakpoint_exchcds=[1])
+
+    dec = msf[msf["date"].dt.month == 12]
+    expected = {}
+    for year, g in dec.groupby(dec["date"].dt.year):
+        nyse = g.loc[g["exchcd"] == 1, "market_cap"]
+        breakpoints = nyse.quantile(np.arange(1, 10) / 10).to_numpy()
+        cap_deciles = np.searchsorted(breakpoints, g["market_cap"]) + 1
+        expected.update(zip(zip(g["permno"], [year + 1] * len(g)), cap_deciles))
+    expected = [expected.get(k, 0) for k in zip(msf["permno"], msf["date"].dt.year)]
+    np.testing.assert_array_equal(deciles, expected)
+    assert (deciles[msf["date"].dt.year.to_numpy() >= 2001] > 0).any()
+
+
+def test_tracking_error_report():
+    indices = calc_CRSP_indices.calc_CRSP_indices(_msf())
+    msix = indices.copy()
+    msix["vwretd"] += 0.001
+    report = calc_CRSP_indices.tracking_error_report(indices, msix)
+    assert np.isclose(report.loc["vwretd", "mean_diff"], -0.001)
+    assert np.allclose(report.loc["vwretd", "tracking_error"], 0)
+    assert np.allclose(report.loc["ewretd", ["mean_diff", "tracking_error"]], 0)
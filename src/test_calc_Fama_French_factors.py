@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+import calc_Fama_French_factors
+import fake_wrds
+import pull_CRSP_Compustat
+import wrds_tools
+
+
+def _reference_factors(comp, crsp, ccm):
+    """
+    The factors computed step by step with pandas merges, as in the WRDS
+    replication, to check the lazy pipeline against.
+    """
+    comp = comp.assign(gvkey=comp["gvkey"].astype(str), year=comp["datadate"].dt.year)
+    ps = comp["pstkrv"].fillna(comp["pstkl"]).fillna(comp["pstk"]).fillna(0)
+    comp["be"] = comp["seq"] + comp["txditc"].fillna(0) - ps
+    comp["be"] = comp["be"].where(comp["be"] > 0)
+    comp = comp.sort_values(["gvkey", "datadate"])
+    comp = comp.groupby(["gvkey", "year"], as_index=False).last()
+    comp["count"] = comp.groupby("gvkey").cumcount()
+
+    crsp = crsp[
+        (crsp["sharetype"] == "NS")
+        & (crsp["securitytype"] == "EQTY")
+        & (crsp["securitysubtype"] == "COM")
+        & (crsp["usincflg"] == "Y")
+        & crsp["issuertype"].isin(["ACOR", "CORP"])
+        & crsp["primaryexch"].isin(["N", "A", "Q"])
+        & (crsp["conditionaltype"] == "RW")
+        & (crsp["tradingstatusflg"] == "A")
+    ].copy()
+    crsp["jdate"] = crsp["mthcaldt"] + pd.offsets.MonthEnd(0)
+    crsp["me"] = crsp["mthprc"].abs() * crsp["shrout"]
+    by_permco = crsp.groupby(["jdate", "permco"])["me"]
+    crsp["me_permco"] = by_permco.transform("sum")
+    crsp = crsp.loc[by_permco.idxmax()]
+    crsp["me"] = crsp["me_permco"]
+    crsp = crsp.sort_values(["permno", "jdate"])
+    crsp["lme"] = crsp.groupby("permno")["me"].shift(1)
+    crsp["lme"] = crsp["lme"].fillna(crsp["me"] / (1 + crsp["mthretx"]))
+    crsp["ffyear"] = (crsp["jdate"] + pd.offsets.MonthEnd(-6)).dt.year
+
+    december = crsp[crsp["jdate"].dt.month == 12][["permno", "jdate", "me"]]
+    december = december.assign(year=december["jdate"].dt.year + 1)
+    june = crsp[crsp["jdate"].dt.month == 6].assign(year=lambda d: d["jdate"].dt.year)
+    june = june.merge(
+        december[["permno", "year", "me"]], on=["permno", "year"], suffixes=("", "_dec")
+    )
+    june = june.merge(ccm, on="permno")
+    june = june[
+        (june["linkdt"] <= june["jdate"])
+        & (june["jdate"] <= june["linkenddt"].fillna(pd.Timestamp.max))
+    ]
+    june = june.assign(gvkey=june["gvkey"].astype(str), fyear=june["year"] - 1)
+    june = june.merge(
+        comp[["gvkey", "year", "be", "count"]],
+        left_on=["gvkey", "fyear"],
+        right_on=["gvkey", "year"],
+        suffixes=("", "_comp"),
+    )
+    june["beme"] = june["be"] * 1000 / june["me_dec"]
+    june = june[(june["beme"] > 0) & (june["me"] > 0) & (june["count"] >= 1)]
+
+    nyse = june[june["primaryexch"] == "N"].groupby("jdate")
+    breakpoints = pd.DataFrame(
+        {
+            "sz_median": nyse["me"].median(),
+            "bm30": nyse["beme"].quantile(0.3),
+            "bm70": nyse["beme"].quantile(0.7),
+        }
+    )
+    june = june.merge(breakpoints, left_on="jdate", right_index=True)
+    june["szport"] = np.where(june["me"] <= june["sz_median"], "S", "B")
+    june["bmport"] = np.select(
+        [june["beme"] <= june["bm30"], june["beme"] <= june["bm70"]], ["L", "M"], "H"
+    )
+
+    crsp = crsp.merge(
+        june[["permno", "year", "szport", "bmport"]].rename(columns={"year": "ffyear"}),
+        on=["permno", "ffyear"],
+    )
+    crsp = crsp[(crsp["lme"] > 0) & crsp["mthret"].notna()]
+    crsp["wret"] = crsp["mthret"] * crsp["lme"]
+    sums = crsp.groupby(["jdate", "szport", "bmport"])[["wret", "lme"]].sum()
+    returns = (sums["wret"] / sums["lme"]).unstack(["szport", "bmport"])
+    returns.columns = [sz + bm for sz, bm in returns.columns]
+    factors = pd.DataFrame(index=returns.index)
+    factors["smb"] = returns[["SL", "SM", "SH"]].mean(axis=1, skipna=False) - returns[
+        ["BL", "BM", "BH"]
+    ].mean(axis=1, skipna=False)
+    factors["hml"] = returns[["SH", "BH"]].mean(axis=1, skipna=False) - returns[
+        ["SL", "BL"]
+    ].mean(axis=1, skipna=False)
+    return factors.rename_axis("date").reset_index()
+
+
+def test_calc_Fama_French_factors_matches_reference(tmp_path):
+    path = fake_wrds.generate_database(
+        tmp_path / "fake_wrds.duckdb", n_permnos=300, start_date="1990-01-01"
+    )
+    with fake_wrds.fake_wrds(path), wrds_tools.WRDSSession() as db:
+        pull_CRSP_Compustat.pull_compustat_partitioned(
+            data_dir=tmp_path, db=db, start_date="1990-01-01"
+        )
+        pull_CRSP_Compustat.pull_CRSP_stock_ciz_partitioned(
+            data_dir=tmp_path, db=db, start_date="1990-01-01"
+        )
+        ccm = pull_CRSP_Compustat.pull_CRSP_Comp_Link_Table(db=db)
+        ff = pull_CRSP_Compustat.pull_Fama_French_factors(db=db)
+    ccm.to_parquet(tmp_path / "CRSP_Comp_Link_Table.parquet")
+
+    factors = calc_Fama_French_factors.calc_Fama_French_factors(data_dir=tmp_path)
+    assert factors["date"].dt.is_month_end.all()
+    assert factors["date"].is_monotonic_increasing
+    assert factors["smb"].notna().any() and factors["hml"].notna().any()
+
+    expected = _reference_factors(
+        pull_CRSP_Compustat.load_compustat(tmp_path),
+        pull_CRSP_Compustat.load_CRSP_stock_ciz(tmp_path),
+        ccm,
+    )
+    merged = factors.merge(expected, on="date", how="outer", suffixes=("", "_ref"))
+    assert len(merged) == len(factors) == len(expected)
+    for col in ["smb", "hml"]:
+        np.testing.assert_allclose(merged[col], merged[f"{col}_ref"], rtol=1e-10)
+
+    report = calc_Fama_French_factors.compare_with_Fama_French(factors, ff)
+    assert list(report.index) == ["smb", "hml"]
+    assert (report["n_months"] > 0).all()
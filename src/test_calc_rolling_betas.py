@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+import calc_rolling_betas
+
+
+def _panel(n_ids=40, n_months=100, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "permno": np.repeat(np.arange(10000, 10000 + n_ids), n_months),
+            "month": np.tile(np.arange(24000, 24000 + n_months), n_ids),
+        }
+    )
+    n = len(df)
+    df["x1"] = rng.normal(size=n)
+    df["x2"] = rng.normal(size=n)
+    df["y"] = 0.01 + 0.8 * df["x1"] - 0.5 * df["x2"] + rng.normal(size=n)
+    df.loc[rng.random(n) < 0.1, "y"] = np.nan
+    # Gaps in the histories, and the rows out of order
+    return df.sample(frac=0.8, random_state=seed)
+
+
+def _reference(df, row, window, min_obs):
+    """One least-squares fit for the window of a single row."""
+    w = df[
+        (df["permno"] == row["permno"])
+        & (df["month"] > row["month"] - window)
+        & (df["month"] <= row["month"])
+    ].dropna()
+    if np.isnan(row["y"]) or len(w) < min_obs:
+        return None
+    Z = np.column_stack([np.ones(len(w)), w["x1"], w["x2"]])
+    coef, *_ = np.linalg.lstsq(Z, w["y"], rcond=None)
+    resid = w["y"] - Z @ coef
+    ssr = resid @ resid
+    return {
+        "n_obs": len(w),
+        "alpha": coef[0],
+        "beta_x1": coef[1],
+        "beta_x2": coef[2],
+        "resid_vol": np.sqrt(ssr / (len(w) - 3)),
+        "r2": 1 - ssr / ((w["y"] - w["y"].mean()) ** 2).sum(),
+    }
+
+
+def test_rolling_regressions_matches_lstsq(monkeypatch):
+    # Small blocks, so that the panel is split across several
+    monkeypatch.setattr(calc_rolling_betas, "BLOCK_ROWS", 500)
+    df = _panel()
+    results = calc_rolling_betas.rolling_regressions(
+        df, "y", ["x1", "x2"], window=36, min_obs=12
+    )
+    assert results.index.equals(df.index)
+
+    n_fit = 0
+    for idx in df.sample(300, random_state=1).index:
+        expected = _reference(df, df.loc[idx], window=36, min_obs=12)
+        if expected is None:
+            assert results.loc[idx, ["alpha", "beta_x1", "r2"]].isna().all()
+            continue
+        n_fit += 1
+        np.testing.assert_allclose(
+            results.loc[idx, list(expected)].astype(float),
+            list(expected.values()),
+            rtol=1e-8,
+            atol=1e-10,
+        )
+    assert n_fit > 200
+
+
+def test_rolling_regressions_collinear_window():
+    df = _panel(n_ids=2, n_months=40)
+    # x2 does not vary over the first 30 months of every id
+    df.loc[df["month"] < 24030, "x2"] = 1.0
+    results = calc_rolling_betas.rolling_regressions(
+        df, "y", ["x1", "x2"], window=12, min_obs=6
+    )
+    early = (df["month"] < 24030) & df["y"].notna()
+    assert results.loc[early, "beta_x2"].isna().all()
+    assert results.loc[early, "n_obs"].gt(0).all()
+    late = (df["month"] >= 24045) & df["y"].notna()
+    assert results.loc[late, "beta_x2"].notna().all()
+
+
+def test_calc_rolling_betas():
+    rng = np.random.default_rng(0)
+    months = pd.date_range("2000-01-31", "2009-12-31", freq="ME")
+    ff = pd.DataFrame(
+        {
+            "date": months,
+            "mktrf": rng.normal(0.005, 0.04, len(months)),
+            "smb": rng.normal(0, 0.03, len(months)),
+            "hml": rng.normal(0, 0.03, len(months)),
+            "rf": 0.001,
+        }
+    )
+    betas = {10001: 1.5, 10002: 0.5}
+    crsp = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "permno": permno,
+                    # Last trading days, not month ends
+                    "mthcaldt": months - pd.Timedelta(days=1),
+                    "mthret": 0.001 + beta * ff["mktrf"],
+                }
+            )
+            for permno, beta in betas.items()
+        ]
+    )
+    result = calc_rolling_betas.calc_rolling_betas(crsp, ff, window=60, min_obs=24)
+    assert len(result) == len(crsp)
+    assert result["jdate"].dt.is_month_end.all()
+    assert (result.groupby("permno")["n_obs"].max() == 60).all()
+
+    fit = result.dropna(subset=["beta_capm"])
+    assert (fit["n_obs"] >= 24).all()
+    expected = fit["permno"].map(betas)
+    np.testing.assert_allclose(fit["beta_capm"], expected)
+    np.testing.assert_allclose(fit["beta_mkt"], expected)
+    np.testing.assert_allclose(fit["r2_capm"], 1)
+    np.testing.assert_allclose(fit[["beta_smb", "beta_hml"]], 0, atol=1e-10)
@@ -0,0 +1,53 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import http_client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    n_requests = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.n_requests += 1
+            first = cls.n_requests == 1
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.02)
+        body = b"unavailable" if first else b"ok"
+        self.send_response(503 if first else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with cls.lock:
+            cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+def test_pooled_session_retries_and_caps_connections_per_host():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    session = http_client.PooledSession(backoff=0, max_per_host=2)
+    try:
+        # The first response is a 503, which is retried transparently
+        assert session.get(url).text == "ok"
+
+        threads = [threading.Thread(target=session.get, args=(url,)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert _Handler.max_in_flight <= 2
+        assert _Handler.n_requests == 10
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,45 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_replay
+
+BODY = b"DATE,GDP\n2024-01-01,28000.5\n\xff raw bytes\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(BODY + self.path.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def test_record_then_replay_offline(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/series?id=GDP"
+
+    with http_replay.http_fixtures("record", tmp_path):
+        recorded = requests.get(url)
+    server.shutdown()
+    server.server_close()
+
+    with http_replay.http_fixtures("replay", tmp_path):
+        replayed = requests.get(url)
+        assert replayed.content == recorded.content == BODY + b"/series?id=GDP"
+        assert replayed.status_code == 200
+        assert replayed.headers["ETag"] == '"v1"'
+        assert replayed.text == recorded.text
+
+        with pytest.raises(http_replay.FixtureNotFoundError):
+            requests.get(url + "&cosd=2024-01-01")
+
+    assert requests.Session.send is http_replay._original_send
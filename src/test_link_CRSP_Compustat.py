@@ -0,0 +1,105 @@
+import pandas as pd
+
+import fake_wrds
+import link_CRSP_Compustat
+import pull_CRSP_Compustat
+import wrds_tools
+
+
+def _ccm():
+    return pd.DataFrame(
+        {
+            "gvkey": ["A", "B", "C", "D", "E"],
+            "permno": [1, 1, 1, 2, 3],
+            "linktype": ["LU", "LC", "LC", "LC", "LC"],
+            "linkprim": ["C", "P", "J", "P", "P"],
+            "linkdt": pd.to_datetime(
+                ["1990-01-01", "1995-01-01", "2001-01-01", "2000-01-01", "2010-01-01"]
+            ),
+            # A is superseded by the primary link B from 1995 to 1999 and
+            # picks up again after it, C overlaps A with a lower priority
+            "linkenddt": pd.to_datetime(
+                ["2005-12-31", "1999-12-31", "2008-12-31", None, "2012-06-30"]
+            ),
+        }
+    )
+
+
+def test_lookup_gvkey():
+    segments = link_CRSP_Compustat.link_segments(_ccm())
+    assert segments["gvkey"].tolist() == ["A", "B", "A", "C", "D", "E"]
+
+    df = pd.DataFrame(
+        {
+            "permno": [1, 1, 1, 1, 1, 1, 1, 2, 2, 3, 3, 4],
+            "date": pd.to_datetime(
+                [
+                    "1989-12-31",  # Before any link
+                    "1990-01-01",
+                    "1995-01-01",
+                    "1999-12-31",
+                    "2000-01-01",
+                    "2006-01-01",
+                    "2009-01-01",  # After all the links of permno 1
+                    "1999-12-31",
+                    "2099-12-31",  # Open-ended
+                    "2012-06-30",  # Last day of the link
+                    "2012-07-01",
+                    "2000-01-01",  # Not in the link table
+                ]
+            ),
+        }
+    )
+    gvkey = link_CRSP_Compustat.lookup_gvkey(df, segments)
+    expected = [None, "A", "B", "B", "A", "C", None, None, "D", "E", None, None]
+    assert gvkey.astype(object).where(gvkey.notna(), None).tolist() == expected
+    assert gvkey.index.equals(df.index)
+
+
+def test_link_segments_drops_links_that_end_before_they_start():
+    ccm = pd.concat(
+        [
+            _ccm(),
+            pd.DataFrame(
+                {
+                    "gvkey": ["F"],
+                    "permno": [1],
+                    "linktype": ["LC"],
+                    "linkprim": ["P"],
+                    "linkdt": pd.to_datetime(["2003-01-01"]),
+                    "linkenddt": pd.to_datetime(["2002-06-30"]),
+                }
+            ),
+        ],
+        ignore_index=True,
+    )
+    segments = link_CRSP_Compustat.link_segments(ccm)
+    pd.testing.assert_frame_equal(segments, link_CRSP_Compustat.link_segments(_ccm()))
+
+
+def test_lookup_gvkey_matches_merge_and_filter(tmp_path):
+    path = fake_wrds.generate_database(
+        tmp_path / "fake_wrds.duckdb", n_permnos=300, start_date="1990-01-01"
+    )
+    with fake_wrds.fake_wrds(path), wrds_tools.WRDSSession() as db:
+        ccm = pull_CRSP_Compustat.pull_CRSP_Comp_Link_Table(db=db)
+        crsp = db.raw_sql(
+            "SELECT permno, mthcaldt FROM crsp.msf_v2", date_cols=["mthcaldt"]
+        )
+    ccm.to_parquet(tmp_path / "CRSP_Comp_Link_Table.parquet")
+    segments = link_CRSP_Compustat.load_link_segments(tmp_path)
+    crsp["gvkey"] = link_CRSP_Compustat.lookup_gvkey(
+        crsp, segments, date_col="mthcaldt"
+    )
+
+    # The fake link table has one link per permno, so the merge is unambiguous
+    merged = crsp.drop(columns="gvkey").merge(ccm, on="permno")
+    merged = merged[
+        (merged["linkdt"] <= merged["mthcaldt"])
+        & (merged["mthcaldt"] <= merged["linkenddt"].fillna(pd.Timestamp.max))
+    ]
+    expected = crsp[["permno", "mthcaldt"]].merge(
+        merged[["permno", "mthcaldt", "gvkey"]], how="left"
+    )
+    assert crsp["gvkey"].notna().any()
+    assert crsp["gvkey"].astype(object).equals(expected["gvkey"].astype(object))
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+import load_fed_yield_curve
+
+
+def _fake_feds200628_csv(end_date="2024-03-29"):
+    """Bytes laid out like feds200628.csv: 9 lines of notes, header, rows."""
+    dates = pd.bdate_range("2024-01-02", end_date, name="Date")
+    columns = ["BETA0", "BETA1", "BETA2", "BETA3"]
+    columns += ["SVENY" + str(i).zfill(2) for i in range(1, 31)]
+    columns += ["TAU1", "TAU2"]
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        rng.uniform(1, 5, size=(len(dates), len(columns))).round(4),
+        index=dates,
+        columns=columns,
+    )
+    preamble = "".join(f"Note line {i}\n" for i in range(1, 10))
+    return (preamble + df.to_csv(date_format="%Y-%m-%d")).encode()
+
+
+class _FakeResponse:
+    def __init__(self, content=b"", status_code=200, headers=None):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+def test_parse_fed_yield_curve_after_date():
+    content = _fake_feds200628_csv()
+    df_full = load_fed_yield_curve.parse_fed_yield_curve(content)
+    assert list(df_full.columns) == load_fed_yield_curve.SVENY_COLUMNS
+
+    df_tail = load_fed_yield_curve.parse_fed_yield_curve(content, after="2024-02-15")
+    pd.testing.assert_frame_equal(df_tail, df_full.loc["2024-02-16":])
+
+
+def test_update_fed_yield_curve_conditional_get(tmp_path, monkeypatch):
+    requests_sent = []
+    responses = [
+        _FakeResponse(_fake_feds200628_csv("2024-02-29"), headers={"ETag": '"a"'}),
+        _FakeResponse(status_code=304),
+        _FakeResponse(_fake_feds200628_csv("2024-03-29"), headers={"ETag": '"b"'}),
+    ]
+
+    class _FakeSession:
+        def get(self, url, headers=None, **kwargs):
+            requests_sent.append(headers)
+            return responses.pop(0)
+
+    monkeypatch.setattr(load_fed_yield_curve.http_client, "get_session", _FakeSession)
+
+    assert load_fed_yield_curve.update_fed_yield_curve(tmp_path)
+    assert not load_fed_yield_curve.update_fed_yield_curve(tmp_path)
+    assert requests_sent[1]["If-None-Match"] == '"a"'
+    assert load_fed_yield_curve.update_fed_yield_curve(tmp_path)
+
+    df = load_fed_yield_curve.load_fed_yield_curve(tmp_path)
+    expected = load_fed_yield_curve.parse_fed_yield_curve(_fake_feds200628_csv())
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+
+
+def test_write_fed_yield_curve_parquet_matches_pandas(tmp_path):
+    content = _fake_feds200628_csv()
+    path = tmp_path / "fed_yield_curve.parquet"
+    n_rows = load_fed_yield_curve.write_fed_yield_curve_parquet(
+        content, path, block_size=1 << 12
+    )
+    df = pd.read_parquet(path)
+    expected = load_fed_yield_curve.parse_fed_yield_curve(content)
+    assert n_rows == len(expected)
+    pd.testing.assert_frame_equal(df, expected, check_freq=False)
+
+    csv_path = tmp_path / "feds200628.csv"
+    csv_path.write_bytes(content)
+    load_fed_yield_curve.write_fed_yield_curve_parquet(
+        str(csv_path), path, columns=["PARAMETERS", "SVENY10"]
+    )
+    df = pd.read_parquet(path)
+    assert list(df.columns) == ["BETA0", "BETA1", "BETA2", "BETA3", "TAU1", "TAU2", "SVENY10"]
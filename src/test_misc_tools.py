@@ -1,10 +1,19 @@
+import numpy as np
 import pandas as pd
+import polars as pl
 from misc_tools import (
     weighted_average,
     groupby_weighted_average,
     groupby_weighted_std,
     get_most_recent_quarter_end,
     get_next_quarter_start,
+    month_codes,
+    month_ends,
+    day_numbers,
+    panel_keys,
+    panel_key_periods,
+    month_codes_expr,
+    panel_keys_expr,
 )
 
 
@@ -80,3 +89,33 @@ def test_get_next_quarter_start():
     result = get_next_quarter_start(d)
     expected = pd.Timestamp("2020-01-01")
     assert result == expected
+
+
+def test_month_codes_and_month_ends():
+    dates = pd.to_datetime(["1959-01-01", "1999-12-31", "2000-02-29", "2024-03-15"])
+    codes = month_codes(dates)
+    assert codes.tolist() == [1959 * 12, 1999 * 12 + 11, 2000 * 12 + 1, 2024 * 12 + 2]
+    expected = pd.to_datetime(["1959-01-31", "1999-12-31", "2000-02-29", "2024-03-31"])
+    pd.testing.assert_index_equal(month_ends(codes), expected)
+
+
+def test_panel_keys():
+    ids = np.array([10001, 10001, 10002, 10002])
+    periods = day_numbers(pd.to_datetime(["1925-12-31", "2024-12-31"] * 2))
+    keys = panel_keys(ids, periods)
+    assert (np.diff(keys) > 0).all()
+    assert (panel_key_periods(keys) == periods).all()
+    # The last row of permno 10001 on or before a date
+    position = np.searchsorted(
+        keys, panel_keys(10001, day_numbers(pd.Timestamp("2000-01-01"))), "right"
+    )
+    assert position - 1 == 0
+
+
+def test_polars_keys_match_numpy_keys():
+    dates = pd.to_datetime(["1925-12-31", "1970-01-01", "2024-12-31"])
+    df = pl.DataFrame({"permno": [10001, 10002, 93436], "date": dates})
+    df = df.with_columns(month=month_codes_expr(pl.col("date")))
+    assert df["month"].to_list() == month_codes(dates).tolist()
+    keys = df.select(panel_keys_expr(pl.col("permno"), pl.col("month"))).to_series()
+    assert keys.to_list() == panel_keys(df["permno"], df["month"]).tolist()
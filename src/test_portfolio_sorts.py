@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import portfolio_sorts
+
+
+def _panel(n_permnos=200, seed=0):
+    rng = np.random.default_rng(seed)
+    months = pd.date_range("2000-01-31", "2002-12-31", freq="ME")
+    df = pd.DataFrame(
+        {
+            "permno": np.repeat(np.arange(10000, 10000 + n_permnos), len(months)),
+            "date": np.tile(months, n_permnos),
+        }
+    )
+    n = len(df)
+    df["primaryexch"] = rng.choice(["N", "A", "Q"], size=n)
+    # Rounded, so that some values tie with the breakpoints
+    df["me"] = rng.lognormal(5, 2, size=n).round(0)
+    df["beme"] = rng.lognormal(0, 0.5, size=n).round(2)
+    df["ret"] = rng.normal(0.01, 0.1, size=n)
+    df["lme"] = rng.lognormal(5, 2, size=n)
+    df.loc[rng.random(n) < 0.05, "beme"] = np.nan
+    df.loc[rng.random(n) < 0.05, "ret"] = np.nan
+    # No NASDAQ stocks to compute breakpoints from in the first month
+    first = df["date"] == months[0]
+    df.loc[first, "primaryexch"] = df.loc[first, "primaryexch"].replace("N", "Q")
+    return df.sample(frac=0.9, random_state=seed)
+
+
+def _reference_portfolios(g, col, quantiles, breakpoint_mask):
+    """One date at a time, as with `groupby(date).apply`."""
+    breakpoints = g.loc[breakpoint_mask.loc[g.index], col].dropna()
+    if breakpoints.empty:
+        return pd.Series(0, index=g.index)
+    cutoffs = breakpoints.quantile(quantiles).to_numpy()
+    ports = np.searchsorted(cutoffs, g[col].to_numpy(), side="left") + 1
+    return pd.Series(np.where(g[col].isna(), 0, ports), index=g.index)
+
+
+def test_assign_portfolios_matches_groupby_apply():
+    df = _panel()
+    nyse = df["primaryexch"] == "N"
+    for col, bins, quantiles in [
+        ("me", 10, np.arange(1, 10) / 10),
+        ("beme", [0.3, 0.7], [0.3, 0.7]),
+    ]:
+        ports = portfolio_sorts.assign_portfolios(
+            df, col, bins=bins, breakpoint_mask=nyse
+        )
+        expected = df.groupby("date", group_keys=False)[[col]].apply(
+            _reference_portfolios, col, quantiles, nyse
+        )
+        assert ports.name == f"{col}_port"
+        assert ports.index.equals(df.index)
+        assert (ports == expected.loc[df.index]).all()
+        # No breakpoints in the first month
+        assert (ports[df["date"] == df["date"].min()] == 0).all()
+
+
+def test_bivariate_sort():
+    df = _panel()
+    independent = portfolio_sorts.bivariate_sort(df, "me", "beme", bins=(2, 3))
+    assert (
+        independent["beme_port"]
+        == portfolio_sorts.assign_portfolios(df, "beme", bins=3)
+    ).all()
+
+    dependent = portfolio_sorts.bivariate_sort(
+        df, "me", "beme", bins=(2, 3), dependent=True
+    )
+    assert (dependent["me_port"] == independent["me_port"]).all()
+    expected = (
+        df.assign(me_port=dependent["me_port"])
+        .groupby(["date", "me_port"], group_keys=False)[["beme"]]
+        .apply(
+            _reference_portfolios,
+            "beme",
+            np.array([1, 2]) / 3,
+            pd.Series(True, index=df.index),
+        )
+    )
+    assert (dependent["beme_port"] == expected.loc[df.index]).all()
+    assert set(dependent["beme_port"].unique()) == {0, 1, 2, 3}
+
+
+def test_portfolio_returns():
+    df = _panel()
+    df = df.join(portfolio_sorts.bivariate_sort(df, "me", "beme", bins=(2, 3)))
+    vw = portfolio_sorts.portfolio_returns(
+        df, ["me_port", "beme_port"], ret_col="ret", weight_col="lme"
+    )
+    ew = portfolio_sorts.portfolio_returns(df, ["me_port", "beme_port"])
+
+    valid = df[(df["me_port"] > 0) & (df["beme_port"] > 0) & df["ret"].notna()]
+    groups = valid.assign(wret=valid["ret"] * valid["lme"]).groupby(
+        ["date", "me_port", "beme_port"]
+    )
+    expected = (groups["wret"].sum() / groups["lme"].sum()).rename("ret")
+    expected = expected.reset_index()
+    assert len(vw) == len(expected) == 36 * 6
+    np.testing.assert_allclose(vw["ret"], expected["ret"])
+    assert (vw[["me_port", "beme_port"]].to_numpy() >= 1).all()
+    np.testing.assert_allclose(ew["ret"], groups["ret"].mean().to_numpy())
+    assert (ew["n"] == groups.size().to_numpy()).all()
+
+
+def test_invalid_bins():
+    df = _panel(n_permnos=10)
+    for bins in [1, [], [0.7, 0.3], [0.5, 1.0]]:
+        with pytest.raises(ValueError):
+            portfolio_sorts.assign_portfolios(df, "me", bins=bins)
@@ -0,0 +1,29 @@
+import pandas as pd
+
+import pull_CRSP_Compustat
+
+
+def test_load_link_table_keeps_links_active_in_window(tmp_path):
+    ccm = pd.DataFrame(
+        {
+            "gvkey": ["001", "002", "003", "004"],
+            "permno": [1, 2, 3, 4],
+            "linktype": "LC",
+            "linkprim": "P",
+            "linkdt": pd.to_datetime(
+                ["1990-01-01", "2005-01-01", "1995-01-01", "2012-01-01"]
+            ),
+            "linkenddt": pd.to_datetime(["1999-12-31", None, "2010-06-30", None]),
+        }
+    )
+    ccm.to_parquet(tmp_path / "CRSP_Comp_Link_Table.parquet")
+
+    df = pull_CRSP_Compustat.load_CRSP_Comp_Link_Table(
+        tmp_path, start_date="2008-01-01", end_date="2010-12-31"
+    )
+    assert df["gvkey"].tolist() == ["002", "003"]
+
+    df = pull_CRSP_Compustat.load_CRSP_Comp_Link_Table(
+        tmp_path, columns=["permno"], permnos=[1, 4], backend="polars"
+    )
+    assert df["permno"].to_list() == [1, 4]
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import fake_wrds
+import pull_CRSP_daily
+import wrds_tools
+
+
+def _daily(n_permnos=20, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range("2019-12-20", "2020-03-10")
+    dsf = pd.DataFrame(
+        {
+            "permno": np.repeat(np.arange(10000, 10000 + n_permnos), len(days)),
+            "dlycaldt": np.tile(days, n_permnos),
+            "dlyret": rng.normal(0.0005, 0.02, size=n_permnos * len(days)),
+        }
+    )
+    dsf.loc[rng.random(len(dsf)) < 0.05, "dlyret"] = np.nan
+    # A security with no returns at all in February
+    february = (dsf["permno"] == 10003) & (dsf["dlycaldt"].dt.month == 2)
+    dsf.loc[february, "dlyret"] = np.nan
+    return dsf.sample(frac=1, random_state=seed)  # Not sorted
+
+
+def test_aggregate_daily_returns_matches_groupby_apply():
+    dsf = _daily()
+    for freq in ["M", "W-FRI"]:
+        df = pull_CRSP_daily.aggregate_daily_returns(dsf, freq=freq)
+
+        period = dsf["dlycaldt"].dt.to_period(freq)
+        grouped = dsf.groupby(["permno", period])
+        expected = pd.DataFrame(
+            {
+                "dlycaldt": grouped["dlycaldt"].max(),
+                "ret": grouped["dlyret"].apply(
+                    lambda r: (1 + r.dropna()).prod() - 1 if r.notna().any() else np.nan
+                ),
+                "vol": grouped["dlyret"].std(),
+                "n_days": grouped["dlyret"].count(),
+            }
+        ).reset_index(level="permno")
+        pd.testing.assert_frame_equal(
+            df, expected.reset_index(drop=True), check_dtype=False
+        )
+
+
+def test_pull_CRSP_daily_file_in_permno_buckets(tmp_path):
+    path = fake_wrds.generate_database(
+        tmp_path / "fake_wrds.duckdb",
+        n_permnos=40,
+        n_daily_permnos=10,
+        start_date="2018-01-01",
+        end_date="2020-12-31",
+    )
+    kwargs = dict(start_date="2018-01-01", end_date="2020-12-31", batch_size=5_000)
+    with fake_wrds.fake_wrds(path), wrds_tools.WRDSSession() as db:
+        pull_CRSP_daily.pull_CRSP_daily_file_partitioned(
+            tmp_path, n_buckets=3, db=db, **kwargs
+        )
+        expected = db.raw_sql(
+            "SELECT permno, dlycaldt, dlyret FROM crsp.dsf_v2", date_cols=["dlycaldt"]
+        )
+
+    assert len(wrds_tools.partition_files(tmp_path / "CRSP_daily_stock_ciz", 2019)) == 3
+    dsf = pull_CRSP_daily.load_CRSP_daily_file(tmp_path)
+    assert dsf["permno"].dtype == "int32"
+    dsf = dsf.sort_values(["permno", "dlycaldt"], ignore_index=True)
+    expected = expected.sort_values(["permno", "dlycaldt"], ignore_index=True)
+    pd.testing.assert_frame_equal(dsf[expected.columns], expected, check_dtype=False)
+
+    monthly = pull_CRSP_daily.aggregate_CRSP_daily_file(tmp_path)
+    assert monthly["n_days"].sum() == expected["dlyret"].notna().sum()
+
+
+def test_aggregate_CRSP_daily_file_needs_a_pulled_dataset(tmp_path):
+    with pytest.raises(FileNotFoundError, match="pull_CRSP_daily_file_partitioned"):
+        pull_CRSP_daily.aggregate_CRSP_daily_file(tmp_path)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+
+import pull_CRSP_stock
+
+nan = np.nan
+
+
+def _delistings():
+    # One row per case: (dlstcd, dlret, ret) -> expected (dlret, ret)
+    cases = pd.DataFrame(
+        [
+            (nan, nan, 0.05, nan, 0.05),  # Not delisted
+            (nan, nan, nan, nan, nan),  # Missing return, not delisted
+            (100, nan, nan, nan, nan),  # Active code: no delisting return
+            (231, 0.1, nan, 0.1, 0.1),  # Delisting return given
+            (231, nan, nan, -1.0, -1.0),  # Merger, no delisting return
+            (331, nan, 0.02, -1.0, 0.02),  # Return given: kept
+            (500, nan, nan, -0.3, -0.3),  # Performance code
+            (560, nan, nan, -0.3, -0.3),
+            (574, nan, nan, -0.3, -0.3),
+            (575, nan, nan, -1.0, -1.0),  # Just past the 551-574 range
+            (584, -0.5, nan, -0.5, -0.5),
+        ],
+        columns=["dlstcd", "dlret", "ret", "expected_dlret", "expected_ret"],
+    )
+    cases["dlretx"] = cases["dlret"]
+    cases["retx"] = cases["ret"]
+    return cases
+
+
+def test_apply_delisting_returns():
+    cases = _delistings()
+    df = pull_CRSP_stock.apply_delisting_returns(cases.copy())
+    for suffix in ["", "x"]:
+        np.testing.assert_array_equal(df[f"dlret{suffix}"], cases["expected_dlret"])
+        np.testing.assert_array_equal(df[f"ret{suffix}"], cases["expected_ret"])
+
+    # Also once dlstcd has its declared nullable dtype
+    df = pull_CRSP_stock.apply_delisting_returns(
+        cases.astype({"dlstcd": "Int16"}).copy()
+    )
+    np.testing.assert_array_equal(df["ret"], cases["expected_ret"])
+
+
+def test_apply_delisting_returns_polars_matches_pandas():
+    rng = np.random.default_rng(0)
+    n = 10_000
+    codes = rng.choice([100, 231, 331, 500, 520, 552, 574, 580, 584, 587], size=n)
+    df = pd.DataFrame(
+        {
+            "dlstcd": np.where(rng.random(n) < 0.5, nan, codes),
+            "dlret": np.where(rng.random(n) < 0.5, nan, rng.normal(0, 0.2, n)),
+            "dlretx": np.where(rng.random(n) < 0.5, nan, rng.normal(0, 0.2, n)),
+            "ret": np.where(rng.random(n) < 0.5, nan, rng.normal(0, 0.1, n)),
+            "retx": np.where(rng.random(n) < 0.5, nan, rng.normal(0, 0.1, n)),
+        }
+    )
+    expected = pull_CRSP_stock.apply_delisting_returns(df.copy())
+    for frame in [pl.from_pandas(df), pl.from_pandas(df).lazy()]:
+        result = pull_CRSP_stock.apply_delisting_returns_polars(frame)
+        if isinstance(result, pl.LazyFrame):
+            result = result.collect()
+        pd.testing.assert_frame_equal(result.to_pandas(), expected)
+
+    cases = _delistings()
+    result = pull_CRSP_stock.apply_delisting_returns_polars(pl.from_pandas(cases))
+    np.testing.assert_array_equal(
+        result["ret"].to_numpy(), cases["expected_ret"].to_numpy()
+    )
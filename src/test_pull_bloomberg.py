@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+import pull_bloomberg
+
+
+def _recorded_history():
+    dates = pd.bdate_range("1990-01-01", "2024-12-31")
+    rng = np.random.default_rng(0)
+    columns = pd.MultiIndex.from_tuples(
+        [
+            ("SPX Index", "EQY_DVD_YLD_12m"),
+            ("SPX Index", "px_last"),
+            ("SP1 Index", "px_last"),
+            ("ES1 Index", "px_last"),
+        ]
+    )
+    return pd.DataFrame(
+        rng.uniform(1, 100, size=(len(dates), len(columns))), index=dates, columns=columns
+    )
+
+
+def test_pull_bbg_data_batches_and_caches(tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_bloomberg, "START_DATE", pd.Timestamp("1990-01-01"))
+    history = _recorded_history()
+    transport = pull_bloomberg.RecordedTransport(history)
+
+    df = pull_bloomberg.pull_bbg_data("2023-12-31", transport, cache_dir=tmp_path)
+    # SPX fields share one request; SP1 and ES1 cover different date ranges
+    assert len(transport.requests) == 3
+    expected = history.loc[:"2023-12-31", ("SPX Index", "px_last")]
+    np.testing.assert_array_equal(df["index"].to_numpy(), expected.to_numpy())
+    assert df.loc["1997-08-29", "futures"] == history.loc["1997-08-29", ("SP1 Index", "px_last")]
+    assert df.loc["1997-09-30", "futures"] == history.loc["1997-09-30", ("ES1 Index", "px_last")]
+
+    df_cached = pull_bloomberg.pull_bbg_data("2023-12-31", transport, cache_dir=tmp_path)
+    assert len(transport.requests) == 3
+    pd.testing.assert_frame_equal(df_cached, df)
+
+    df_longer = pull_bloomberg.pull_bbg_data("2024-12-31", transport, cache_dir=tmp_path)
+    new_requests = transport.requests[3:]
+    assert all(start == "2024-01-01" for _, _, start, _ in new_requests)
+    assert len(new_requests) == 2
+    assert df_longer.index.max() == pd.Timestamp("2024-12-31")
+
+
+def test_fetch_history_refetches_unpublished_dates(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        pull_bloomberg, "_last_published_date", lambda: pd.Timestamp("2024-06-14")
+    )
+    transport = pull_bloomberg.RecordedTransport(_recorded_history())
+    request = [("SPX Index", "px_last", "2024-01-01", "2024-12-31")]
+
+    pull_bloomberg.fetch_history(request, transport, cache_dir=tmp_path)
+    coverage = pull_bloomberg._load_coverage(tmp_path)
+    assert coverage["SPX Index|px_last"] == [["2024-01-01", "2024-06-14"]]
+
+    # Today's value is revised, and is fetched again the next day
+    transport.history.loc["2024-06-17", ("SPX Index", "px_last")] = -1.0
+    monkeypatch.setattr(
+        pull_bloomberg, "_last_published_date", lambda: pd.Timestamp("2024-06-17")
+    )
+    data = pull_bloomberg.fetch_history(request, transport, cache_dir=tmp_path)
+    assert transport.requests[-1][2:] == ("2024-06-15", "2024-12-31")
+    assert data[("SPX Index", "px_last")]["2024-06-17"] == -1.0
@@ -1,10 +1,20 @@
 import pandas as pd
+import numpy as np
 import pytest
 from settings import config
+import http_replay
 import pull_fred
 DATA_DIR = config("DATA_DIR")
 
 
+@pytest.fixture(autouse=True)
+def _http_fixtures():
+    """Run with HTTP_REPLAY=record once, then HTTP_REPLAY=replay to work offline."""
+    with http_replay.http_fixtures():
+        yield
+
+
+@pytest.mark.network
 def test_pull_fred_functionality():
     df = pull_fred.pull_fred()
     # Test if the function returns a pandas DataFrame
@@ -18,6 +28,7 @@ def test_pull_fred_functionality():
     with pytest.raises(FileNotFoundError):
         pull_fred.load_fred(data_dir="invalid_directory")
 
+@pytest.mark.network
 def test_pull_fred_data_validity():
     df = pull_fred.pull_fred()
     
@@ -28,3 +39,69 @@ def test_pull_fred_data_validity():
     # Test if the average annualized growth rate is close to 3.08%
     ave_annualized_growth = 4 * 100 * df.loc['1913-01-01': '2023-09-01', 'GDPC1'].dropna().pct_change().mean()
     assert abs(ave_annualized_growth - 3.08) < 0.1
+
+
+def _fake_fred_series(series, start_date=None, end_date=None):
+    idx = pd.bdate_range("2012-01-01", "2024-12-31", name="DATE")
+    rng = np.random.default_rng(sum(map(ord, series)))
+    df = pd.DataFrame({series: rng.normal(size=len(idx))}, index=idx)
+    df = df.mask(rng.random(df.shape) < 0.3)
+    return df.loc[pd.Timestamp(start_date) : pd.Timestamp(end_date)].copy()
+
+
+def test_update_fred_matches_full_pull(tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_fred, "pull_fred_series", _fake_fred_series)
+    df_full = pull_fred.pull_fred("2012-01-01", "2024-12-31").sort_index()
+
+    df_full.loc[:"2024-06-30"].to_parquet(tmp_path / "fred.parquet")
+    df_updated = pull_fred.update_fred(tmp_path, end_date="2024-12-31")
+
+    pd.testing.assert_frame_equal(df_updated, df_full)
+
+
+def test_update_fred_windows_each_series_separately(tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_fred, "pull_fred_series", _fake_fred_series)
+    df_full = pull_fred.pull_fred("2012-01-01", "2024-12-31").sort_index()
+
+    # GDP lags by months. A stored EFFR value from before EFFR's own
+    # refresh window, but inside GDP's, is left alone.
+    df_stored = df_full.loc[:"2024-06-30"].copy()
+    df_stored.loc["2024-01-01":, "GDP"] = np.nan
+    first_effr = df_stored.loc["2024-03-01":, "EFFR"].first_valid_index()
+    df_stored.loc[first_effr, "EFFR"] = 999.0
+    df_stored.to_parquet(tmp_path / "fred.parquet")
+    df_updated = pull_fred.update_fred(tmp_path, end_date="2024-12-31")
+
+    assert df_updated.loc[first_effr, "EFFR"] == 999.0
+    df_updated.loc[first_effr, "EFFR"] = df_full.loc[first_effr, "EFFR"]
+    pd.testing.assert_frame_equal(df_updated, df_full)
+
+
+def test_fred_shards_only_pull_the_delta(tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_fred, "pull_fred_series", _fake_fred_series)
+    series_list = list(pull_fred.series_to_pull.keys())
+
+    pulled = pull_fred.update_fred_shards(series_list[:-1], tmp_path, "2024-12-31")
+    assert pulled == series_list[:-1]
+    pulled = pull_fred.update_fred_shards(series_list, tmp_path, "2024-12-31")
+    assert pulled == series_list[-1:]
+
+    df = pull_fred.pull_fred_from_shards(tmp_path, "2012-01-01", "2024-12-31")
+    df_full = pull_fred.pull_fred("2012-01-01", "2024-12-31")
+    pd.testing.assert_frame_equal(df, df_full)
+
+
+def test_full_shard_refresh_pulls_the_whole_history(tmp_path, monkeypatch):
+    monkeypatch.setattr(pull_fred, "pull_fred_series", _fake_fred_series)
+    pull_fred.update_fred_shards(["GDPC1"], tmp_path, "2024-12-31")
+    path = pull_fred._shard_path("GDPC1", tmp_path)
+    df = pd.read_parquet(path)
+    first_obs = df["GDPC1"].first_valid_index()
+    # A revision of old history that a refresh from the last observation misses
+    df.loc[first_obs, "GDPC1"] = 999.0
+    df.to_parquet(path)
+
+    pull_fred.update_fred_shards(["GDPC1"], tmp_path, "2024-12-31", max_age_hours=0)
+    assert pd.read_parquet(path).loc[first_obs, "GDPC1"] == 999.0
+    pull_fred.update_fred_shards(["GDPC1"], tmp_path, "2024-12-31", full=True)
+    assert pd.read_parquet(path).loc[first_obs, "GDPC1"] != 999.0
@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+
+import pull_ofr_api_data
+
+
+def _fake_series(mnemonic=None, session=None):
+    dates = pd.to_datetime(["2024-01-02", "2024-01-03"])
+    return pd.DataFrame({mnemonic: [1.0, 2.0]}, index=pd.Index(dates, name="Date"))
+
+
+def test_pull_series_list_concurrent_matches_sequential(monkeypatch):
+    monkeypatch.setattr(pull_ofr_api_data, "pull_series_from_ofr_api", _fake_series)
+    series_list = list(pull_ofr_api_data.series_descriptions.keys())
+
+    df_seq = pull_ofr_api_data.pull_series_list(series_list, max_workers=1)
+    df_par = pull_ofr_api_data.pull_series_list(series_list, max_workers=4)
+
+    assert list(df_par.columns) == series_list
+    pd.testing.assert_frame_equal(df_seq, df_par)
+
+
+def test_update_series_list_matches_full_pull(tmp_path, monkeypatch):
+    dates = pd.bdate_range("2023-01-02", "2024-06-28", name="Date")
+    requested_starts = []
+
+    def _fake_history(mnemonic=None, session=None, start_date=None):
+        requested_starts.append(start_date)
+        df = pd.DataFrame({mnemonic: range(len(dates))}, index=dates, dtype=float)
+        df.loc[dates[-3:], mnemonic] += 0.5  # Revised preliminary values
+        if start_date is not None:
+            df = df.loc[start_date:]
+        return df
+
+    monkeypatch.setattr(pull_ofr_api_data, "pull_series_from_ofr_api", _fake_history)
+    series_list = ["FNYR-BGCR-A", "FNYR-TGCR-A"]
+    df_full = pull_ofr_api_data.pull_series_list(series_list)
+
+    stale = df_full.loc[:"2024-06-20"].copy()
+    stale.loc["2024-06-18":] -= 0.5
+    stale[["FNYR-BGCR-A"]].to_parquet(tmp_path / "ofr_public_repo_data.parquet")
+
+    requested_starts.clear()
+    df = pull_ofr_api_data.update_series_list(series_list, tmp_path, overlap_days=7)
+    pd.testing.assert_frame_equal(df, df_full, check_freq=False)
+    assert pd.Timestamp("2024-06-13") in requested_starts
+    assert None in requested_starts  # FNYR-TGCR-A was not stored yet
+
+
+class _FlakyOFR(BaseHTTPRequestHandler):
+    """Answers like the OFR API, after `n_failures` 503s."""
+
+    protocol_version = "HTTP/1.1"
+    n_failures = 2
+    n_requests = 0
+
+    def do_GET(self):
+        cls = type(self)
+        cls.n_requests += 1
+        if cls.n_requests <= cls.n_failures:
+            status, body = 503, b"unavailable"
+        else:
+            status, body = 200, json.dumps([["2024-01-02", 1.0]]).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_pull_series_list_retries_network_errors(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FlakyOFR)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/series/timeseries"
+    monkeypatch.setattr(pull_ofr_api_data, "OFR_API_URL", url)
+    try:
+        df = pull_ofr_api_data.pull_series_list(
+            ["FNYR-BGCR-A"], retries=3, backoff=0, min_interval=0.01
+        )
+        assert _FlakyOFR.n_requests == 3
+        assert df["FNYR-BGCR-A"].tolist() == [1.0]
+
+        _FlakyOFR.n_requests = 0
+        with pytest.raises(requests.exceptions.RetryError):
+            pull_ofr_api_data.pull_series_list(["FNYR-BGCR-A"], retries=1, backoff=0)
+        assert _FlakyOFR.n_requests == 2
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+import svensson_yield_curve as sv
+
+PARAMS = pd.DataFrame(
+    {
+        "BETA0": [4.5, 6.0, 3.0],
+        "BETA1": [-2.0, 1.5, -3.0],
+        "BETA2": [1.0, -1.0, 2.0],
+        "BETA3": [0.5, np.nan, -1.5],
+        "TAU1": [1.5, 2.0, 0.8],
+        "TAU2": [8.0, -999.99, 12.0],
+    },
+    index=pd.to_datetime(["2020-01-02", "1970-01-02", "2023-06-30"]),
+)
+
+
+def _zero_yield_one_date(row, n):
+    """Textbook formula for one date and one maturity."""
+    def loading(tau):
+        x = n / tau
+        return (1 - np.exp(-x)) / x, (1 - np.exp(-x)) / x - np.exp(-x)
+
+    slope1, curv1 = loading(row.TAU1)
+    y = row.BETA0 + row.BETA1 * slope1 + row.BETA2 * curv1
+    if np.isfinite(row.BETA3) and row.TAU2 > 0:
+        y += row.BETA3 * loading(row.TAU2)[1]
+    return y
+
+
+def test_zero_yields_match_per_date_formula():
+    maturities = np.arange(1, 361) / 12
+    zero = sv.zero_yields(PARAMS, maturities)
+    assert zero.shape == (3, 360)
+    for i, row in enumerate(PARAMS.itertuples()):
+        expected = [_zero_yield_one_date(row, n) for n in maturities]
+        np.testing.assert_allclose(zero[i], expected)
+
+
+def test_forwards_and_discount_factors_are_consistent():
+    maturities = np.linspace(0.25, 30, 120)
+    h = 1e-5
+    log_d_up = np.log(sv.discount_factors(PARAMS, maturities + h))
+    log_d_down = np.log(sv.discount_factors(PARAMS, maturities - h))
+    numerical_forward = -100 * (log_d_up - log_d_down) / (2 * h)
+    np.testing.assert_allclose(
+        sv.instantaneous_forwards(PARAMS, maturities), numerical_forward, atol=1e-6
+    )
+    # Short end limit: y(0) = f(0) = BETA0 + BETA1
+    short_end = (PARAMS["BETA0"] + PARAMS["BETA1"]).to_numpy()
+    np.testing.assert_allclose(sv.zero_yields(PARAMS, [0.0])[:, 0], short_end)
+    np.testing.assert_allclose(sv.instantaneous_forwards(PARAMS, [0.0])[:, 0], short_end)
+
+
+def test_par_yields_price_bonds_at_par():
+    maturities = np.array([0.5, 1, 2, 5, 10, 30])
+    par = sv.par_yields(PARAMS, maturities)
+    for j, n in enumerate(maturities):
+        coupon_times = np.arange(0.5, n + 1e-9, 0.5)
+        d = sv.discount_factors(PARAMS, coupon_times)
+        price = par[:, [j]] / 200 * d.sum(axis=1, keepdims=True) + d[:, [-1]]
+        np.testing.assert_allclose(price, 1.0)
+
+
+def test_calc_svensson_curves_frames():
+    curves = sv.calc_svensson_curves(PARAMS, [1, 2, 10])
+    assert set(curves) == {"zero", "forward", "par", "discount"}
+    for df in curves.values():
+        assert df.shape == (3, 3)
+        assert df.index.equals(PARAMS.index)
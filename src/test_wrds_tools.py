@@ -0,0 +1,408 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import sqlalchemy as sa
+
+import wrds_tools
+
+
+class _FakeConnection:
+    """Answers the chunked queries from a fixed frame, filtering on dates."""
+
+    queries = []
+    opened = 0
+    history = None
+
+    def __init__(self, wrds_username=None):
+        _FakeConnection.opened += 1
+        self.closed = False
+
+    def raw_sql(self, sql, date_cols=None):
+        _FakeConnection.queries.append(sql)
+        start_date, end_date = sql.split("BETWEEN ")[1].replace("'", "").split(" AND ")
+        df = _history() if _FakeConnection.history is None else _FakeConnection.history
+        return df[df["date"].between(start_date.strip(), end_date.strip())].reset_index(
+            drop=True
+        )
+
+    def close(self):
+        self.closed = True
+
+
+def _history():
+    dates = pd.date_range("2000-01-31", "2004-12-31", freq="ME")
+    return pd.DataFrame(
+        {"permno": 10001, "date": dates, "ret": range(len(dates))}
+    ).astype({"ret": float})
+
+
+SQL = "SELECT * FROM t WHERE date BETWEEN '{start_date}' AND '{end_date}'"
+
+
+def test_pull_partitioned_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    _FakeConnection.queries = []
+    dataset_dir = tmp_path / "dataset"
+
+    pulled = wrds_tools.pull_partitioned(
+        SQL,
+        dataset_dir,
+        "date",
+        "2000-01-01",
+        "2004-12-31",
+        max_workers=3,
+        db=wrds_tools.WRDSSession("user"),
+    )
+    assert len(pulled) == 5
+    assert (dataset_dir / "_SUCCESS").exists()
+
+    df = wrds_tools.read_dataset(dataset_dir).sort_values("date").reset_index(drop=True)
+    expected = _history()
+    expected["year"] = expected["date"].dt.year.astype("int32")
+    pd.testing.assert_frame_equal(df[expected.columns], expected, check_dtype=False)
+    assert df["year"].dtype == "int32"
+
+
+def test_pull_partitioned_resumes_interrupted_pull(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    _FakeConnection.queries = []
+    dataset_dir = tmp_path / "dataset"
+    df = _history()
+    for year in (2000, 2001):
+        wrds_tools.write_partition(df[df["date"].dt.year == year], dataset_dir, year)
+
+    pulled = wrds_tools.pull_partitioned(
+        SQL,
+        dataset_dir,
+        "date",
+        "2000-01-01",
+        "2004-12-31",
+        db=wrds_tools.WRDSSession("user"),
+    )
+    assert [lo.year for lo, hi in pulled] == [2002, 2003, 2004]
+    assert len(wrds_tools.read_dataset(dataset_dir)) == len(df)
+
+
+def test_extra_workers_need_a_username(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    args = (SQL, tmp_path / "dataset", "date", "2000-01-01", "2004-12-31")
+    with pytest.raises(ValueError, match="wrds_username"):
+        wrds_tools.pull_partitioned(*args, max_workers=2, db=wrds_tools.WRDSSession())
+    # Otherwise the extra workers log in as the user of `db`
+    db = wrds_tools.WRDSSession("user")
+    opened = []
+
+    class _Session(wrds_tools.WRDSSession):
+        def __init__(self, wrds_username=None):
+            opened.append(wrds_username)
+            super().__init__(wrds_username)
+
+    monkeypatch.setattr(wrds_tools, "WRDSSession", _Session)
+    wrds_tools.pull_partitioned(*args, max_workers=2, db=db)
+    assert set(opened) <= {"user"}
+
+
+class _FailingConnection(_FakeConnection):
+    """Fails on the queries for 2003, like a dropped connection would."""
+
+    def raw_sql(self, sql, date_cols=None):
+        if "2003-" in sql:
+            raise ConnectionError("connection dropped")
+        return super().raw_sql(sql, date_cols)
+
+
+def test_failed_repull_keeps_the_complete_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    dataset_dir = tmp_path / "dataset"
+    args = (SQL, dataset_dir, "date", "2000-01-01", "2004-12-31")
+    wrds_tools.pull_partitioned(*args, max_workers=1, db=wrds_tools.WRDSSession())
+    expected = wrds_tools.read_dataset(dataset_dir)
+
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FailingConnection)
+    with pytest.raises(ConnectionError):
+        wrds_tools.pull_partitioned(*args, max_workers=1, db=wrds_tools.WRDSSession())
+    pd.testing.assert_frame_equal(wrds_tools.read_dataset(dataset_dir), expected)
+    staging_dir = wrds_tools.staging_path(dataset_dir)
+    with pytest.raises(wrds_tools.IncompleteDatasetError):
+        wrds_tools.read_dataset(staging_dir)
+
+    # Running the pull again finishes it in the staging directory, then swaps
+    # it in
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    _FakeConnection.queries = []
+    wrds_tools.pull_partitioned(*args, max_workers=1, db=wrds_tools.WRDSSession())
+    assert [sql for sql in _FakeConnection.queries if "2000-" in sql] == []
+    assert not staging_dir.exists()
+    assert (dataset_dir / "_SUCCESS").exists()
+    assert len(wrds_tools.read_dataset(dataset_dir)) == len(expected)
+
+
+def test_session_connects_once_and_lazily(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    _FakeConnection.opened = 0
+
+    with wrds_tools.WRDSSession() as db:
+        assert _FakeConnection.opened == 0
+        wrds_tools.pull_partitioned(
+            SQL,
+            tmp_path / "a",
+            "date",
+            "2000-01-01",
+            "2001-12-31",
+            max_workers=1,
+            db=db,
+        )
+        wrds_tools.pull_partitioned(
+            SQL,
+            tmp_path / "b",
+            "date",
+            "2002-01-01",
+            "2003-12-31",
+            max_workers=1,
+            db=db,
+        )
+        assert _FakeConnection.opened == 1
+        assert db.connected
+    assert not db.connected
+
+
+def test_shared_sessions_are_per_username(monkeypatch):
+    monkeypatch.setattr(wrds_tools, "_sessions", {})
+    alice = wrds_tools.get_wrds_session("alice")
+    assert wrds_tools.get_wrds_session("alice") is alice
+    bob = wrds_tools.get_wrds_session("bob")
+    assert bob is not alice
+    assert bob.wrds_username == "bob"
+
+
+class _FakeStreamingSession(wrds_tools.WRDSSession):
+    """Serves `iter_batches` from `_history`, like a server-side cursor would."""
+
+    def iter_batches(self, sql, date_cols=None, batch_size=2):
+        start_date, end_date = sql.split("BETWEEN ")[1].replace("'", "").split(" AND ")
+        df = _history()
+        df = df[df["date"].between(start_date.strip(), end_date.strip())]
+        df["date"] = df["date"].dt.date  # Dates come back from the cursor as dates
+        rows = list(df.itertuples(index=False, name=None))
+        types = [pa.int64(), pa.date32(), pa.float64()]
+        for i in range(0, max(len(rows), 1), batch_size):
+            yield wrds_tools.rows_to_arrow(
+                rows[i : i + batch_size], list(df.columns), types, date_cols
+            )
+
+
+def test_streamed_pull_matches_raw_sql_pull(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+
+    def _add_month(df):
+        df["month"] = df["date"].dt.month
+        return df
+
+    kwargs = dict(
+        date_col="date",
+        start_date="1999-01-01",
+        end_date="2004-12-31",
+        wrds_username="user",
+    )
+    wrds_tools.pull_partitioned(
+        SQL, tmp_path / "a", transform=_add_month, db=wrds_tools.WRDSSession(), **kwargs
+    )
+    wrds_tools.pull_partitioned(
+        SQL,
+        tmp_path / "b",
+        transform=_add_month,
+        date_cols=["date"],
+        batch_size=5,
+        max_workers=1,
+        db=_FakeStreamingSession(),
+        **kwargs,
+    )
+    df_a = wrds_tools.read_dataset(tmp_path / "a").sort_values(
+        "date", ignore_index=True
+    )
+    df_b = wrds_tools.read_dataset(tmp_path / "b").sort_values(
+        "date", ignore_index=True
+    )
+    pd.testing.assert_frame_equal(df_a, df_b, check_dtype=False)
+
+    # One row group per batch: 12 months of 2000 in batches of 5
+    assert (
+        pq.ParquetFile(wrds_tools.partition_path(tmp_path / "b", 2000)).num_row_groups
+        == 3
+    )
+    assert (
+        pq.ParquetFile(
+            wrds_tools.partition_path(tmp_path / "b", 1999)
+        ).metadata.num_rows
+        == 0
+    )
+
+
+def test_iter_batches_uses_a_streaming_cursor():
+    engine = sa.create_engine("sqlite://", isolation_level="AUTOCOMMIT")
+    conn = engine.connect()
+    conn.exec_driver_sql("CREATE TABLE t (permno INTEGER, date TEXT, ret REAL)")
+    for i in range(7):
+        conn.exec_driver_sql(f"INSERT INTO t VALUES (1, '2000-01-0{i + 1}', {i})")
+
+    db = wrds_tools.WRDSSession()
+    db._db = SimpleNamespace(connection=conn)
+    db.stream_isolation_level = "SERIALIZABLE"  # SQLite has no REPEATABLE READ
+    batches = list(db.iter_batches("SELECT * FROM t", date_cols=["date"], batch_size=3))
+
+    assert [len(b) for b in batches] == [3, 3, 1]
+    table = pa.concat_tables(batches)
+    assert table.schema.field("date").type == pa.timestamp("ns")
+    assert table["ret"].to_pylist() == list(range(7))
+    assert conn.get_execution_options()["isolation_level"] == "AUTOCOMMIT"
+
+
+def test_update_partitioned_only_rewrites_recent_years(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    monkeypatch.setattr(_FakeConnection, "history", _history())
+    dataset_dir = tmp_path / "dataset"
+    kwargs = dict(date_col="date", start_date="2000-01-01", max_workers=1)
+    wrds_tools.pull_partitioned(
+        SQL, dataset_dir, end_date="2004-12-31", db=wrds_tools.WRDSSession(), **kwargs
+    )
+    manifest = wrds_tools.load_manifest(dataset_dir)
+    assert manifest["max_date"] == "2004-12-31"
+    assert manifest["partitions"]["2002"]["rows"] == 12
+    untouched = wrds_tools.partition_path(dataset_dir, 2002).stat().st_mtime_ns
+
+    # A new month arrives and the last stored month is revised
+    new = pd.DataFrame({"permno": [10001], "date": [pd.Timestamp("2005-01-31")]})
+    history = pd.concat([_history(), new.assign(ret=99.0)], ignore_index=True)
+    history.loc[history["date"] == "2004-12-31", "ret"] = -1.0
+    monkeypatch.setattr(_FakeConnection, "history", history)
+    _FakeConnection.queries = []
+
+    pulled = wrds_tools.update_partitioned(
+        SQL,
+        dataset_dir,
+        end_date="2005-06-30",
+        lookback_days=31,
+        db=wrds_tools.WRDSSession(),
+        **kwargs,
+    )
+    assert [lo.year for lo, hi in pulled] == [2004, 2005]
+    assert wrds_tools.partition_path(dataset_dir, 2002).stat().st_mtime_ns == untouched
+
+    df = wrds_tools.read_dataset(dataset_dir).sort_values("date", ignore_index=True)
+    pd.testing.assert_frame_equal(df[history.columns], history, check_dtype=False)
+    manifest = wrds_tools.load_manifest(dataset_dir)
+    assert manifest["max_date"] == "2005-01-31"
+    assert manifest["end_date"] == "2005-06-30"
+    assert manifest["partitions"]["2005"]["rows"] == 1
+
+
+def test_failed_update_keeps_the_complete_dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    dataset_dir = tmp_path / "dataset"
+    kwargs = dict(date_col="date", start_date="2000-01-01", max_workers=1)
+    wrds_tools.pull_partitioned(
+        SQL, dataset_dir, end_date="2002-12-31", db=wrds_tools.WRDSSession(), **kwargs
+    )
+    expected = wrds_tools.read_dataset(dataset_dir)
+    manifest = wrds_tools.load_manifest(dataset_dir)
+
+    # The refresh of 2002 revises a row, then the one of 2003 fails
+    history = _history()
+    history.loc[history["date"] == "2002-12-31", "ret"] = -1.0
+    monkeypatch.setattr(_FakeConnection, "history", history)
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FailingConnection)
+    with pytest.raises(ConnectionError):
+        wrds_tools.update_partitioned(
+            SQL,
+            dataset_dir,
+            end_date="2004-12-31",
+            lookback_days=31,
+            db=wrds_tools.WRDSSession(),
+            **kwargs,
+        )
+    pd.testing.assert_frame_equal(wrds_tools.read_dataset(dataset_dir), expected)
+    assert wrds_tools.load_manifest(dataset_dir) == manifest
+
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    wrds_tools.update_partitioned(
+        SQL,
+        dataset_dir,
+        end_date="2004-12-31",
+        lookback_days=31,
+        db=wrds_tools.WRDSSession(),
+        **kwargs,
+    )
+    assert not wrds_tools.staging_path(dataset_dir).exists()
+    df = wrds_tools.read_dataset(dataset_dir).sort_values("date", ignore_index=True)
+    pd.testing.assert_frame_equal(df[history.columns], history, check_dtype=False)
+    assert wrds_tools.load_manifest(dataset_dir)["max_date"] == "2004-12-31"
+
+
+def test_declared_dtypes_survive_the_dataset_round_trip(tmp_path):
+    dtypes = {"permno": "int32", "exch": "category", "siccd": "Int16"}
+    batches = [
+        wrds_tools.rows_to_arrow(
+            [(1, "2000-01-31", "N", 3711.0), (2, "2000-02-29", "Q", None)],
+            ["permno", "date", "exch", "siccd"],
+            date_cols=["date"],
+        ),
+        # A batch where the codes are all missing
+        wrds_tools.rows_to_arrow(
+            [(3, "2001-01-31", None, None)],
+            ["permno", "date", "exch", "siccd"],
+            date_cols=["date"],
+        ),
+    ]
+    transform = lambda df: wrds_tools.apply_dtypes(df, dtypes)
+    wrds_tools._stream_chunk(batches, tmp_path, "date", [2000, 2001], transform)
+    (tmp_path / "_SUCCESS").touch()
+
+    df = wrds_tools.read_dataset(tmp_path).sort_values("permno", ignore_index=True)
+    assert df["permno"].dtype == "int32"
+    assert df["exch"].dtype == "category"
+    assert df["siccd"].dtype == "Int16"
+    assert df["exch"].tolist()[:2] == ["N", "Q"] and pd.isna(df["exch"][2])
+    assert df["siccd"].isna().tolist() == [False, True, True]
+
+
+def test_read_dataset_pushes_down_columns_and_filters(tmp_path, monkeypatch):
+    monkeypatch.setattr(wrds_tools.wrds, "Connection", _FakeConnection)
+    history = pd.concat(
+        [_history(), _history().assign(permno=10002, ret=lambda df: -df["ret"])],
+        ignore_index=True,
+    )
+    monkeypatch.setattr(_FakeConnection, "history", history)
+    wrds_tools.pull_partitioned(
+        SQL,
+        tmp_path,
+        "date",
+        "2000-01-01",
+        "2004-12-31",
+        max_workers=1,
+        db=wrds_tools.WRDSSession(),
+    )
+
+    df = wrds_tools.read_dataset(
+        tmp_path,
+        columns=["date", "ret"],
+        date_col="date",
+        start_date="2001-03-01",
+        end_date="2002-02-28",
+        ids={"permno": [10002]},
+    ).sort_values("date", ignore_index=True)
+    expected = history[
+        history["date"].between("2001-03-01", "2002-02-28")
+        & (history["permno"] == 10002)
+    ]
+    assert list(df.columns) == ["date", "ret"]
+    assert df["ret"].tolist() == expected["ret"].tolist()
+
+    df_pl = wrds_tools.read_dataset(
+        tmp_path, date_col="date", end_date="2000-06-30", backend="polars"
+    )
+    assert isinstance(df_pl, pl.DataFrame)
+    assert df_pl.height == 12
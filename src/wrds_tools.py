@@ -0,0 +1,825 @@
+"""
+Helpers shared by the WRDS pulls (`pull_CRSP_Compustat.py`, `pull_CRSP_stock.py`).
+
+Partitioned extraction
+----------------------
+Pulling decades of CRSP or Compustat with a single `raw_sql` call means one
+long-running query, one giant in-memory frame, and starting over from zero if
+anything fails. `pull_partitioned` instead splits the date range into chunks of
+`years_per_chunk` years and runs the chunks over a small pool of concurrent
+WRDS connections. Each year is written as its own partition of a
+hive-partitioned parquet dataset, e.g.,
+```
+_data/CRSP_stock_ciz/year=1959/part-0.parquet
+_data/CRSP_stock_ciz/year=1960/part-0.parquet
+...
+```
+Tables too large to pull a year at a time, like the daily stock file, can
+further be split into `n_buckets` queries per chunk (e.g., by `permno`
+modulo `n_buckets`), each written as its own file of the year's partition.
+Partitions are written atomically. If a pull is interrupted, running it again
+skips the chunks that were already written. Once every chunk is written, a
+_manifest.json file recording what each partition holds and a _SUCCESS file
+are added. Pulling a complete dataset again starts over in a staging
+directory next to it, which replaces the dataset only once it is complete
+in turn, so a failed re-pull leaves the last good dataset in place.
+
+`update_partitioned` refreshes a complete dataset instead: it pulls only the
+years from the latest stored date (less a lookback window for revisions)
+onward and rewrites just those partitions, again in a staging directory that
+replaces the dataset once the refresh is complete.
+
+`read_dataset` reads such a dataset back as a single frame, and refuses a
+dataset directory without a _SUCCESS file.
+
+Streaming
+---------
+Even a single year of a chunked pull goes through `raw_sql`, which fetches
+the whole result into client memory and then builds a pandas frame from it.
+With `batch_size` set, `pull_partitioned` instead reads each chunk through
+`WRDSSession.iter_batches`, which uses a server-side cursor to fetch
+`batch_size` rows at a time. Each batch is converted to Arrow (parsing
+`date_cols` the same way `raw_sql` does) and appended to its partition as a
+parquet row group, so peak memory is bounded by the batch size rather than
+by the length of the history.
+
+Sessions
+--------
+Opening a `wrds.Connection` means a login, a pgpass lookup, and a TLS
+handshake. Rather than each pull function paying for that, the pull functions
+take a `db` argument, a `WRDSSession` that connects on first use and is
+shared across a whole pull run. When `db` is not given, they use the
+process-wide session of their `wrds_username` from `get_wrds_session`, which
+stays open until the process exits. So running several pulls in one process, e.g., as Python
+actions of a single `doit` run, logs in once:
+```
+with WRDSSession(wrds_username=WRDS_USERNAME) as db:
+    comp = pull_compustat(db=db)
+    ccm = pull_CRSP_Comp_Link_Table(db=db)
+```
+"""
+
+import atexit
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import sqlalchemy as sa
+import wrds
+
+PARTITIONING = ds.partitioning(pa.schema([("year", pa.int32())]), flavor="hive")
+
+STREAM_BATCH_SIZE = 100_000
+
+# Arrow types for the PostgreSQL type OIDs reported by psycopg2. NUMERIC is
+# read as float64, as `raw_sql` does with `coerce_float=True`.
+POSTGRES_ARROW_TYPES = {
+    16: pa.bool_(),  # bool
+    18: pa.string(),  # char
+    19: pa.string(),  # name
+    20: pa.int64(),  # int8
+    21: pa.int64(),  # int2
+    23: pa.int64(),  # int4
+    25: pa.string(),  # text
+    700: pa.float64(),  # float4
+    701: pa.float64(),  # float8
+    1042: pa.string(),  # bpchar
+    1043: pa.string(),  # varchar
+    1082: pa.date32(),  # date
+    1114: pa.timestamp("us"),  # timestamp
+    1184: pa.timestamp("us", tz="UTC"),  # timestamptz
+    1700: pa.float64(),  # numeric
+}
+
+
+class IncompleteDatasetError(FileNotFoundError):
+    """A partitioned dataset whose pull did not finish."""
+
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+def rows_to_arrow(rows, columns, types=None, date_cols=None):
+    """
+    Convert a list of row tuples to an Arrow table.
+
+    `types` gives the Arrow type of each column (None to infer it). Columns in
+    `date_cols` become nanosecond timestamps, like the output of `raw_sql`.
+    Columns whose type is unknown and that hold only nulls are typed as
+    strings, so that later batches with values can be cast to match.
+    """
+    if types is None:
+        types = [None] * len(columns)
+    date_cols = set(date_cols or [])
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    arrays = []
+    for name, column, type_ in zip(columns, values, types):
+        if name in date_cols:
+            type_ = pa.timestamp("ns")
+        array = pa.array(column)
+        if type_ is None and pa.types.is_null(array.type):
+            type_ = pa.string()
+        if type_ is not None and array.type != type_:
+            array = array.cast(type_)
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+class WRDSSession:
+    """
+    A WRDS connection that is opened on first use and can be reused by any
+    number of queries. Also a context manager that closes the connection on
+    exit. Not safe to share between threads; use one session per thread.
+    """
+
+    def __init__(self, wrds_username=None):
+        self.wrds_username = wrds_username
+        self._db = None
+
+    @property
+    def connection(self):
+        if self._db is None:
+            self._db = wrds.Connection(wrds_username=self.wrds_username)
+        return self._db
+
+    @property
+    def connected(self):
+        return self._db is not None
+
+    def raw_sql(self, sql, date_cols=None, **kwargs):
+        return self.connection.raw_sql(sql, date_cols=date_cols, **kwargs)
+
+    def get_table(self, library, table, **kwargs):
+        return self.connection.get_table(library=library, table=table, **kwargs)
+
+    # WRDS connections run in autocommit mode, but psycopg2 only allows
+    # server-side cursors inside a transaction.
+    stream_isolation_level = "REPEATABLE READ"
+
+    def iter_batches(self, sql, date_cols=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        Run `sql` through a server-side cursor and yield the result as Arrow
+        tables of at most `batch_size` rows. At least one (possibly empty)
+        table is yielded, so the schema is always known.
+        """
+        if hasattr(self.connection, "iter_batches"):
+            # Connections that stream on their own, e.g., fake_wrds.Connection
+            yield from self.connection.iter_batches(
+                sql, date_cols=date_cols, batch_size=batch_size
+            )
+            return
+        conn = self.connection.connection
+        if conn.in_transaction():
+            conn.rollback()
+        conn.execution_options(isolation_level=self.stream_isolation_level)
+        try:
+            with conn.begin():
+                result = conn.execute(
+                    sa.text(sql),
+                    execution_options={
+                        "stream_results": True,
+                        "max_row_buffer": batch_size,
+                    },
+                )
+                columns = list(result.keys())
+                types = [
+                    POSTGRES_ARROW_TYPES.get(d[1]) for d in result.cursor.description
+                ]
+                empty = True
+                for rows in result.partitions(batch_size):
+                    empty = False
+                    yield rows_to_arrow(rows, columns, types, date_cols)
+                if empty:
+                    yield rows_to_arrow([], columns, types, date_cols)
+        finally:
+            conn.execution_options(isolation_level="AUTOCOMMIT")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_wrds_session(wrds_username=None):
+    """
+    The process-wide `WRDSSession` of `wrds_username`, created on first use
+    and closed when the process exits. Each username gets its own session.
+    """
+    with _session_lock:
+        session = _sessions.get(wrds_username)
+        if session is None:
+            session = _sessions[wrds_username] = WRDSSession(wrds_username)
+            atexit.register(session.close)
+        return session
+
+
+def year_chunks(start_date, end_date, years_per_chunk=1):
+    """
+    Split [start_date, end_date] into chunks that start on January 1 and span
+    `years_per_chunk` calendar years (the first and last are clipped).
+
+    >>> year_chunks("1959-06-30", "1962-03-31", years_per_chunk=2)
+    [(Timestamp('1959-06-30 00:00:00'), Timestamp('1960-12-31 00:00:00')), (Timestamp('1961-01-01 00:00:00'), Timestamp('1962-03-31 00:00:00'))]
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    chunks = []
+    for year in range(start_date.year, end_date.year + 1, years_per_chunk):
+        chunk_start = max(pd.Timestamp(year=year, month=1, day=1), start_date)
+        chunk_end = pd.Timestamp(year=year + years_per_chunk - 1, month=12, day=31)
+        chunks.append((chunk_start, min(chunk_end, end_date)))
+    return chunks
+
+
+def partition_path(dataset_dir, year, bucket=0):
+    return Path(dataset_dir) / f"year={year}" / f"part-{bucket}.parquet"
+
+
+def partition_files(dataset_dir, year):
+    """The files of one year's partition, one per bucket."""
+    return sorted(
+        (Path(dataset_dir) / f"year={year}").glob("part-*.parquet"),
+        key=lambda path: int(path.stem.split("-")[1]),
+    )
+
+
+def write_partition(df, dataset_dir, year, bucket=0):
+    """
+    Write the rows of one year (and `bucket`) to its partition, replacing
+    what was there. The partition column itself is not stored in the file.
+    The file is written under a temporary name and then renamed, so a
+    partition is either complete or absent.
+    """
+    path = partition_path(dataset_dir, year, bucket)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Files starting with "." are ignored when the dataset is read
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    pq.write_table(to_arrow(df.drop(columns=["year"], errors="ignore")), tmp_path)
+    tmp_path.replace(path)
+
+
+def apply_dtypes(df, dtypes, float32_columns=()):
+    """
+    Cast the columns of `df` to the declared `dtypes` (a dict of column name
+    to pandas dtype, e.g., "category", "int32", or the nullable "Int16").
+    Columns in `float32_columns` are stored as float32 instead. Columns that
+    are not in `df` are ignored.
+    """
+    dtypes = {**dtypes, **{col: "float32" for col in float32_columns}}
+    return df.astype({col: t for col, t in dtypes.items() if col in df.columns})
+
+
+def to_arrow(df):
+    """
+    Convert a frame to an Arrow table to be stored in a dataset.
+
+    Categorical columns become dictionary columns with int32 indices and
+    string values regardless of how many categories (or whether any) the
+    frame has, so that all partitions of a dataset share one schema.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            value_type = field.type.value_type
+            if pa.types.is_null(value_type):
+                value_type = pa.string()
+            type_ = pa.dictionary(pa.int32(), value_type)
+            table = table.set_column(i, field.name, table.column(i).cast(type_))
+    return table
+
+
+def _parquet_column_sizes(df):
+    """Compressed size on disk of each column of `df` written to parquet."""
+    buffer = pa.BufferOutputStream()
+    pq.write_table(to_arrow(df), buffer)
+    metadata = pq.ParquetFile(pa.BufferReader(buffer.getvalue())).metadata
+    sizes = pd.Series(0, index=df.columns, dtype=float)
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            sizes[column.path_in_schema] += column.total_compressed_size
+    return sizes
+
+
+def dtype_report(raw, compact):
+    """
+    Compare the memory and parquet footprint of a frame as it comes from
+    `raw_sql` (`raw`) with the same frame after `apply_dtypes` (`compact`).
+    Returns a frame with one row per column plus a "total" row, in MB.
+    """
+    report = pd.DataFrame(
+        {
+            "raw_dtype": raw.dtypes.astype(str),
+            "dtype": compact.dtypes.astype(str),
+            "raw_memory": raw.memory_usage(index=False, deep=True) / 1e6,
+            "memory": compact.memory_usage(index=False, deep=True) / 1e6,
+            "raw_parquet": _parquet_column_sizes(raw) / 1e6,
+            "parquet": _parquet_column_sizes(compact) / 1e6,
+        }
+    )
+    sizes = ["raw_memory", "memory", "raw_parquet", "parquet"]
+    report.loc["total", sizes] = report[sizes].sum()
+    report.loc["total", ["raw_dtype", "dtype"]] = ""
+    return report
+
+
+def _transform_table(table, transform):
+    """
+    Apply a pandas `transform` to an Arrow table. Columns that were already in
+    `table` keep their Arrow type when a batch holds only nulls.
+    """
+    df = transform(table.to_pandas())
+    out = to_arrow(df)
+    for i, name in enumerate(out.column_names):
+        if name in table.column_names and pa.types.is_null(out.schema.field(i).type):
+            out = out.set_column(
+                i, name, out.column(i).cast(table.schema.field(name).type)
+            )
+    return out
+
+
+def _stream_chunk(batches, dataset_dir, date_col, years, transform=None, bucket=0):
+    """
+    Append each batch of `batches` to the partitions of `years` (and
+    `bucket`) it falls in, one row group per batch and partition. As in
+    `write_partition`, each file is written under a temporary name and renamed
+    once complete.
+    """
+    writers = {}
+    schema = None
+    try:
+        for table in batches:
+            if transform is not None:
+                table = _transform_table(table, transform)
+            if "year" in table.column_names:
+                table = table.drop_columns(["year"])
+            if schema is None:
+                # Keep the pandas metadata, which records extension dtypes
+                # such as Int16
+                schema = table.schema
+            table = table.cast(schema)
+            table_years = pc.year(table[date_col])
+            for year in years:
+                part = table.filter(pc.equal(table_years, year))
+                if part.num_rows == 0:
+                    continue
+                if year not in writers:
+                    path = partition_path(dataset_dir, year, bucket)
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    writers[year] = pq.ParquetWriter(
+                        path.with_name(f".{path.name}.tmp"), schema
+                    )
+                writers[year].write_table(part)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    for year in years:
+        path = partition_path(dataset_dir, year, bucket)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        if year not in writers:
+            # Every year gets a partition, even an empty one, to mark it as done
+            path.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(schema.empty_table(), tmp_path)
+        tmp_path.replace(path)
+
+
+def _pull_chunks(
+    sql_template,
+    dataset_dir,
+    chunks,
+    date_col,
+    wrds_username=None,
+    date_cols=None,
+    transform=None,
+    max_workers=4,
+    db=None,
+    batch_size=None,
+    n_buckets=1,
+    resume=False,
+):
+    """
+    Pull each (start, end) chunk of `chunks`, in `n_buckets` queries per
+    chunk, and (re)write the partitions of the years it covers. With
+    `resume=True`, the buckets of a chunk whose partitions all exist already
+    are skipped. Returns the chunks for which anything was pulled. See
+    `pull_partitioned` for the other arguments.
+    """
+    if db is None:
+        db = get_wrds_session(wrds_username)
+    # The extra workers log in as the same user as `db`; without a username,
+    # `wrds` would prompt for one inside a worker thread
+    if wrds_username is None:
+        wrds_username = getattr(db, "wrds_username", None)
+    if max_workers > 1 and wrds_username is None:
+        raise ValueError(
+            "max_workers > 1 opens more WRDS sessions, so it needs a "
+            "wrds_username, or a db with one"
+        )
+    local = threading.local()
+    sessions = []
+    sessions_lock = threading.Lock()
+
+    def _pull_chunk(task):
+        if not hasattr(local, "db"):
+            with sessions_lock:
+                local.db = db if not sessions else WRDSSession(wrds_username)
+                sessions.append(local.db)
+        (lo, hi), bucket = task
+        sql = sql_template.format(
+            start_date=lo.strftime("%Y-%m-%d"),
+            end_date=hi.strftime("%Y-%m-%d"),
+            bucket=bucket,
+            n_buckets=n_buckets,
+        )
+        if batch_size is not None:
+            batches = local.db.iter_batches(
+                sql, date_cols=date_cols, batch_size=batch_size
+            )
+            _stream_chunk(
+                batches,
+                dataset_dir,
+                date_col,
+                range(lo.year, hi.year + 1),
+                transform,
+                bucket,
+            )
+            return task
+        df = local.db.raw_sql(sql, date_cols=date_cols)
+        if transform is not None:
+            df = transform(df)
+        years = df[date_col].dt.year
+        # Every year gets a partition, even an empty one, to mark it as done
+        for year in range(lo.year, hi.year + 1):
+            write_partition(df.loc[years == year], dataset_dir, year, bucket)
+        return task
+
+    tasks = [
+        ((lo, hi), bucket)
+        for lo, hi in chunks
+        for bucket in range(n_buckets)
+        if not resume
+        or not all(
+            partition_path(dataset_dir, y, bucket).exists()
+            for y in range(lo.year, hi.year + 1)
+        )
+    ]
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pulled = list(executor.map(_pull_chunk, tasks))
+    finally:
+        for session in sessions[1:]:
+            session.close()
+
+    # Drop the files of buckets a previous pull with more buckets left behind
+    for lo, hi in chunks:
+        for year in range(lo.year, hi.year + 1):
+            for path in partition_files(dataset_dir, year)[n_buckets:]:
+                path.unlink()
+    return list(dict.fromkeys(chunk for chunk, bucket in pulled))
+
+
+def pull_partitioned(
+    sql_template,
+    dataset_dir,
+    date_col,
+    start_date,
+    end_date,
+    wrds_username=None,
+    date_cols=None,
+    transform=None,
+    years_per_chunk=1,
+    max_workers=4,
+    db=None,
+    batch_size=None,
+    n_buckets=1,
+):
+    """
+    Run `sql_template` once per chunk of years and write a year-partitioned
+    parquet dataset to `dataset_dir`.
+
+    `sql_template` must contain `{start_date}` and `{end_date}` placeholders
+    (filled in as 'YYYY-MM-DD') bounding `date_col`. Chunks run on a pool of
+    `max_workers` threads, each with its own `WRDSSession`. The first worker
+    reuses `db` (by default, the shared session) rather than logging in again,
+    so with `max_workers=1` no new connection is opened. The other workers log
+    in as `wrds_username`, by default the user of `db`; with `max_workers > 1`,
+    one of the two must be known. `transform` is
+    an optional function applied to each chunk's frame before it is split by
+    the year of `date_col` and written. Chunks whose partitions already exist
+    from an interrupted pull are skipped. With `batch_size` set, each chunk is
+    streamed in batches of that many rows through a server-side cursor
+    instead of being read with `raw_sql`, and `transform` is applied to each
+    batch. Returns the list of chunks pulled.
+
+    For tables too large to pull a year at a time, such as the daily stock
+    file, `n_buckets` splits each chunk further into that many queries, with
+    `{bucket}` and `{n_buckets}` in `sql_template` filled in with the bucket
+    number and count, e.g., `AND permno % {n_buckets} = {bucket}`. Each bucket
+    is written as its own file of the year's partition,
+    `year=YYYY/part-{bucket}.parquet`.
+    """
+    dataset_dir = Path(dataset_dir)
+    # A complete dataset stays as it is until its replacement is complete
+    target_dir = dataset_dir
+    if (dataset_dir / "_SUCCESS").exists():
+        target_dir = staging_path(dataset_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    pulled = _pull_chunks(
+        sql_template,
+        target_dir,
+        year_chunks(start_date, end_date, years_per_chunk),
+        date_col,
+        wrds_username=wrds_username,
+        date_cols=date_cols,
+        transform=transform,
+        max_workers=max_workers,
+        db=db,
+        batch_size=batch_size,
+        n_buckets=n_buckets,
+        resume=True,
+    )
+
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    write_manifest(
+        target_dir,
+        date_col,
+        start_date,
+        end_date,
+        years=range(start_date.year, end_date.year + 1),
+    )
+    (target_dir / "_SUCCESS").touch()
+    if target_dir != dataset_dir:
+        _swap_in(target_dir, dataset_dir)
+    return pulled
+
+
+def staging_path(dataset_dir):
+    """Where `pull_partitioned` pulls a dataset that is already complete."""
+    dataset_dir = Path(dataset_dir)
+    return dataset_dir.with_name(dataset_dir.name + ".staging")
+
+
+def _swap_in(staging_dir, dataset_dir):
+    """
+    Replace `dataset_dir` with the complete dataset in `staging_dir`. The old
+    dataset is moved aside first and only deleted once the new one is in
+    place.
+    """
+    old_dir = dataset_dir.with_name(dataset_dir.name + ".old")
+    if old_dir.exists():
+        shutil.rmtree(old_dir)
+    dataset_dir.rename(old_dir)
+    staging_dir.rename(dataset_dir)
+    shutil.rmtree(old_dir)
+
+
+def update_partitioned(
+    sql_template,
+    dataset_dir,
+    date_col,
+    start_date,
+    end_date,
+    lookback_days=92,
+    years_per_chunk=1,
+    **kwargs,
+):
+    """
+    Bring a dataset written by `pull_partitioned` up to `end_date`, pulling
+    only what can have changed since the last pull.
+
+    The latest `date_col` already stored is read from the dataset's
+    `_manifest.json`. Every year from the one that contains that date, less
+    `lookback_days` to pick up revisions of recent rows, through `end_date` is
+    pulled again and its partition rewritten whole, so rows that were revised
+    or deleted in those years are also reflected. Older partitions are left
+    untouched. As in `pull_partitioned`, the refreshed dataset is built in a
+    staging directory and only replaces the dataset once it is complete. If the dataset is missing or incomplete, falls back to
+    `pull_partitioned` from `start_date`. Other keyword arguments are passed
+    on as in `pull_partitioned`. Returns the list of chunks pulled.
+    """
+    dataset_dir = Path(dataset_dir)
+    manifest = load_manifest(dataset_dir)
+    if (
+        not (dataset_dir / "_SUCCESS").exists()
+        or manifest is None
+        or manifest["max_date"] is None
+    ):
+        return pull_partitioned(
+            sql_template,
+            dataset_dir,
+            date_col,
+            start_date,
+            end_date,
+            years_per_chunk=years_per_chunk,
+            **kwargs,
+        )
+
+    first_date = pd.Timestamp(manifest["start_date"])
+    end_date = pd.Timestamp(end_date)
+    window_start = pd.Timestamp(manifest["max_date"]) - pd.Timedelta(days=lookback_days)
+    window_start = max(pd.Timestamp(year=window_start.year, month=1, day=1), first_date)
+    chunks = year_chunks(window_start, end_date, years_per_chunk)
+
+    # The refresh is staged next to the dataset, with hard links to the
+    # partitions it keeps, and swapped in whole once it is complete
+    staging_dir = staging_path(dataset_dir)
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+    staging_dir.mkdir()
+    for year_dir in dataset_dir.glob("year=*"):
+        if int(year_dir.name.split("=")[1]) < window_start.year:
+            shutil.copytree(year_dir, staging_dir / year_dir.name, copy_function=_link)
+    shutil.copy2(dataset_dir / "_manifest.json", staging_dir / "_manifest.json")
+
+    pulled = _pull_chunks(sql_template, staging_dir, chunks, date_col, **kwargs)
+    write_manifest(
+        staging_dir,
+        date_col,
+        first_date,
+        end_date,
+        years=range(window_start.year, end_date.year + 1),
+    )
+    (staging_dir / "_SUCCESS").touch()
+    _swap_in(staging_dir, dataset_dir)
+    return pulled
+
+
+def _link(src, dst):
+    """Hard-link `src` to `dst`, or copy it where links are not supported."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def load_manifest(dataset_dir):
+    """The `_manifest.json` of a dataset, or None if there is none."""
+    path = Path(dataset_dir) / "_manifest.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def write_manifest(dataset_dir, date_col, start_date, end_date, years):
+    """
+    Record in `_manifest.json` the date range a dataset was pulled for and,
+    for each partition in `years`, its row count, the range of `date_col` it
+    holds, and when it was written. Entries for other years are kept as they
+    were.
+    """
+    dataset_dir = Path(dataset_dir)
+    manifest = load_manifest(dataset_dir) or {"partitions": {}}
+    for year in years:
+        paths = partition_files(dataset_dir, year)
+        dates = pq.read_table([str(path) for path in paths], columns=[date_col])[
+            date_col
+        ]
+        min_max = pc.min_max(dates)
+        manifest["partitions"][str(year)] = {
+            "rows": len(dates),
+            "min_date": _isoformat(min_max["min"].as_py()),
+            "max_date": _isoformat(min_max["max"].as_py()),
+            "written": pd.Timestamp(
+                max(path.stat().st_mtime for path in paths), unit="s"
+            ).isoformat(),
+        }
+    max_dates = [
+        p["max_date"] for p in manifest["partitions"].values() if p["max_date"]
+    ]
+    manifest.update(
+        {
+            "date_col": date_col,
+            "start_date": _isoformat(start_date),
+            "end_date": _isoformat(end_date),
+            "max_date": max(max_dates, default=None),
+        }
+    )
+    manifest["partitions"] = dict(
+        sorted(manifest["partitions"].items(), key=lambda item: int(item[0]))
+    )
+    tmp_path = dataset_dir / "._manifest.json.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    tmp_path.replace(dataset_dir / "_manifest.json")
+    return manifest
+
+
+def _isoformat(date):
+    if date is None:
+        return None
+    return pd.Timestamp(date).strftime("%Y-%m-%d")
+
+
+def open_dataset(path):
+    """
+    Open a year-partitioned parquet dataset written by `pull_partitioned`, or
+    a single parquet file.
+
+    The schema of a partitioned dataset is unified across all partitions
+    rather than taken from the first one, since a column that is entirely
+    null in one year (stored with Arrow's null type) can hold strings in
+    another.
+    """
+    if not Path(path).is_dir():
+        return ds.dataset(path, format="parquet")
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    if schemas:
+        schema = pa.unify_schemas(schemas + [PARTITIONING.schema])
+        dataset = ds.dataset(
+            path, format="parquet", partitioning=PARTITIONING, schema=schema
+        )
+    return dataset
+
+
+def dataset_filter(
+    dataset, date_col=None, start_date=None, end_date=None, ids=None, filter=None
+):
+    """
+    Build a filter expression for `dataset` that keeps the rows with
+    `date_col` in [start_date, end_date] (either bound can be None) and,
+    for each column in the dict `ids`, a value among the given ones. `filter`
+    is an additional expression to AND in. Returns None if there is nothing
+    to filter on.
+
+    Date bounds are also applied to the `year` partition column, if there is
+    one, so that whole partitions are skipped without being opened.
+    """
+    schema = dataset.schema
+    conditions = []
+    for bound, op in [(start_date, "ge"), (end_date, "le")]:
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        value = pa.scalar(bound, type=schema.field(date_col).type)
+        field = ds.field(date_col)
+        conditions.append(field >= value if op == "ge" else field <= value)
+        if "year" in schema.names and date_col != "year":
+            year = ds.field("year")
+            conditions.append(year >= bound.year if op == "ge" else year <= bound.year)
+    for col, values in (ids or {}).items():
+        if values is not None:
+            conditions.append(ds.field(col).isin(list(values)))
+    if filter is not None:
+        conditions.append(filter)
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def read_dataset(
+    path,
+    columns=None,
+    date_col=None,
+    start_date=None,
+    end_date=None,
+    ids=None,
+    filter=None,
+    backend="pandas",
+):
+    """
+    Read a year-partitioned parquet dataset written by `pull_partitioned`, or
+    a single parquet file, into a single frame. The `year` partition column
+    is restored as an integer column. A dataset directory without a
+    _SUCCESS file, from a pull that did not finish, raises
+    `IncompleteDatasetError`.
+
+    `columns` and the filters (see `dataset_filter`) are pushed down to the
+    pyarrow dataset scan, so only the requested columns are read, and
+    partitions and row groups whose statistics rule out every row are
+    skipped. Returns a pandas frame, or a polars frame with
+    `backend="polars"`.
+    """
+    if backend not in ["pandas", "polars"]:
+        raise ValueError(f"backend must be 'pandas' or 'polars', not {backend!r}")
+    if Path(path).is_dir() and not (Path(path) / "_SUCCESS").exists():
+        raise IncompleteDatasetError(
+            f"{path} has no _SUCCESS file, so its pull did not finish. "
+            "Run the pull again to complete it."
+        )
+    dataset = open_dataset(path)
+    expression = dataset_filter(dataset, date_col, start_date, end_date, ids, filter)
+    table = dataset.to_table(columns=columns, filter=expression)
+    if backend == "polars":
+        return pl.from_arrow(table)
+    df = table.to_pandas()
+    return df